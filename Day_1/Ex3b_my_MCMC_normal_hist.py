@@ -15,13 +15,20 @@ http://twiecki.github.io/blog/2015/11/10/mcmc-sampling/
 
 
 
+import sys
+
 import numpy as np
 import matplotlib.pyplot as plt
 
-from scipy.stats import norm, bernoulli, uniform
+from scipy.stats import norm
+
+sys.path.append('../auxiliar_functions')
+from mcmc import metropolis_hastings, metropolis_hastings_chains
+from mcmc import normal_mean_log_posterior
 
-# fix random seed
-np.random.seed(123)
+# fix random seed: all random numbers of the script come from this
+# generator
+rng = np.random.default_rng(123)
 
 # define fiducial parameters
 true_mu = 2.0
@@ -29,7 +36,7 @@ std = 0.25
 n = 50
 
 # generate observations = true + gaussian noise
-data = norm.rvs(loc=true_mu, scale=std, size=n)
+data = rng.normal(loc=true_mu, scale=std, size=n)
 
 # plot data
 plt.figure()
@@ -51,42 +58,17 @@ n_samples = 500
 mu_prior_mean = 5 
 mu_prior_std = 1.5
 
-# store chain
-chain = []
-
-while len(chain) < n_samples:
-
-    print str(len(chain)) + '  samples'
-
-    # propose a new point
-    mu_proposal = norm(mu_current, proposal_width).rvs()
-
-    # calculate likelihood in current and proposed point
-    likelihood_current = norm(mu_current, std).pdf(data).prod()
-    likelihood_proposal = norm(mu_proposal, std).pdf(data).prod()
-
-    # Compute prior probability of current and proposed mu        
-    prior_current = norm(mu_prior_mean, mu_prior_std).pdf(mu_current)
-    prior_proposal = norm(mu_prior_mean, mu_prior_std).pdf(mu_proposal)
-
-    # Nominator of Bayes formula
-    p_current = likelihood_current * prior_current
-    p_proposal = likelihood_proposal * prior_proposal
+# log-posterior: gaussian likelihood times gaussian prior, in log space
+log_posterior = normal_mean_log_posterior(data, std, mu_prior_mean, mu_prior_std)
 
-    # acceptance probability
-    p_accept = min([1, p_proposal / p_current])
+# run the Metropolis-Hastings sampler
+results = metropolis_hastings(log_posterior, mu_current, n_samples,
+                              proposal_width=proposal_width, seed=rng)
 
-    accept = bernoulli.rvs(p_accept)
-
-    if accept:
-        # store new point
-        chain.append(mu_proposal)
-
-        # Update position
-        mu_current = mu_proposal
+# store chain
+chain = results['chain'][:, 0]
 
-    else:
-        chain.append(mu_proposal)
+print('acceptance rate: ' + str(results['acceptance_rate']))
 
 
 plt.figure()
@@ -96,10 +78,14 @@ plt.xlabel('sample')
 plt.ylabel('mu')
 plt.show()
 
-# from the above plot you can see that the first 200 iterations where very
-# far from the convergence point, so we can consider them burn-in
+# from the above plot you can see that the first iterations where very
+# far from the convergence point, so we can consider them burn-in;
+# the sampler estimates how many draws to discard (the end of the
+# initial transient, confirmed by a Geweke test)
+
+burn_in = results['burn_in']
 
-burn_in = 200
+print('estimated burn-in: ' + str(burn_in) + ' samples')
 
 plt.figure()
 plt.title('Chain after burn-in/warm-up')
@@ -117,7 +103,7 @@ x_axis = np.arange(min(chain[burn_in:]), max(chain[burn_in:]), 0.001)
 y_axis = norm.pdf(x_axis, loc=mean_posterior, scale=std_posterior)
 
 plt.figure()
-plt.hist(chain[burn_in:], normed=True, alpha=0.5)
+plt.hist(chain[burn_in:], density=True, alpha=0.5)
 plt.plot(x_axis, y_axis, color='red', lw=2.0, label='posterior')
 plt.legend()
 plt.xlabel('mu')
@@ -125,3 +111,20 @@ plt.ylabel('PDF')
 plt.show()
 
 
+
+# the same sampler can advance many chains at once, as a single array
+# of shape (n_chains, n_params); this gives between-chain R-hat for free
+n_chains = 1000
+mu_start = rng.normal(loc=mu_prior_mean, scale=mu_prior_std, size=(n_chains, 1))
+
+# here the proposal width is tuned during a warm-up phase, which is not
+# stored, and then frozen
+n_warmup = 200
+
+results = metropolis_hastings_chains(log_posterior, mu_start, n_samples, n_chains,
+                                     proposal_width=proposal_width,
+                                     n_warmup=n_warmup, seed=rng)
+
+print('tuned proposal width: ' + str(results['proposal_width'].mean()))
+print('estimated burn-in after warm-up: ' + str(results['burn_in']) + ' samples')
+print('R-hat over ' + str(n_chains) + ' chains: ' + str(results['rhat'][0]))
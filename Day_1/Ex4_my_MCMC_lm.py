@@ -0,0 +1,108 @@
+# ESTEC - 18-20 December 2017
+# Adapted from Ex4_my_MCMC_lm.R, (c) 2017, Rafael S. de Souza
+#
+# Customized MCMC sampler in Python
+# Case: linear regression
+#
+# The likelihood only needs X^T X, X^T y and y^T y, which are computed
+# once, so each step of the sampler costs the same for 100 or 10^7 rows.
+
+import sys
+
+import numpy as np
+import matplotlib.pyplot as plt
+from scipy.optimize import minimize
+
+sys.path.append('../auxiliar_functions')
+from likelihoods import LinearGaussianLikelihood
+from linear_model import linear_model_log_posterior, linear_model_mh
+
+# Generate data
+rng = np.random.default_rng(1056)       # set seed to replicate example
+nobs = 100                              # number of obs in model
+x1 = rng.normal(0, 5, size=nobs)        # random normal variable
+alpha = 1.5                             # intercept
+beta = 4                                # angular coefficient
+xb = alpha + beta * x1                  # linear predictor, xb
+sd = 1                                  # Standard deviation
+y = rng.normal(xb, sd)                  # create y as  random normal variate
+
+X = np.column_stack([np.ones(nobs), x1])     # design matrix with intercept
+
+# Fit with least squares
+coef, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+print('least squares: a = {:.3f}, b = {:.3f}'.format(*coef))
+
+# Plot Output
+plt.figure()
+plt.scatter(x1, y, color='red')                                # plot scatter
+order = np.argsort(x1)
+plt.plot(x1[order], np.dot(X, coef)[order], color='grey', lw=2) # regression line
+plt.vlines(x1, np.dot(X, coef), y, lw=1, color='lightgrey')     # add the residuals
+plt.xlabel('x1')
+plt.ylabel('y')
+plt.show()
+
+# Sufficient statistics of the data: Gram matrix, X^T y, y^T y
+likelihood = LinearGaussianLikelihood(X, y)
+
+# Fit via Maximum Likelihood
+def neg_log_likelihood(param):
+    return -likelihood.log_likelihood(param[:2], param[2])
+
+fit = minimize(neg_log_likelihood, x0=[2, 2, 1], method='L-BFGS-B',
+               bounds=[(None, None), (None, None), (1e-3, None)])
+print('maximum likelihood: a = {:.3f}, b = {:.3f}, sd = {:.3f}'.format(*fit.x))
+
+# MCMC solution
+# priors: a, b ~ normal(0, 10), sd ~ uniform(0.001, 30)
+posterior = linear_model_log_posterior(likelihood, prior_sd=10, sd_min=0.001, sd_max=30)
+
+# Initial state
+startvalue = [1, 2, 1]
+
+N_it = 50000                                             # number of iterations
+
+# proposal: normal(0.25) steps on a and b,
+#           max(1e-3, uniform(sd - 1, sd + 1)) on sd
+results = linear_model_mh(posterior, startvalue, N_it, beta_width=0.25,
+                          sd_width=1, seed=1056)
+
+chain = results['chains'][0]
+
+print('acceptance rate: ' + str(results['acceptance_rate'][0]))
+
+# number of burn-in samples, estimated by the sampler
+burnIn = results['burn_in']
+print('estimated burn-in: ' + str(burnIn) + ' samples')
+
+# plot chains
+plt.figure()
+plt.plot(chain[:burnIn + 1, 0], chain[:burnIn + 1, 1], color='grey', label='burn-in')
+plt.plot(chain[burnIn:, 0], chain[burnIn:, 1], color='blue', label='chain')
+plt.scatter([alpha], [beta], color='red', zorder=3)
+plt.xlabel(r'$\alpha$')
+plt.ylabel(r'$\beta$')
+plt.legend()
+plt.show()
+
+names = ['a', 'b', 'sd']
+true_values = [alpha, beta, sd]
+
+plt.figure(figsize=(12, 8))
+for k in range(3):
+    plt.subplot(2, 3, k + 1)
+    plt.hist(chain[burnIn:, k], bins=30)
+    plt.axvline(np.mean(chain[burnIn:, k]), color='black')
+    plt.axvline(true_values[k], color='red')
+    plt.title('Posterior of ' + names[k])
+    plt.xlabel('True value = red line')
+
+    plt.subplot(2, 3, k + 4)
+    plt.plot(chain[burnIn:, k])
+    plt.axhline(true_values[k], color='red')
+    plt.title('Chain values of ' + names[k])
+    plt.xlabel('True value = red line')
+
+plt.tight_layout()
+plt.show()
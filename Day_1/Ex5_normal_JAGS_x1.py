@@ -4,11 +4,16 @@
 # Normal linear model in Python using JAGS
 # 1 response (y) and 1 explanatory variable (x1)
 
+import sys
+
 import numpy as np
 import statsmodels.api as sm
-import pyjags
 from scipy.stats import uniform
 
+sys.path.append('../auxiliar_functions')
+from fit_runner import run_fit
+from predictive import normal_noise, polynomial_mean, predictive_bands
+
 # Data
 np.random.seed(1056)                 # set seed to replicate example
 nobs= 5000                           # number of obs in model 
@@ -27,9 +32,9 @@ toy_data = {}                  # build data dictionary
 toy_data['N'] = nobs           # sample size
 toy_data['X'] = x1             # explanatory variable
 toy_data['Y'] = y              # response variable
-toy_data['M'] = 5000
 toy_data['K'] = 2
-toy_data['xx'] = np.arange(min(x1), max(x1),((max(x1)-min(x1))/5000))
+
+xx = np.arange(min(x1), max(x1),((max(x1)-min(x1))/5000))      # grid for prediction
 
 
 # JAGS code
@@ -48,26 +53,23 @@ NORM =""" model{
        mu[i]  <- eta[i]
        eta[i] <- beta[1]+beta[2]*X[i]
     }
-
-   # Prediction for new data
-   for (j in 1:M){
-   etax[j]<-beta[1]+beta[2]*xx[j]
-   mux[j]  <- etax[j]
-   Yx[j]~dnorm(mux[j],tau)
-    }
 }"""
 
 
-model = pyjags.Model(NORM, data=toy_data, chains=3)
-samples = model.sample(5000, vars=['beta', 'sigma', 'Yx', 'mux'])
-
+config = {'backend': 'jags',
+          'model': NORM,
+          'data': toy_data,
+          'pars': ['beta', 'sigma'],
+          'n_chains': 3,
+          'n_warmup': 0,
+          'n_samples': 5000,
+          'options': {'n_jobs': 3}}
+posterior = run_fit(config)
 
-def summary(samples, varname, p=95):
-    values = samples[varname]
-    ci = np.percentile(values, [100-p, p])
-    print('{:<6} mean = {:>5.1f}, {}% credible interval [{:>4.1f} {:>4.1f}]'.format(
-      varname, np.mean(values), p, *ci))
+posterior.summary(['beta', 'sigma'])
 
-for varname in ['beta', 'sigma', 'Yx', 'mux']:
-    summary(samples, varname)
+# Prediction for new data (mux and Yx), computed from the draws
+params = posterior.draws[:, :, posterior.columns(['beta', 'sigma'])]
+prediction = predictive_bands(params, polynomial_mean([0, 1]), xx,
+                              noise=normal_noise(2))
 
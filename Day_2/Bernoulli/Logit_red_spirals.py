@@ -22,17 +22,28 @@
 # Data from: http://data.galaxyzoo.org/data/redspirals/BlueSpiralsA2.txt
 #            http://data.galaxyzoo.org/data/redspirals/RedSpiralsA1.txt
 
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
 import numpy as np
-import pandas as pd
-import pystan 
 import statsmodels.api as sm
 
-# Data
-path_to_data = '../data/Red_spirals.csv'
+sys.path.append('../../auxiliar_functions')
+from data_registry import load_dataset
+from fit_runner import run_fit
+from glm import BernoulliLogitGLM
+from polya_gamma import PolyaGammaLogit
+from predictive import bernoulli_noise, logit_mean, predictive_bands, replicate
+from sgmcmc import MinibatchLogit
+from stan_benchmark import (benchmark_batch_sizes, benchmark_models,
+                            benchmark_stan)
 
-# read data
-data_frame = dict(pd.read_csv(path_to_data))
-x = np.array(data_frame['fracdeV'])
+# read data (Day_2/data/Red_spirals.csv)
+data_frame = load_dataset('red_spirals')
+x = data_frame['fracdeV']
 
 # for prediction
 xx = np.arange(min(x), max(x), (max(x) - min(x))/500)
@@ -40,23 +51,19 @@ xx = np.arange(min(x), max(x), (max(x) - min(x))/500)
 # prepare data for Stan
 data = {}
 data['X'] = sm.add_constant((x.transpose()))
-data['Y'] = np.array(data_frame['type'])
+data['Y'] = data_frame['type']
 data['nobs'] = data['X'].shape[0]
 data['K'] = data['X'].shape[1]
-data['M'] = 500
-data['XX'] = sm.add_constant((xx.transpose()))
 
 
 
 # Fit
-stan_code="""
+stan_code_loop = """
 data{
     int<lower=0> nobs;                # number of data points
     int<lower=0> K;                   # number of coefficients
-    int<lower=0> M;                   # number of points for prediction
     matrix[nobs, K] X;                # bulge size
     int Y[nobs];                      # galaxy type: 1 - red, 0 - blue
-    matrix[M, K] XX;                     # exploratory variable for plotting
 }
 parameters{
     vector[K] beta;                   # linear predictor coefficients
@@ -67,25 +74,93 @@ model{
 
     Y ~ bernoulli_logit(X * beta);
 }
-generated quantities{
-    vector[M] ypred;
+"""
+
+# Same model without element-wise loops, so Stan evaluates the
+# log-density and its gradient with vectorized autodiff
+stan_code = """
+data{
+    int<lower=0> nobs;                # number of data points
+    int<lower=0> K;                   # number of coefficients
+    matrix[nobs, K] X;                # bulge size
+    int Y[nobs];                      # galaxy type: 1 - red, 0 - blue
+}
+parameters{
+    vector[K] beta;                   # linear predictor coefficients
+}
+model{
+    # priors and likelihood
+    beta ~ normal(0, 100);
 
-    for (j in 1:M){
-        ypred[j] = bernoulli_logit_rng(XX[j] * beta);
-    }
+    Y ~ bernoulli_logit(X * beta);
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=6000, chains=3,
-                  warmup=3000, thin=1, n_jobs=3)
+config = {'backend': 'stan',
+          'model': stan_code,
+          'data': data,
+          'n_chains': 3,
+          'n_warmup': 3000,
+          'n_samples': 3000,
+          'options': {'n_jobs': 3}}
+posterior = run_fit(config)
 
 # Output
-nlines = 7                                   # number of lines in screen output
-
-output = str(fit).split('\n')
-for item in output[:nlines]:
-    print(item)   
+posterior.summary(['beta'])
+
+# Same model in process, by Polya-Gamma Gibbs sampling: nothing to
+# compile or tune, and all of beta is drawn exactly at every iteration
+pg_config = {'backend': 'numpy',
+             'model': PolyaGammaLogit(data['X'], data['Y']),
+             'n_chains': 3,
+             'n_warmup': 200,
+             'n_samples': 3000,
+             'seed': 1}
+pg_posterior = run_fit(pg_config)
+pg_posterior.summary(['beta'])
+
+# Catalogues too large for memory: the data are read from .npy files
+# mapped in memory, one minibatch of rows per iteration, and sampled by
+# stochastic-gradient HMC around the posterior mode (the files are
+# written to a scratch directory removed at exit)
+scratch = tempfile.mkdtemp()
+atexit.register(shutil.rmtree, scratch, True)
+np.save(os.path.join(scratch, 'X.npy'), data['X'])
+np.save(os.path.join(scratch, 'Y.npy'), data['Y'])
+sg_model = MinibatchLogit(np.load(os.path.join(scratch, 'X.npy'),
+                                  mmap_mode='r'),
+                          np.load(os.path.join(scratch, 'Y.npy'),
+                                  mmap_mode='r'))
+sg_config = {'backend': 'numpy',
+             'model': sg_model,
+             'n_chains': 3,
+             'n_warmup': 500,
+             'n_samples': 3000,
+             'seed': 1,
+             'options': {'batch_size': 500}}
+sg_posterior = run_fit(sg_config)
+sg_posterior.summary(['beta'])
+
+# Compare with the loop version, and the Gibbs sampler with NUTS on the
+# same log-posterior: python Logit_red_spirals.py --benchmark
+if '--benchmark' in sys.argv:
+    benchmark_stan([('loop', stan_code_loop), ('vectorized', stan_code)],
+                   data, ['beta'])
+    benchmark_models([('nuts', BernoulliLogitGLM(data['X'], data['Y'])),
+                      ('polya-gamma', PolyaGammaLogit(data['X'],
+                                                      data['Y']))],
+                     ['beta'], n_chains=3, n_samples=3000)
+
+    # accuracy of the minibatch posterior against the full-data one
+    benchmark_batch_sizes(sg_model, posterior, ['beta'],
+                          batch_sizes=(50, 200, 1000, 5000))
+
+# Prediction: fraction of red spirals on the bulge size grid and one
+# replicated galaxy sample, computed from the draws of beta
+beta = posterior['beta']
+bands = predictive_bands(beta, logit_mean([0, 1]), xx)
+ypred = replicate(beta, logit_mean([0, 1]), xx, bernoulli_noise(), seed=1)
 
 
 
@@ -10,12 +10,18 @@
 # 1 response (y) and 1 explanatory variable (x1)
 
 
+import sys
+
 import numpy as np
 import statsmodels.api as sm
-import pystan
 
 from scipy.stats import norm
 
+sys.path.append('../../../auxiliar_functions')
+from errors_in_variables import ErrorsInVariablesModel
+from fit_runner import run_fit
+from stan_benchmark import benchmark_models, benchmark_stan
+
 ############### Data
 np.random.seed(1056)                      # set seed to replicate example
 nobs = 750                               # number of obs in model 
@@ -44,7 +50,7 @@ toy_data['xmean'] = np.repeat(0, nobs)       # initial guess for true x position
 
 
 # STAN code
-stan_code = """
+stan_code_loop = """
 data {
     int<lower=0> N;                                 
     vector[N] obsx;                     
@@ -89,15 +95,137 @@ model{
 }
 """
 
+# Same model without element-wise loops, so Stan evaluates the
+# log-density and its gradient with vectorized autodiff
+stan_code = """
+data {
+    int<lower=0> N;
+    vector[N] obsx;
+    vector[N] obsy;
+    vector[N] errx;
+    vector[N] erry;
+    vector[N] xmean;
+}
+transformed data{
+    vector[N] varx = fabs(errx);
+    vector[N] vary = fabs(erry);
+}
+parameters {
+    real beta0;
+    real beta1;
+    real<lower=0> sigma;
+    vector[N] x;
+    vector[N] y;
+}
+model{
+    beta0 ~ normal(0.0, 100);                # Diffuse normal priors for predictors
+    beta1 ~ normal(0.0, 100);
+
+    sigma ~ uniform(0.0, 100);                # Uniform prior for standard deviation
+
+    x ~ normal(xmean, 100);
+    obsx ~ normal(x, varx);
+    y ~ normal(beta0 + beta1 * x, sigma);
+    obsy ~ normal(y, vary);
+}
+"""
+
+# True y integrated out: obsy ~ normal(beta0 + beta1 * x, sqrt(sigma^2 + erry^2)),
+# N + 3 parameters instead of 2N + 3
+stan_code_marginal_y = """
+data {
+    int<lower=0> N;
+    vector[N] obsx;
+    vector[N] obsy;
+    vector[N] errx;
+    vector[N] erry;
+    vector[N] xmean;
+}
+transformed data{
+    vector[N] varx = fabs(errx);
+    vector[N] vary = fabs(erry);
+}
+parameters {
+    real beta0;
+    real beta1;
+    real<lower=0> sigma;
+    vector[N] x;
+}
+model{
+    beta0 ~ normal(0.0, 100);                # Diffuse normal priors for predictors
+    beta1 ~ normal(0.0, 100);
+
+    sigma ~ uniform(0.0, 100);                # Uniform prior for standard deviation
+
+    x ~ normal(xmean, 100);
+    obsx ~ normal(x, varx);
+    obsy ~ normal(beta0 + beta1 * x, sqrt(square(sigma) + square(vary)));
+}
+"""
+
+# True x integrated out as well: given obsx, x ~ normal(xhat, sqrt(vx)), so
+# obsy ~ normal(beta0 + beta1 * xhat, sqrt(beta1^2 vx + sigma^2 + erry^2)),
+# 3 parameters; the posterior of beta0, beta1 and sigma is unchanged
+stan_code_marginal = """
+data {
+    int<lower=0> N;
+    vector[N] obsx;
+    vector[N] obsy;
+    vector[N] errx;
+    vector[N] erry;
+    vector[N] xmean;
+}
+transformed data{
+    vector[N] varx = fabs(errx);
+    vector[N] vary = fabs(erry);
+    vector[N] k = square(100.0) ./ (square(100.0) + square(varx));
+    vector[N] xhat = xmean + k .* (obsx - xmean);
+    vector[N] vx = k .* square(varx);
+}
+parameters {
+    real beta0;
+    real beta1;
+    real<lower=0> sigma;
+}
+model{
+    beta0 ~ normal(0.0, 100);                # Diffuse normal priors for predictors
+    beta1 ~ normal(0.0, 100);
+
+    sigma ~ uniform(0.0, 100);                # Uniform prior for standard deviation
+
+    obsy ~ normal(beta0 + beta1 * xhat,
+                  sqrt(square(beta1) * vx + square(sigma) + square(vary)));
+}
+"""
+
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=toy_data, iter=5000, chains=3,
-                  n_jobs=3, warmup=2500, verbose=False, thin=1)
+config = {'backend': 'stan',
+          'model': stan_code_marginal,
+          'data': toy_data,
+          'n_chains': 3,
+          'n_warmup': 2500,
+          'n_samples': 2500,
+          'options': {'n_jobs': 3, 'verbose': False}}
+posterior = run_fit(config)
 
 # Output
-nlines = 8                                   # number of lines in screen output
-
-output = str(fit).split('\n')
-for item in output[:nlines]:
-    print(item)   
+posterior.summary(['beta0', 'beta1', 'sigma'])
+
+# Compare the formulations: python Ex1_Errors_in_measurements.py --benchmark
+if '--benchmark' in sys.argv:
+    benchmark_stan([('loop', stan_code_loop), ('vectorized', stan_code),
+                    ('marginal y', stan_code_marginal_y),
+                    ('marginal x, y', stan_code_marginal)],
+                   toy_data, ['beta0', 'beta1', 'sigma'])
+
+    # same three formulations sampled in process with hmc.nuts
+    benchmark_models([(label, ErrorsInVariablesModel(
+                          obsx, errx, obsy, erry, marginalize=marginalize,
+                          prior_sd=100.0, sigma_max=100.0, x_sd=100.0,
+                          names=('beta0', 'beta1', 'sigma')))
+                      for label, marginalize in
+                      [('latent x, y', None), ('marginal y', 'y'),
+                       ('marginal x, y', 'xy')]],
+                     ['beta0', 'beta1', 'sigma'])
 
 
@@ -13,9 +13,13 @@
 # 1 response (y) and 1 explanatory variable (x1)
 
 
+import sys
+
 import numpy as np
 import statsmodels.api as sm
-import pyjags
+
+sys.path.append('../../../auxiliar_functions')
+from fit_runner import run_fit
 
 from scipy.stats import norm
 
@@ -69,25 +73,16 @@ mu[i] <- beta[1]+beta[2]*x[i]
 }"""
 
 # Run mcmc
-model = pyjags.Model(NORM_err, data=toy_data, chains=3)
-samples = model.sample(5000, vars=['beta', 'sigma'])
-
-
-def summary(samples, varname, p=95):
-    if varname == 'beta':
-        for k in range(toy_data['K']):
-            values = samples[varname][k]
-            ci = np.percentile(values, [100-p, p])
-            print('{:<6} mean = {:>5.1f}, {}% credible interval [{:>4.1f} {:>4.1f}]'.format(
-                   varname[k], np.mean(values), p, *ci))
-
-    else:
-        values = samples[varname]
-        ci = np.percentile(values, [100-p, p])
-        print('{:<6} mean = {:>5.1f}, {}% credible interval [{:>4.1f} {:>4.1f}]'.format(
-               varname, np.mean(values), p, *ci))
-
-for varname in ['beta', 'sigma']:
-    summary(samples, varname)
+config = {'backend': 'jags',
+          'model': NORM_err,
+          'data': toy_data,
+          'pars': ['beta', 'sigma'],
+          'n_chains': 3,
+          'n_warmup': 0,
+          'n_samples': 5000,
+          'options': {'n_jobs': 3}}
+posterior = run_fit(config)
+
+posterior.summary(['beta', 'sigma'])
 
 
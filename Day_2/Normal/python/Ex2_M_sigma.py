@@ -18,25 +18,27 @@
 #
 # Data from: http://www.physics.mcmaster.ca/~harris/GCS_table.txt
 
-import numpy as np
-import pandas as pd
-import pystan 
+import sys
 
-path_to_data = '../../data/M_sigma.csv'
+sys.path.append('../../../auxiliar_functions')
+from data_registry import load_dataset
+from errors_in_variables import ErrorsInVariablesModel
+from fit_runner import run_fit
+from stan_benchmark import benchmark_models, benchmark_stan
 
-# read data
-data_frame = dict(pd.read_csv(path_to_data))
+# read data (Day_2/data/M_sigma.csv)
+data_frame = load_dataset('m_sigma')
 
 # prepare data for Stan
 data = {}
-data['obsx'] = np.array(data_frame['obsx'])
-data['errx'] = np.array(data_frame['errx'])
-data['obsy'] = np.array(data_frame['obsy'])
-data['erry'] = np.array(data_frame['erry'])
+data['obsx'] = data_frame['obsx']
+data['errx'] = data_frame['errx']
+data['obsy'] = data_frame['obsy']
+data['erry'] = data_frame['erry']
 data['N'] = len(data['obsx'])
 
-# Stan Gaussian model with errors
-stan_code="""
+# Stan Gaussian model with errors: 2N + 3 parameters
+stan_code_latent = """
 data{
     int<lower=0> N;                   # number of data points
     vector[N] obsx;                   # obs velocity dispersion
@@ -60,13 +62,78 @@ model{
 }
 """
 
-# Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=15000, chains=3,
-                  warmup=5000, thin=10, n_jobs=3)
+# True black hole mass integrated out: N + 3 parameters
+stan_code_marginal_y = """
+data{
+    int<lower=0> N;                   # number of data points
+    vector[N] obsx;                   # obs velocity dispersion
+    vector<lower=0>[N] errx;          # errors in velocity dispersion measurements
+    vector[N] obsy;                   # obs black hole mass
+    vector<lower=0>[N] erry;          # errors in black hole mass measurements
+}
+parameters{
+    real alpha;                       # intercept
+    real beta;                        # angular coefficient
+    real<lower=0> epsilon;            # scatter around true black hole mass
+    vector[N] x;                      # true velocity dispersion
+}
+model{
+
+    # likelihood
+    obsx ~ normal(x, errx);
+    obsy ~ normal(alpha + beta * x, sqrt(square(epsilon) + square(erry)));
+}
+"""
+
+# True velocity dispersion integrated out as well (its prior is flat, so
+# given obsx it is normal(obsx, errx)): 3 parameters, same posterior of
+# alpha, beta and epsilon
+stan_code = """
+data{
+    int<lower=0> N;                   # number of data points
+    vector[N] obsx;                   # obs velocity dispersion
+    vector<lower=0>[N] errx;          # errors in velocity dispersion measurements
+    vector[N] obsy;                   # obs black hole mass
+    vector<lower=0>[N] erry;          # errors in black hole mass measurements
+}
+parameters{
+    real alpha;                       # intercept
+    real beta;                        # angular coefficient
+    real<lower=0> epsilon;            # scatter around true black hole mass
+}
+model{
+
+    # likelihood
+    obsy ~ normal(alpha + beta * obsx,
+                  sqrt(square(beta * errx) + square(epsilon) + square(erry)));
+}
+"""
+
+# Run mcmc; the latent version needed n_warmup=5000 and thin=10
+config = {'backend': 'stan',
+          'model': stan_code,
+          'data': data,
+          'n_chains': 3,
+          'n_warmup': 1000,
+          'n_samples': 1000,
+          'options': {'n_jobs': 3}}
+posterior = run_fit(config)
 
 # Output
-nlines = 8                                  # number of lines in screen output
+posterior.summary(['alpha', 'beta', 'epsilon'])
+
+# Compare the formulations: python Ex2_M_sigma.py --benchmark
+if '--benchmark' in sys.argv:
+    benchmark_stan([('latent x, y', stan_code_latent),
+                    ('marginal y', stan_code_marginal_y),
+                    ('marginal x, y', stan_code)],
+                   data, ['alpha', 'beta', 'epsilon'])
 
-output = str(fit).split('\n')
-for item in output[:nlines]:
-    print(item) 
+    # same three formulations sampled in process with hmc.nuts
+    benchmark_models([(label, ErrorsInVariablesModel(
+                          data['obsx'], data['errx'], data['obsy'],
+                          data['erry'], marginalize=marginalize))
+                      for label, marginalize in
+                      [('latent x, y', None), ('marginal y', 'y'),
+                       ('marginal x, y', 'xy')]],
+                     ['alpha', 'beta', 'epsilon'])
@@ -21,26 +21,30 @@
 #
 # Data from: http://www.physics.mcmaster.ca/~harris/GCS_table.txt
 
+import sys
+
 import numpy as np
-import pandas as pd
-import pyjags
 from scipy.stats import norm
 import pylab as plt
 
-path_to_data = '../../data/M_sigma.csv'
+sys.path.append('../../../auxiliar_functions')
+from data_registry import load_dataset
+from fit_runner import run_fit
+from predictive import normal_noise, polynomial_mean, predictive_bands
 
-# read data
-data_frame = dict(pd.read_csv(path_to_data))
+# read data (Day_2/data/M_sigma.csv)
+data_frame = load_dataset('m_sigma')
 
 # prepare data for Stan
 data = {}
-data['obsx'] = np.array(data_frame['obsx'])
-data['errx'] = np.array(data_frame['errx'])
-data['obsy'] = np.array(data_frame['obsy'])
-data['erry'] = np.array(data_frame['erry'])
+data['obsx'] = data_frame['obsx']
+data['errx'] = data_frame['errx']
+data['obsy'] = data_frame['obsy']
+data['erry'] = data_frame['erry']
 data['N'] = len(data['obsx'])
-data['M'] = 500
-data['xx'] = np.arange(min(data['obsx']), max(data['obsx']), (max(data['obsx']) - min(data['obsx']))/500)
+
+# grid for prediction
+xx = np.arange(min(data['obsx']), max(data['obsx']), (max(data['obsx']) - min(data['obsx']))/500)
 
 # JAGS Gaussian model with errors
 jags_code = """model{
@@ -61,59 +65,52 @@ for (i in 1:N){
     y[i] ~ dnorm(mu[i], tau)
     mu[i] <- alpha + beta*x[i] # linear predictor
 }
-
-# Prediction for new data
-for (j in 1:M){
-    etax[j]<-alpha+beta*xx[j]
-    mux[j]  <- etax[j]
-    Yx[j]~dnorm(mux[j],tau)
-    }
 }"""
 
 # Run mcmc
-model = pyjags.Model(jags_code, data=data, chains=3)
-samples = model.sample(5000, vars=['alpha', 'beta', 'epsilon', 'mux'])
-9
+config = {'backend': 'jags',
+          'model': jags_code,
+          'data': data,
+          'pars': ['alpha', 'beta', 'epsilon'],
+          'n_chains': 3,
+          'n_warmup': 0,
+          'n_samples': 5000,
+          'options': {'n_jobs': 3}}
+posterior = run_fit(config)
 
-def summary(samples, varname, p=95):
-    values = samples[varname]
-    ci = np.percentile(values, [100-p, p])
-    print('{:<6} mean = {:>5.1f}, {}% credible interval [{:>4.1f} {:>4.1f}]'.format(
-               varname, np.mean(values), p, *ci))
+posterior.summary(['alpha', 'beta', 'epsilon'])
 
-for varname in ['alpha', 'beta', 'epsilon']:
-    summary(samples, varname)
+# Prediction for new data (mux and Yx), computed from the draws
+params = posterior.draws[:, :, posterior.columns(['alpha', 'beta', 'epsilon'])]
+prediction = predictive_bands(params, polynomial_mean([0, 1]), xx,
+                              noise=normal_noise(2))
 
 
 
 # get Gaussian fit
-alpha_mean, alpha_std = norm.fit(samples['alpha'][0][:,0])
-alpha_mean, alpha_std = norm.fit(samples['alpha'][0][:,0])
+alpha_mean, alpha_std = norm.fit(posterior.get('alpha', chain=0))
 
-alpha_axis = np.arange(min(samples['alpha'][0][:,0]), max(samples['alpha'][0][:,0]), 0.01)
-alpha_axis = np.arange(min(samples['alpha'][0][:,0]), max(samples['alpha'][0][:,0]), 0.01)
+alpha_axis = np.arange(min(posterior.get('alpha', chain=0)), max(posterior.get('alpha', chain=0)), 0.01)
 
 
-beta_mean, beta_std = norm.fit(samples['beta'][0][:,0])
-beta_mean, beta_std = norm.fit(samples['beta'][0][:,0])
+beta_mean, beta_std = norm.fit(posterior.get('beta', chain=0))
 
-beta_axis = np.arange(min(samples['beta'][0][:,0]), max(samples['beta'][0][:,0]), 0.01)
-beta_axis = np.arange(min(samples['beta'][0][:,0]), max(samples['beta'][0][:,0]), 0.01)
+beta_axis = np.arange(min(posterior.get('beta', chain=0)), max(posterior.get('beta', chain=0)), 0.01)
 
 # plot posteriors
 plt.figure(figsize=(8,8))
 plt.subplot(2,2,1)
-plt.hist(samples['alpha'][0][:,0], normed=True)
+plt.hist(posterior.get('alpha', chain=0), density=True)
 plt.plot(alpha_axis, norm.pdf(alpha_axis, loc=alpha_mean, scale=alpha_std), color='red', lw=2)
 plt.xlabel('alpha')
 
 plt.subplot(2,2,3)
-plt.scatter(samples['alpha'][0][:,0], samples['beta'][0][:,0])
+plt.scatter(posterior.get('alpha', chain=0), posterior.get('beta', chain=0))
 plt.xlabel('alpha')
 plt.ylabel('beta')
 
 plt.subplot(2,2,4)
-plt.hist(samples['beta'][0][:,0], normed=True)
+plt.hist(posterior.get('beta', chain=0), density=True)
 plt.plot(beta_axis, norm.pdf(beta_axis, loc=beta_mean, scale=beta_std), color='red', lw=2)
 plt.xlabel('beta')
 
@@ -0,0 +1,66 @@
+# ESTEC Bayesian course
+#
+# Sequential updating of the AR(1) sunspot model of
+# Ex3_sunspot_time_series.py,
+#
+#     Y[t] ~ normal(phi[1] + phi[2] * Y[t - 1], tau)
+#
+# with a particle approximation of the posterior of (phi, tau) that is
+# updated as new observations arrive instead of refitted from scratch.
+#
+# The sampler state is kept in sunspot_smc.pkl in the data cache
+# (.data_cache or $ESTEC_DATA_CACHE): the first run starts from the
+# prior, every later run (e.g. after new values were appended to
+# sunspot.csv) only absorbs the values it has not seen yet.
+#
+# Data from: http://www.sidc.be/silso/DATA/EISN/EISN_current.csv
+
+import os
+import sys
+import time
+
+import numpy as np
+import pylab as plt
+
+sys.path.append('../../../auxiliar_functions')
+from data_registry import CACHE_DIR, load_dataset
+from smc import SequentialAR1
+
+# read data (Day_2/data/sunspot.csv)
+data_frame = load_dataset('sunspot')
+Y = np.round(data_frame['nspots'])
+
+# Update the saved posterior with the new observations
+smc = SequentialAR1(os.path.join(CACHE_DIR, 'sunspot_smc.pkl'), seed=1)
+n_old = smc.y.size
+start = time.time()
+smc.update(Y)
+print('{} new observations absorbed in {:.3f} s'.format(
+    Y.size - n_old, time.time() - start))
+
+posterior = smc.posterior()
+posterior.summary(['phi', 'tau'])
+
+
+# How the posterior narrows year after year: start from the first 50
+# years and add one observation at a time
+replay = SequentialAR1(seed=1).update(Y[:50])
+bands = []
+for n in range(50, Y.size + 1):
+    replay.update(Y[:n])
+    draws = replay.posterior().draws[0]
+    bands.append(np.percentile(draws, [2.5, 50, 97.5], axis=0))
+bands = np.array(bands)
+years = 1700 + np.arange(49, Y.size)
+
+plt.figure(figsize=(15, 8))
+for k, name in enumerate(['phi[2]', 'tau']):
+    col = replay.names.index(name)
+    plt.subplot(2, 1, k + 1)
+    plt.plot(years, bands[:, 1, col], color='black')
+    plt.fill_between(years, bands[:, 0, col], bands[:, 2, col],
+                     color='orange', alpha=0.5)
+    plt.ylabel(name, fontsize=18)
+plt.xlabel('year', fontsize=18)
+plt.tight_layout()
+plt.show()
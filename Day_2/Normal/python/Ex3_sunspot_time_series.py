@@ -23,25 +23,29 @@
 #
 # Data from: http://www.sidc.be/silso/DATA/EISN/EISN_current.csv
 
+import sys
+
 import numpy as np
-import pystan 
 import pylab as plt
-import pandas as pd
 
-# Data
-path_to_data = "../../data/sunspot.csv"
+sys.path.append('../../../auxiliar_functions')
+from data_registry import load_dataset
+from fit_runner import run_fit
+from predictive import normal_noise, polynomial_mean, replicate
+from stan_benchmark import benchmark_stan
+from state_space import StateSpaceModel
 
-# read data
-data_frame = dict(pd.read_csv(path_to_data))
+# read data (Day_2/data/sunspot.csv)
+data_frame = load_dataset('sunspot')
 
 # prepare data for Stan
 data = {}
-data['Y'] = [round(item) for item in data_frame['nspots']]
+data['Y'] = np.round(data_frame['nspots'])
 data['N'] = len(data['Y'])
 data['K'] = 2
 
 # Fit
-stan_code="""
+stan_code_loop = """
 data{
     int<lower=0> N;                # number of data points
     int<lower=0> K;                # number of coefficients
@@ -63,31 +67,86 @@ model{
     for (t in 2:N) mu[t] = phi[1] + phi[2] * Y[t - 1];
     Y ~ normal(mu, tau);
 }
-generated quantities{
-    vector[N] new_mu;
-    vector[N] ypred;
+"""
+
+# Same model without element-wise loops, so Stan evaluates the
+# log-density and its gradient with vectorized autodiff
+stan_code = """
+data{
+    int<lower=0> N;                # number of data points
+    int<lower=0> K;                # number of coefficients
+    vector[N] Y;                   # nuber of sunspots
+}
+parameters{
+    vector[K] phi;                    # linear predictor coefficients
+    real<lower=0> tau;                # noise parameter
+}
+model{
+    # priors and likelihood
+    tau ~ gamma(0.001, 0.001);
+    phi ~ normal(0, 100);
 
-    new_mu[1] = Y[1];
-    for (i in 2:N) new_mu[i] = phi[1] + phi[2] * Y[i - 1];
-    for (j in 1:N) ypred[j] = normal_rng(new_mu[j], tau);
+    Y[1] ~ normal(Y[1], tau);         # mu[1] = Y[1], as in the loop version
+    Y[2:N] ~ normal(phi[1] + phi[2] * Y[1:(N - 1)], tau);
 }
 """
 
 # Run mcmc
-fit = pystan.stan(model_code=stan_code, data=data, iter=7500, chains=3,
-                  warmup=5000, thin=1, n_jobs=3)
+config = {'backend': 'stan',
+          'model': stan_code,
+          'data': data,
+          'n_chains': 3,
+          'n_warmup': 5000,
+          'n_samples': 2500,
+          'options': {'n_jobs': 3}}
+posterior = run_fit(config)
 
 # Output
-nlines = 8                                   # number of lines in screen output
+posterior.summary(['phi', 'tau'])
+
+# Compare with the loop version: python Ex3_sunspot_time_series.py --benchmark
+if '--benchmark' in sys.argv:
+    benchmark_stan([('loop', stan_code_loop), ('vectorized', stan_code)],
+                   data, ['phi', 'tau'])
+
+
+# Replicated series from the AR(1) model, mu[t] = phi[1] + phi[2] * Y[t - 1],
+# computed from the draws of (phi, tau)
+params = posterior.draws[:, :, posterior.columns(['phi', 'tau'])]
+ypred = replicate(params, polynomial_mean([0, 1]), data['Y'][:-1],
+                  normal_noise(2), seed=1)[0]
+
+
+plt.figure(figsize=(15, 8))
+plt.scatter(range(1700, 2016), data['Y'])
+plt.plot(np.arange(1701, 2016), ypred, color='black')
+plt.xlabel('year', fontsize=18)
+plt.ylabel('sunspots', fontsize=18)
+plt.tight_layout()
+plt.show()
+
 
-output = str(fit).split('\n')
-for item in output[:nlines]:
-    print(item) 
+# Same AR(1), now for a latent sunspot number observed with noise,
+# Y[t] ~ normal(x[t], sigma): the Kalman filter integrates x out, so NUTS
+# only samples phi, tau and sigma, and the latent path is drawn afterwards
+# by forward filtering, backward sampling
+ss_model = StateSpaceModel(data['Y'], scale_prior=(2.0, 0.1))
+ss_config = {'backend': 'numpy',
+             'model': ss_model,
+             'n_chains': 3,
+             'seed': 1}
+ss_posterior = run_fit(ss_config)
+ss_posterior.summary(['phi', 'tau', 'sigma'])
 
+paths = ss_model.sample_states(
+    ss_posterior.draws[:, :, ss_posterior.columns(['phi', 'tau', 'sigma'])],
+    seed=1)
+band = np.percentile(paths.reshape(-1, data['N']), [2.5, 97.5], axis=0)
 
 plt.figure(figsize=(15, 8))
 plt.scatter(range(1700, 2016), data['Y'])
-plt.plot(np.arange(1700, 2016), fit.extract(['ypred'])['ypred'][-1], color='black')
+plt.fill_between(range(1700, 2016), band[0], band[1], color='orange',
+                 alpha=0.5)
 plt.xlabel('year', fontsize=18)
 plt.ylabel('sunspots', fontsize=18)
 plt.tight_layout()
@@ -23,20 +23,23 @@
 #
 # Data from: http://www.sidc.be/silso/DATA/EISN/EISN_current.csv
 
+import os
+import sys
+
 import numpy as np
-import pyjags
 import pylab as plt
-import pandas as pd
 
-# Data
-path_to_data = "../../data/sunspot.csv"
+sys.path.append('../../../auxiliar_functions')
+from data_registry import CACHE_DIR, load_dataset
+from fit_runner import run_fit
+from predictive import normal_noise, polynomial_mean, replicate
 
-# read data
-data_frame = dict(pd.read_csv(path_to_data))
+# read data (Day_2/data/sunspot.csv)
+data_frame = load_dataset('sunspot')
 
 # prepare data for Stan
 data = {}
-data['Y'] = [round(item) for item in data_frame['nspots']]
+data['Y'] = np.round(data_frame['nspots'])
 data['N'] = len(data['Y'])
 
 # Fit
@@ -57,41 +60,33 @@ for (t in 2:N) {
     Y[t] ~ dnorm(mu[t],tau)
     mu[t] <- phi[1] + phi[2] * Y[t-1]
 }
-
-# Prediction
-for (t in 1:N){
-    Yx[t]~dnorm(mu[t],tau)
-}
 }"""
 
 # Run mcmc
-model = pyjags.Model(AR1_NORM, data=data, chains=3)
-samples = model.sample(5000, vars=['sd', 'phi', 'Yx'])
-
-
-def summary(samples, varname, p=95):
-    if varname == 'phi':
-        for k in range(2):
-            values = samples[varname][k]
-            ci = np.percentile(values, [100-p, p])
-            print('{:<6} mean = {:>5.1f}, {}% credible interval [{:>4.1f} {:>4.1f}]'.format(
-                   varname[k], np.mean(values), p, *ci))
-
-    else:
-        values = samples[varname]
-        ci = np.percentile(values, [100-p, p])
-        print('{:<6} mean = {:>5.1f}, {}% credible interval [{:>4.1f} {:>4.1f}]'.format(
-               varname, np.mean(values), p, *ci))
-
-for varname in ['sd', 'phi']:
-    summary(samples, varname)
-
-    print(item) 
+config = {'backend': 'jags',
+          'model': AR1_NORM,
+          'data': data,
+          'pars': ['sd', 'phi'],
+          'n_chains': 3,
+          'n_warmup': 0,
+          'n_samples': 5000,
+          # checkpointed: rerunning resumes, a larger n_samples extends;
+          # kept in the data cache (.data_cache or $ESTEC_DATA_CACHE)
+          'draws_path': os.path.join(CACHE_DIR, 'sunspot_AR1_draws')}
+posterior = run_fit(config)
+
+posterior.summary(['sd', 'phi'])
+
+# Replicated series from the AR(1) model, computed from the draws of
+# (phi, sd) instead of monitoring a prediction node in JAGS
+params = posterior.draws[:, :, posterior.columns(['phi', 'sd'])]
+Yx = replicate(params, polynomial_mean([0, 1]), data['Y'][:-1],
+               normal_noise(2), seed=1)[0]
 
 
 plt.figure(figsize=(15, 8))
 plt.scatter(range(1700, 2016), data['Y'])
-plt.plot(np.arange(1700, 2016), samples['Yx'][:,0][:,0], color='black')
+plt.plot(np.arange(1701, 2016), Yx, color='black')
 plt.xlabel('year', fontsize=18)
 plt.ylabel('sunspots', fontsize=18)
 plt.tight_layout()
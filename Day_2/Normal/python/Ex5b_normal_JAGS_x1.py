@@ -7,11 +7,17 @@
 # Normal linear model in Python using JAGS
 # 1 response (y) and 1 explanatory variable (x1)
 
+import sys
+
 import numpy as np
-import pyjags
 from scipy.stats import uniform, norm
 import pylab as plt
 
+sys.path.append('../../../auxiliar_functions')
+from fit_runner import run_fit
+from predictive import normal_noise, polynomial_mean, predictive_bands
+from regression import LinearRegression
+
 # Data
 np.random.seed(1056)                                 # set seed to replicate example
 nobs= 500                                            # number of obs in model 
@@ -34,9 +40,8 @@ toy_data = {}                  # build data dictionary
 toy_data['N'] = nobs           # sample size
 toy_data['X'] = x1             # explanatory variable
 toy_data['Y'] = y              # response variable
-toy_data['M'] = 5000           # number of data for prediction
 
-toy_data['xx'] = np.arange(min(x1), max(x1),((max(x1)-min(x1))/5000))      # grid for prediction
+xx = np.arange(min(x1), max(x1),((max(x1)-min(x1))/5000))      # grid for prediction
 
 
 # JAGS code
@@ -56,51 +61,59 @@ NORM =""" model{
        mu[i]  <- eta[i]
        eta[i] <- beta0 + beta1 * X[i]
     }
-
-   # Prediction for new data
-   for (j in 1:M){
-   etax[j] <- beta0 + beta1 * xx[j]
-   mux[j]  <- etax[j]
-   Yx[j] ~ dnorm(mux[j],tau)
-    }
 }"""
 
 
-model = pyjags.Model(NORM, data=toy_data, chains=3)
-samples = model.sample(5000, vars=['beta0', 'beta1', 'sigma', 'Yx', 'mux'])
+config = {'backend': 'jags',
+          'model': NORM,
+          'data': toy_data,
+          'pars': ['beta0', 'beta1', 'sigma'],
+          'n_chains': 3,
+          'n_warmup': 0,
+          'n_samples': 5000,
+          'options': {'n_jobs': 3}}
+posterior = run_fit(config)
 
+posterior.summary(['beta0', 'beta1', 'sigma'])
 
-def summary(samples, varname, p=95):
-    values = samples[varname]
-    ci = np.percentile(values, [100-p, p])
-    print('{:<6} mean = {:>5.1f}, {}% credible interval [{:>4.1f} {:>4.1f}]'.format(
-      varname, np.mean(values), p, *ci))
+# Same priors in process: hmc.nuts on the centred, QR-decomposed design
+# (the normal priors on beta are not conjugate, so no exact draws)
+qr_config = {'backend': 'numpy',
+             'model': LinearRegression(np.column_stack([np.ones(nobs), x1]),
+                                       y, prior_sd=100.0, sigma_max=100.0),
+             'n_chains': 3,
+             'n_warmup': 1000,
+             'n_samples': 5000,
+             'seed': 1056}
+run_fit(qr_config).summary(['beta', 'sigma'])
 
-for varname in ['beta0', 'beta1', 'sigma']:
-    summary(samples, varname)
+# Prediction for new data (mux and Yx), computed from the draws
+params = posterior.draws[:, :, posterior.columns(['beta0', 'beta1', 'sigma'])]
+prediction = predictive_bands(params, polynomial_mean([0, 1]), xx,
+                              noise=normal_noise(2))
 
 
 # get Gaussian fit
-beta0_mean, beta0_std = norm.fit(samples['beta0'][0][:,0])
-beta1_mean, beta1_std = norm.fit(samples['beta1'][0][:,0])
+beta0_mean, beta0_std = norm.fit(posterior.get('beta0', chain=0))
+beta1_mean, beta1_std = norm.fit(posterior.get('beta1', chain=0))
 
-beta0_axis = np.arange(min(samples['beta0'][0][:,0]), max(samples['beta0'][0][:,0]), 0.01)
-beta1_axis = np.arange(min(samples['beta1'][0][:,0]), max(samples['beta1'][0][:,0]), 0.01)
+beta0_axis = np.arange(min(posterior.get('beta0', chain=0)), max(posterior.get('beta0', chain=0)), 0.01)
+beta1_axis = np.arange(min(posterior.get('beta1', chain=0)), max(posterior.get('beta1', chain=0)), 0.01)
 
 # plot posteriors
 plt.figure(figsize=(8,8))
 plt.subplot(2,2,1)
-plt.hist(samples['beta0'][0][:,0], normed=True)
+plt.hist(posterior.get('beta0', chain=0), density=True)
 plt.plot(beta0_axis, norm.pdf(beta0_axis, loc=beta0_mean, scale=beta0_std), color='red', lw=2)
 plt.xlabel('beta0')
 
 plt.subplot(2,2,3)
-plt.scatter(samples['beta0'][0][:,0], samples['beta1'][0][:,0])
+plt.scatter(posterior.get('beta0', chain=0), posterior.get('beta1', chain=0))
 plt.xlabel('beta0')
 plt.ylabel('beta1')
 
 plt.subplot(2,2,4)
-plt.hist(samples['beta1'][0][:,0], normed=True)
+plt.hist(posterior.get('beta1', chain=0), density=True)
 plt.plot(beta1_axis, norm.pdf(beta1_axis, loc=beta1_mean, scale=beta1_std), color='red', lw=2)
 plt.xlabel('beta1')
 
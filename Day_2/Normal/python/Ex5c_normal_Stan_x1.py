@@ -10,11 +10,18 @@
 # Code 4.3 - Normal linear model in Python using STAN
 # 1 response (y) and 1 explanatory variable (x1)
 
+import sys
+
 import numpy as np
-import pystan
 from scipy.stats import uniform
 import pylab as plt
 
+sys.path.append('../../../auxiliar_functions')
+from fit_runner import run_fit
+from stan_benchmark import benchmark_stan
+from regression import LinearRegression
+from predictive import polynomial_mean, predictive_bands
+
 # Data
 np.random.seed(1056)                                 # set seed to replicate example
 nobs= 500                                            # number of obs in model 
@@ -37,17 +44,14 @@ toy_data = {}                  # build data dictionary
 toy_data['nobs'] = nobs        # sample size
 toy_data['x'] = x1             # explanatory variable
 toy_data['y'] = y              # response variable
-toy_data['xx'] = np.arange(min(x1), max(x1), (max(x1) - min(x1))/500)    # exploratory values for prediction
-toy_data['M'] = 500                                                      # number of points for prediction
+xx = np.arange(min(x1), max(x1), (max(x1) - min(x1))/500)    # exploratory values for prediction
 
 # STAN code
-stan_code = """
+stan_code_loop = """
 data {
     int<lower=0> nobs;           
-    int<lower=0> M;                      
     vector[nobs] x;                       
     vector[nobs] y;                       
-    vector[M] xx;
 }
 parameters {
     real beta0;
@@ -61,24 +65,58 @@ model {
 
     y ~ normal(mu, sigma);             # Likelihood function
 }
-generated quantities{
-    vector[M] ypred;
+"""
 
-    for (i in 1:M){
-        ypred[i] = beta0 + beta1 * xx[i];
-    }
+# Same model without element-wise loops, so Stan evaluates the
+# log-density and its gradient with vectorized autodiff
+stan_code = """
+data {
+    int<lower=0> nobs;
+    vector[nobs] x;
+    vector[nobs] y;
+}
+parameters {
+    real beta0;
+    real beta1;
+    real<lower=0> sigma;
+}
+model {
+    y ~ normal(beta0 + beta1 * x, sigma);             # Likelihood function
 }
 """
 
-fit = pystan.stan(model_code=stan_code, data=toy_data, iter=5000, chains=3, verbose=False, n_jobs=3)
+config = {'backend': 'stan',
+          'model': stan_code,
+          'data': toy_data,
+          'n_chains': 3,
+          'n_warmup': 2500,
+          'n_samples': 2500,
+          'options': {'n_jobs': 3, 'verbose': False}}
+posterior = run_fit(config)
+fit = posterior.source
 
 # Output
-nlines = 9                    # number of lines in screen output
+posterior.summary(['beta0', 'beta1', 'sigma'])
+
+# Compare with the loop version: python Ex5c_normal_Stan_x1.py --benchmark
+if '--benchmark' in sys.argv:
+    benchmark_stan([('loop', stan_code_loop), ('vectorized', stan_code)],
+                   toy_data, ['beta0', 'beta1', 'sigma'])
+
 
-output = str(fit).split('\n')
-for item in output[:nlines]:
-    print(item)   
+# Same model in process: with the flat priors of the Stan code above the
+# posterior is normal-inverse-gamma, so independent draws are generated
+# exactly, in milliseconds and without compilation
+config['backend'] = 'numpy'
+config['model'] = LinearRegression(np.column_stack([np.ones(nobs), x1]), y)
+config['options'] = None
+config['seed'] = 1056
+exact_posterior = run_fit(config)
+exact_posterior.summary(['beta', 'sigma'])
 
+# Prediction: posterior band of the regression line on the grid xx
+params = posterior.draws[:, :, posterior.columns(['beta0', 'beta1'])]
+prediction = predictive_bands(params, polynomial_mean([0, 1]), xx)
 
 # Plot posteriors
 fit.plot(['beta0', 'beta1', 'sigma'])
@@ -87,7 +125,9 @@ plt.show()
 
 # plot prediction
 plt.figure(figsize=(12,8))
-plt.plot(toy_data['xx'], 2 + 3 * toy_data['xx'], color='black', lw=2)
+plt.plot(xx, 2 + 3 * xx, color='black', lw=2)
+plt.fill_between(xx, prediction['quantiles'][0], prediction['quantiles'][-1],
+                 color='orange', alpha=0.5)
 plt.scatter(x1, y, color='blue')
 plt.xlabel('x', fontsize=18)
 plt.ylabel('y', fontsize=18)
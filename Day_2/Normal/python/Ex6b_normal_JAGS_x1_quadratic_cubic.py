@@ -7,11 +7,18 @@
 # Normal linear model in Python using JAGS
 # 1 response (y) and 1 explanatory variable (x1)
 
+import sys
+
 import numpy as np
-import pyjags
+import statsmodels.api as sm
 from scipy.stats import uniform, norm
 import pylab as plt
 
+sys.path.append('../../../auxiliar_functions')
+from fit_runner import run_fit
+from predictive import normal_noise, polynomial_mean, predictive_bands
+from regression import LinearRegression
+
 # Data
 np.random.seed(1056)                                 # set seed to replicate example
 nobs= 500                                            # number of obs in model 
@@ -34,10 +41,9 @@ toy_data = {}                                                 # build data dicti
 toy_data['N'] = nobs                                          # sample size
 toy_data['X'] = sm.add_constant(np.transpose(x1))             # explanatory variable
 toy_data['Y'] = y                                             # response variable
-toy_data['M'] = 500                                           # number of data for prediction
 toy_data['K'] = 4                                             # number of parameters
 
-toy_data['xx'] = np.arange(min(x1), max(x1),((max(x1)-min(x1))/500))      # grid for prediction
+xx = np.arange(min(x1), max(x1),((max(x1)-min(x1))/500))      # grid for prediction
 
 
 # JAGS code
@@ -55,35 +61,36 @@ NORM =""" model{
         mu[i]  <- eta[i]
         eta[i] <- beta[1] + beta[2] * X[i,2] + beta[3] * X[i,2]^2 + beta[4] * X[i,2]^3
     }
-
-    # Prediction for new data
-    for (j in 1:M){
-        etax[j] <- beta[1] + beta[2] * xx[j] + beta[3] * xx[j]^2 + beta[4] * xx[j]^3
-        mux[j]  <- etax[j]
-        Yx[j] ~ dnorm(mux[j],tau)
-    }
 }"""
 
-model = pyjags.Model(NORM, data=toy_data, chains=3)
-samples = model.sample(5000, vars=['beta', 'sigma', 'Yx', 'mux'])
-
-
-def summary(samples, varname, p=95):
-    if varname == 'beta':
-        for k in range(4):
-            values = samples[varname][k]
-            ci = np.percentile(values, [100-p, p])
-            print('{:<6} mean = {:>5.1f}, {}% credible interval [{:>4.1f} {:>4.1f}]'.format(
-                   varname[k], np.mean(values), p, *ci))
-
-    else:
-        values = samples[varname]
-        ci = np.percentile(values, [100-p, p])
-        print('{:<6} mean = {:>5.1f}, {}% credible interval [{:>4.1f} {:>4.1f}]'.format(
-               varname, np.mean(values), p, *ci))
-
-for varname in ['beta', 'sigma']:
-    summary(samples, varname)
+config = {'backend': 'jags',
+          'model': NORM,
+          'data': toy_data,
+          'pars': ['beta', 'sigma'],
+          'n_chains': 3,
+          'n_warmup': 0,
+          'n_samples': 5000,
+          'options': {'n_jobs': 3}}
+posterior = run_fit(config)
+
+posterior.summary(['beta', 'sigma'])
+
+# Same priors in process: hmc.nuts on the centred, QR-decomposed design
+# (the normal priors on beta are not conjugate, so no exact draws)
+X_poly = np.column_stack([x1 ** k for k in range(4)])      # 1, x, x^2, x^3
+qr_config = {'backend': 'numpy',
+             'model': LinearRegression(X_poly, y, prior_sd=100.0,
+                                       sigma_max=100.0),
+             'n_chains': 3,
+             'n_warmup': 1000,
+             'n_samples': 5000,
+             'seed': 1056}
+run_fit(qr_config).summary(['beta', 'sigma'])
+
+# Prediction for new data (mux and Yx), computed from the draws
+params = posterior.draws[:, :, posterior.columns(['beta', 'sigma'])]
+prediction = predictive_bands(params, polynomial_mean([0, 1, 2, 3]), xx,
+                              noise=normal_noise(4))
 
 
 # get Gaussian fit
@@ -91,61 +98,61 @@ mean = []
 std = []
 beta_axis = []
 for j in range(4):
-    meanx, stdx = norm.fit(samples['beta'][j][:,0])
+    meanx, stdx = norm.fit(posterior.get('beta', chain=0, index=j))
     mean.append(meanx)
     std.append(stdx)
-    beta_axis.append(np.arange(min(samples['beta'][j][:,0]), max(samples['beta'][j][:,0]), 0.001))
+    beta_axis.append(np.arange(min(posterior.get('beta', chain=0, index=j)), max(posterior.get('beta', chain=0, index=j)), 0.001))
 
 
 # plot posteriors
 plt.figure(figsize=(8,8))
 plt.subplot(4,4,1)
-plt.hist(samples['beta'][0][:,0], normed=True)
+plt.hist(posterior.get('beta', chain=0, index=0), density=True)
 plt.plot(beta_axis[0], norm.pdf(beta_axis[0], loc=mean[0], scale=std[0]), color='red', lw=2)
 plt.xlabel('beta[0]')
 
 plt.subplot(4,4,5)
-plt.scatter(samples['beta'][0][:,0], samples['beta'][1][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=0), posterior.get('beta', chain=0, index=1))
 plt.xlabel('beta[0]')
 plt.ylabel('beta[1]')
 
 plt.subplot(4,4,6)
-plt.hist(samples['beta'][1][:,0], normed=True)
+plt.hist(posterior.get('beta', chain=0, index=1), density=True)
 plt.plot(beta_axis[1], norm.pdf(beta_axis[1], loc=mean[1], scale=std[1]), color='red', lw=2)
 plt.xlabel('beta[1]')
 
 plt.subplot(4,4,9)
-plt.scatter(samples['beta'][0][:,0], samples['beta'][2][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=0), posterior.get('beta', chain=0, index=2))
 plt.xlabel('beta[0]')
 plt.ylabel('beta[2]')
 
 plt.subplot(4,4,10)
-plt.scatter(samples['beta'][1][:,0], samples['beta'][2][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=1), posterior.get('beta', chain=0, index=2))
 plt.xlabel('beta[1]')
 plt.ylabel('beta[2]')
 
 plt.subplot(4,4,11)
-plt.hist(samples['beta'][2][:,0], normed=True)
+plt.hist(posterior.get('beta', chain=0, index=2), density=True)
 plt.plot(beta_axis[2], norm.pdf(beta_axis[2], loc=mean[2], scale=std[2]), color='red', lw=2)
 plt.xlabel('beta[2]')
 
 plt.subplot(4,4,13)
-plt.scatter(samples['beta'][0][:,0], samples['beta'][3][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=0), posterior.get('beta', chain=0, index=3))
 plt.xlabel('beta[0]')
 plt.ylabel('beta[3]')
 
 plt.subplot(4,4,14)
-plt.scatter(samples['beta'][1][:,0], samples['beta'][3][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=1), posterior.get('beta', chain=0, index=3))
 plt.xlabel('beta[1]')
 plt.ylabel('beta[3]')
 
 plt.subplot(4,4,15)
-plt.scatter(samples['beta'][2][:,0], samples['beta'][3][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=2), posterior.get('beta', chain=0, index=3))
 plt.xlabel('beta[2]')
 plt.ylabel('beta[3]')
 
 plt.subplot(4,4,16)
-plt.hist(samples['beta'][3][:,0], normed=True)
+plt.hist(posterior.get('beta', chain=0, index=3), density=True)
 plt.plot(beta_axis[3], norm.pdf(beta_axis[3], loc=mean[3], scale=std[3]), color='red', lw=2)
 plt.xlabel('beta[3]')
 
@@ -7,11 +7,19 @@
 # Normal linear model in Python using Stan
 # 1 response (y) and 1 explanatory variable (x1)
 
+import sys
+
 import numpy as np
-import pystan
+import statsmodels.api as sm
 from scipy.stats import uniform, norm
 import pylab as plt
 
+sys.path.append('../../../auxiliar_functions')
+from fit_runner import run_fit
+from predictive import polynomial_mean, predictive_bands
+from regression import LinearRegression
+from stan_benchmark import benchmark_stan
+
 # Data
 np.random.seed(1056)                                 # set seed to replicate example
 nobs= 500                                            # number of obs in model 
@@ -34,20 +42,17 @@ toy_data = {}                                                 # build data dicti
 toy_data['N'] = nobs                                          # sample size
 toy_data['X'] = sm.add_constant(np.transpose(x1))             # explanatory variable
 toy_data['Y'] = y                                             # response variable
-toy_data['xx'] = np.arange(min(x1), max(x1),((max(x1)-min(x1))/500))      # grid for prediction
-toy_data['M'] = toy_data['xx'].shape[0]                                   # number of data for prediction
+xx = np.arange(min(x1), max(x1),((max(x1)-min(x1))/500))      # grid for prediction
 toy_data['K'] = 4                                             # number of parameters
 
 
 # Stan code
-stan_code =""" 
+stan_code_loop = """ 
 data {
     int<lower=0> N;           
-    int<lower=0> M;     
     int<lower=0> K;                 
     matrix[N, 2] X;                       
     vector[N] Y;                       
-    vector[M] xx;
 }
 parameters {
     vector[K] beta;                                              
@@ -63,23 +68,60 @@ model {
     }
 
     Y ~ normal(mu, sigma);             # Likelihood function
+}"""
+
+# Same model without element-wise loops, so Stan evaluates the
+# log-density and its gradient with vectorized autodiff
+stan_code = """
+data {
+    int<lower=0> N;
+    int<lower=0> K;
+    matrix[N, 2] X;
+    vector[N] Y;
 }
-generated quantities{
-    vector[M] ypred;
+transformed data {
+    matrix[N, K] Xpoly;                   # columns 1, x, x^2, x^3
 
-    for (i in 1:M){
-        ypred[i] = beta[1] + beta[2] * xx[i] + beta[3] * xx[i]^2 + beta[4] * xx[i]^3;
-    }
+    Xpoly[, 1] = rep_vector(1, N);
+    for (k in 2:K)
+        Xpoly[, k] = Xpoly[, k - 1] .* X[, 2];
+}
+parameters {
+    vector[K] beta;
+    real<lower=0> sigma;
+}
+model {
+    Y ~ normal(Xpoly * beta, sigma);             # Likelihood function
 }"""
 
-fit = pystan.stan(model_code=stan_code, data=toy_data, iter=5000, chains=3, verbose=False, n_jobs=3)
+config = {'backend': 'stan',
+          'model': stan_code,
+          'data': toy_data,
+          'n_chains': 3,
+          'n_warmup': 2500,
+          'n_samples': 2500,
+          'options': {'n_jobs': 3, 'verbose': False}}
+posterior = run_fit(config)
+fit = posterior.source
 
 # Output
-nlines = 9                    # number of lines in screen output
+posterior.summary(['beta', 'sigma'])
+
+# Compare with the loop version: python Ex6c_normal_Stan_x1_quadratic_cubic.py --benchmark
+if '--benchmark' in sys.argv:
+    benchmark_stan([('loop', stan_code_loop), ('vectorized', stan_code)],
+                   toy_data, ['beta', 'sigma'])
 
-output = str(fit).split('\n')
-for item in output[:nlines]:
-    print(item)   
+# Same model in process: exact normal-inverse-gamma draws on the centred,
+# QR-decomposed design, whose raw powers of x are badly conditioned
+exact_config = {'backend': 'numpy',
+                'model': LinearRegression(np.column_stack(
+                    [x1 ** k for k in range(4)]), y),
+                'n_chains': 3,
+                'n_samples': 2500,
+                'seed': 1056}
+exact_posterior = run_fit(exact_config)
+exact_posterior.summary(['beta', 'sigma'])
 
 
 
@@ -94,64 +136,66 @@ mean = []
 std = []
 beta_axis = []
 for j in range(4):
-    meanx, stdx = norm.fit(fit.extract(['beta'])['beta'][:,j])
+    beta_j = posterior.get('beta', index=j).ravel()        # all chains
+    meanx, stdx = norm.fit(beta_j)
     mean.append(meanx)
     std.append(stdx)
-    beta_axis.append(np.arange(min(fit.extract(['beta'])['beta'][:,j]), max(fit.extract(['beta'])['beta'][:,j]), 0.001))
+    beta_axis.append(np.arange(min(beta_j), max(beta_j), 0.001))
 
 
-ypred = norm.fit(fit.extract(['ypred'])['ypred'][5000:])
+# prediction on the grid xx, computed from the draws of beta
+prediction = predictive_bands(posterior['beta'], polynomial_mean(range(4)), xx)
 
 
 # plot posteriors
 plt.figure(figsize=(8,8))
 plt.subplot(4,4,1)
-plt.hist(samples['beta'][0][:,0], normed=True)
+plt.hist(posterior.get('beta', chain=0, index=0), density=True)
 plt.plot(beta_axis[0], norm.pdf(beta_axis[0], loc=mean[0], scale=std[0]), color='red', lw=2)
 plt.xlabel('beta[0]')
 
 plt.subplot(4,4,5)
-plt.scatter(samples['beta'][0][:,0], samples['beta'][1][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=0), posterior.get('beta', chain=0, index=1))
 plt.xlabel('beta[0]')
 plt.ylabel('beta[1]')
 
 plt.subplot(4,4,6)
-plt.hist(samples['beta'][1][:,0], normed=True)
+plt.hist(posterior.get('beta', chain=0, index=1), density=True)
 plt.plot(beta_axis[1], norm.pdf(beta_axis[1], loc=mean[1], scale=std[1]), color='red', lw=2)
 plt.xlabel('beta[1]')
 
 plt.subplot(4,4,9)
-plt.scatter(samples['beta'][0][:,0], samples['beta'][2][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=0), posterior.get('beta', chain=0, index=2))
 plt.xlabel('beta[0]')
 plt.ylabel('beta[2]')
 
 plt.subplot(4,4,10)
-plt.scatter(samples['beta'][1][:,0], samples['beta'][2][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=1), posterior.get('beta', chain=0, index=2))
 plt.xlabel('beta[1]')
 plt.ylabel('beta[2]')
 
 plt.subplot(4,4,11)
-plt.hist(samples['beta'][2][:,0], normed=True)
+plt.hist(posterior.get('beta', chain=0, index=2), density=True)
 plt.plot(beta_axis[2], norm.pdf(beta_axis[2], loc=mean[2], scale=std[2]), color='red', lw=2)
 plt.xlabel('beta[2]')
 
 plt.subplot(4,4,13)
-plt.scatter(samples['beta'][0][:,0], samples['beta'][3][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=0), posterior.get('beta', chain=0, index=3))
 plt.xlabel('beta[0]')
 plt.ylabel('beta[3]')
 
 plt.subplot(4,4,14)
-plt.scatter(samples['beta'][1][:,0], samples['beta'][3][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=1), posterior.get('beta', chain=0, index=3))
 plt.xlabel('beta[1]')
 plt.ylabel('beta[3]')
 
 plt.subplot(4,4,15)
-plt.scatter(samples['beta'][2][:,0], samples['beta'][3][:,0])
+plt.scatter(posterior.get('beta', chain=0, index=2), posterior.get('beta', chain=0, index=3))
 plt.xlabel('beta[2]')
 plt.ylabel('beta[3]')
 
 plt.subplot(4,4,16)
-plt.hist(samples['beta'][3][:,0], normed=True)
+plt.hist(posterior.get('beta', chain=0, index=3), density=True)
 plt.plot(beta_axis[3], norm.pdf(beta_axis[3], loc=mean[3], scale=std[3]), color='red', lw=2)
 plt.xlabel('beta[3]')
 
@@ -168,7 +212,7 @@ for k in range(4):
     plt.xlabel('beta[' + str(k) + ']')
 
     plt.subplot(4,2, 2*k + 2)
-    plt.plot(range(2500), fit.extract(['beta'])['beta'][:,k][5000:])
+    plt.plot(range(posterior.n_draws), posterior.get('beta', chain=-1, index=k))
     plt.ylabel('beta[' + str(k) + ']')
     plt.xlabel('samples')
 
@@ -178,7 +222,7 @@ plt.show()
 # plot prediction
 plt.figure()
 plt.scatter(x1, y, color='blue')
-plt.plot(toy_data['xx'], fit.extract(['ypred'])['ypred'][-1], ls='--', color='black', lw=2)
+plt.plot(xx, prediction['mean'], ls='--', color='black', lw=2)
 plt.xlabel('x')
 plt.ylabel('y')
 plt.show()
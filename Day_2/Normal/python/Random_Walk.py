@@ -0,0 +1,86 @@
+# ESTEC Bayesian course - Netherlands
+#
+# A simple random walk experiment, Python version of ../Random_Walk.R,
+# followed by the inference of a random walk observed with noise:
+#
+#     x[t] ~ normal(x[t - 1], tau)
+#     y[t] ~ normal(x[t], sigma)
+#
+# The latent walk x is integrated out by a Kalman filter, so only tau and
+# sigma are sampled; the walk itself is drawn afterwards by forward
+# filtering, backward sampling.
+
+import sys
+
+import numpy as np
+import pylab as plt
+
+sys.path.append('../../../auxiliar_functions')
+from fit_runner import run_fit
+from state_space import StateSpaceModel
+
+np.random.seed(1056)                      # set seed to replicate example
+
+
+# Plot the position at each of N steps for nsim simulations
+def plot_RW(nsim, N):
+    for i in range(nsim):
+        plt.plot(range(1, N + 1), np.cumsum(np.random.uniform(-1, 1, N)),
+                 color='firebrick')
+    plt.xlim(1, 16)
+    plt.ylim(-6, 6)
+    plt.xlabel('step')
+    plt.ylabel('position')
+
+
+plt.figure(figsize=(8, 6))
+plot_RW(75, 20)
+plt.show()
+
+
+# Plot a histogram of the final position
+def plot_hist(nsim, N):
+    pos = np.random.uniform(-1, 1, (nsim, N)).sum(axis=1)
+    plt.hist(pos, color='limegreen')
+    plt.title('N=' + str(nsim))
+
+
+plt.figure(figsize=(12, 8))
+for k, nsim in enumerate([5, 10, 50, 100, 500, 2500]):
+    plt.subplot(2, 3, k + 1)
+    plot_hist(nsim, 20)
+plt.tight_layout()
+plt.show()
+
+
+# Noisy observations of a random walk, with some of them missing
+nobs = 500
+tau = 0.5                                 # step size of the walk
+sigma = 2.0                               # observation noise
+walk = np.cumsum(np.random.normal(0, tau, nobs))
+y = np.random.normal(walk, sigma)
+y[200:240] = np.nan                       # missing observations
+
+model = StateSpaceModel(y, random_walk=True, scale_prior=(2.0, 1.0))
+config = {'backend': 'numpy',
+          'model': model,
+          'n_chains': 3,
+          'n_warmup': 500,
+          'n_samples': 1000,
+          'seed': 1056}
+posterior = run_fit(config)
+posterior.summary(['tau', 'sigma'])
+
+# latent walk, one path per posterior draw
+paths = model.sample_states(posterior.draws[:, :, :2], seed=1056)
+band = np.percentile(paths.reshape(-1, nobs), [2.5, 50, 97.5], axis=0)
+
+plt.figure(figsize=(12, 8))
+plt.scatter(range(nobs), y, color='blue', s=8)
+plt.plot(walk, color='black', lw=2)
+plt.plot(band[1], color='orange', lw=2)
+plt.fill_between(range(nobs), band[0], band[2], color='orange', alpha=0.5)
+plt.xlabel('step', fontsize=18)
+plt.ylabel('position', fontsize=18)
+plt.tight_layout()
+plt.show()
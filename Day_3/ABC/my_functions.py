@@ -17,6 +17,9 @@ as long as you respect the input/ouput requirements and
 """
 
 
+import multiprocessing
+import os
+
 import numpy as np
 from scipy.stats import norm
 from scipy.stats import uniform
@@ -41,6 +44,37 @@ def my_simulation(v):
     return np.atleast_2d(l1).T
 
 
+# seed of the prior draws; change it to get another, repeatable, run
+SEED = 1056
+
+_rng = {}
+
+
+def _process_rng():
+    """
+    Random generator private to the current process, derived from SEED.
+
+    CosmoABC may call the prior from worker processes, which would
+    otherwise share the parent random state. One generator is created
+    per process instead of re-seeding the global numpy state on every
+    call: the main process uses the SeedSequence of SEED itself, so a
+    serial run is repeated exactly; a worker uses a child of it keyed
+    on its PID, so workers draw independent streams.
+
+    output: numpy.random.Generator
+    """
+
+    pid = os.getpid()
+    if pid not in _rng:
+        if multiprocessing.parent_process() is None:
+            seed = np.random.SeedSequence(SEED)
+        else:
+            seed = np.random.SeedSequence(SEED, spawn_key=(pid,))
+        _rng[pid] = np.random.default_rng(seed)
+
+    return _rng[pid]
+
+
 def my_prior(par, func=False):
     """
     Gaussian prior.
@@ -56,12 +90,11 @@ def my_prior(par, func=False):
             gaussian probability distribution function (if func=True)
     """
 
-    np.random.seed()    
     dist = norm(loc=par['pmean'], scale=par['pstd'])
 
     flag = False  
     while flag == False:   
-        draw = dist.rvs() 
+        draw = dist.rvs(random_state=_process_rng()) 
         if par['min'] < draw and draw < par['max']:
             flag = True
      
@@ -0,0 +1,141 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Preallocated storage for MCMC draws.
+
+Draws are written one at a time (or in blocks) into an array allocated
+once, with the draw index as first axis. When the array would exceed a
+memory limit it is backed by a disk file through numpy.memmap instead,
+flushed to disk every few draws, so chains of 10^8 draws do not need to
+fit in RAM. Stored draws are handed out as read-only views.
+"""
+
+
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+
+def _remove_file(path):
+    """Delete a spill file, ignoring files already gone or still in use."""
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ChainStore(object):
+    """
+    Fixed-size store for n_draws draws of shape draw_shape.
+
+    input: n_draws -> number of draws to be stored
+           draw_shape -> shape of one draw, e.g. (n_params,) or
+                         (n_chains, n_params) (default is scalar draws)
+           dtype -> numpy dtype of the draws (default is float64)
+           memory_limit -> largest size in bytes kept in RAM; larger
+                           stores are memory-mapped (default is 1 GB)
+           path -> file for the memory-mapped array; if None a temporary
+                   file is used and removed when the store is deleted
+           flush_every -> number of draws between flushes to disk
+                          of a memory-mapped store (default is 100000)
+    """
+
+    def __init__(self, n_draws, draw_shape=(), dtype=float,
+                 memory_limit=2 ** 30, path=None, flush_every=100000):
+
+        self.shape = (int(n_draws),) + tuple(draw_shape)
+        self.dtype = np.dtype(dtype)
+        self.flush_every = int(flush_every)
+        self.n = 0
+
+        nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.on_disk = nbytes > memory_limit
+
+        if self.on_disk:
+            if path is None:
+                handle, path = tempfile.mkstemp(suffix='.draws')
+                os.close(handle)
+                weakref.finalize(self, _remove_file, path)
+            self.path = path
+            self._data = np.memmap(path, dtype=self.dtype, mode='w+',
+                                   shape=self.shape)
+        else:
+            self.path = None
+            self._data = np.empty(self.shape, dtype=self.dtype)
+
+        self._last_flush = 0
+
+    @classmethod
+    def from_array(cls, values, axis=0, block_size=100000, **kwargs):
+        """
+        Copy existing draws, e.g. fit.extract(...) from pystan or a
+        pyjags samples entry, into a new store.
+
+        input: values -> array of draws
+               axis -> axis of values indexing the draws (default is 0;
+                       pyjags stores draws in axis 1)
+               block_size -> number of draws copied at a time
+               other keywords are passed to ChainStore
+
+        output: ChainStore holding the draws, with draws in axis 0
+        """
+
+        values = np.moveaxis(np.asarray(values), axis, 0)
+        store = cls(values.shape[0], values.shape[1:], dtype=values.dtype,
+                    **kwargs)
+        for first in range(0, values.shape[0], block_size):
+            store.extend(values[first:first + block_size])
+        store.flush()
+        return store
+
+    def __len__(self):
+        return self.n
+
+    def append(self, draw):
+        """
+        Store one draw after the ones already stored.
+
+        input: draw -> array of shape draw_shape
+        """
+
+        self._data[self.n] = draw
+        self.n += 1
+        if self.on_disk and self.n - self._last_flush >= self.flush_every:
+            self.flush()
+
+    def extend(self, draws):
+        """
+        Store a block of consecutive draws.
+
+        input: draws -> array of shape (n_block,) + draw_shape
+        """
+
+        n_block = len(draws)
+        if self.n + n_block > self.shape[0]:
+            raise IndexError('store holds at most ' + str(self.shape[0]) +
+                             ' draws')
+        self._data[self.n:self.n + n_block] = draws
+        self.n += n_block
+        if self.on_disk and self.n - self._last_flush >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write pending draws of a memory-mapped store to disk."""
+
+        if self.on_disk:
+            self._data.flush()
+        self._last_flush = self.n
+
+    def view(self):
+        """
+        Read-only view of the draws stored so far, without copying.
+
+        output: array of shape (len(self),) + draw_shape
+        """
+
+        out = self._data[:self.n].view(np.ndarray)
+        out.flags.writeable = False
+        return out
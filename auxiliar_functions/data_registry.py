@@ -0,0 +1,271 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+The data sets of the course, read through one registry with explicit
+column types, and cached as binary .npy columns.
+
+The first time a CSV file is loaded it is parsed once, with the dtypes
+given in DATASETS (or passed to read_table), and every column is written
+to its own .npy file in a cache directory named after the SHA-256 of the
+file contents and of the column types. Later loads map these files in
+memory (numpy.load with mmap_mode='r'): nothing is parsed or copied, and
+a column is read from disk only when it is used, so starting a script
+costs the same whatever the size of the catalogue.
+
+Identical files (e.g. Day_1/data/M_sigma.csv and Day_2/data/M_sigma.csv,
+kept next to the R scripts that read them) share one cache entry. The
+hash of a file is remembered together with its size and modification
+time, so an unchanged file is not hashed again; an edited file gets a
+new entry.
+
+The cache directory is ESTEC_DATA_CACHE if set, otherwise .data_cache at
+the root of the repository.
+"""
+
+
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.environ.get('ESTEC_DATA_CACHE',
+                           os.path.join(ROOT, '.data_cache'))
+INDEX = 'index.json'
+HEADER = 'meta.json'
+MISSING = ('', 'NA', 'NaN', 'nan')
+
+# name -> (CSV file relative to the repository root, [(column, dtype)]);
+# 'U' columns are strings, missing values of float columns become NaN
+DATASETS = {
+    'sunspot': ('Day_2/data/sunspot.csv',
+                [('year', 'f8'), ('nspots', 'f8'), ('std', 'f8'),
+                 ('nobs', 'i8'), ('status', 'i8')]),
+    'red_spirals': ('Day_2/data/Red_spirals.csv',
+                    [('redshift', 'f8'), ('g.r', 'f8'), ('g.r_err', 'f8'),
+                     ('fracdeV', 'f8'), ('type', 'i8')]),
+    'm_sigma': ('Day_2/data/M_sigma.csv',
+                [('obsx', 'f8'), ('errx', 'f8'), ('obsy', 'f8'),
+                 ('erry', 'f8'), ('Type', 'U')]),
+    'gcs': ('Day_2/data/GCs.csv',
+            [('N_GC', 'i8'), ('MV_T', 'f8'), ('Type', 'U')]),
+    'nb_gcs': ('Day_2/data/NB_GCs.csv',
+               [('Galaxy', 'U'), ('Type', 'U'), ('N_GC', 'f8'),
+                ('N_GC_err', 'i8'), ('MV_T', 'f8'), ('err_MV_T', 'f8')]),
+    'msigma': ('Day_2/data/MSigma.csv',
+               [('Galaxy', 'U'), ('Type', 'U'), ('N_GC', 'f8'),
+                ('N_GC_err', 'i8'), ('Mdyn', 'f8'), ('MBH', 'f8'),
+                ('sig_e', 'f8'), ('err_sig_e', 'f8'), ('A_V', 'f8'),
+                ('MV_T', 'f8'), ('err_MV_T', 'f8'), ('MK', 'f8'),
+                ('Re', 'f8'), ('upMBH', 'f8'), ('lowMBH', 'f8')]),
+    'hr': ('Day_1/data/HR.csv',
+           [('CID', 'i8'), ('IAUName', 'U'), ('Type', 'U'), ('z', 'f8'),
+            ('Color', 'f8'), ('e_Color', 'f8'), ('Stretch', 'f8'),
+            ('e_Stretch', 'f8'), ('HR', 'f8'), ('e_HR', 'f8'),
+            ('DR8-OBJID', 'f8'), ('BPT', 'i8'), ('LogMass', 'f8'),
+            ('e_LogMass', 'f8'), ('LogMet', 'f8'), ('e_LogMet', 'f8'),
+            ('LogSSFR', 'f8'), ('e_LogSSFR', 'f8'), ('GFF', 'f8'),
+            ('Source', 'U')]),
+}
+
+
+def _write_json(path, obj):
+    """Write a JSON file atomically."""
+
+    handle, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(handle, 'w') as f:
+        json.dump(obj, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _file_key(path, columns, cache_dir):
+    """
+    Cache key of a file read with the given columns: SHA-256 of the
+    contents (reused while size and modification time are unchanged)
+    and of the column types.
+    """
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+
+    index_path = os.path.join(cache_dir, INDEX)
+    index = _read_json(index_path) or {}
+    entry = index.get(path)
+    if entry is not None and entry['stat'] == signature:
+        digest = entry['sha256']
+    else:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        digest = h.hexdigest()
+        index[path] = {'stat': signature, 'sha256': digest}
+        _write_json(index_path, index)
+
+    h = hashlib.sha256(digest.encode('utf-8'))
+    h.update(json.dumps(columns).encode('utf-8'))
+    return h.hexdigest()[:32]
+
+
+def _convert(values, dtype, name, path):
+    """Column of CSV strings as an array of the given dtype."""
+
+    if dtype == 'U':
+        return np.array(values, dtype='U')
+    if np.dtype(dtype).kind == 'f':
+        return np.array([np.nan if v in MISSING else v for v in values],
+                        dtype=dtype)
+    try:
+        return np.array([int(v) for v in values], dtype=dtype)
+    except ValueError:
+        raise ValueError('column ' + repr(name) + ' of ' + path +
+                         ' has missing or non-integer values; '
+                         'declare it as a float column')
+
+
+def _parse(path, columns, directory):
+    """Parse the CSV file once and write one .npy file per column."""
+
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        missing = [name for name, _ in columns if name not in header]
+        if missing:
+            raise KeyError('columns ' + ', '.join(missing) +
+                           ' not found in ' + path)
+        cols = [header.index(name) for name, _ in columns]
+        values = [[] for _ in columns]
+        for row in reader:
+            if not row:
+                continue
+            for k, col in enumerate(cols):
+                values[k].append(row[col])
+
+    meta = {'source': path, 'n_rows': len(values[0]), 'columns': []}
+    for k, (name, dtype) in enumerate(columns):
+        array = _convert(values[k], dtype, name, path)
+        filename = 'col{}.npy'.format(k)
+        np.save(os.path.join(directory, filename), array)
+        meta['columns'].append([name, array.dtype.str, filename])
+    _write_json(os.path.join(directory, HEADER), meta)
+
+
+class Dataset(object):
+    """
+    Read-only columns of a cached table, mapped from their .npy files on
+    first access. Behaves as the dict(pd.read_csv(...)) it replaces:
+    dataset['nspots'], 'nspots' in dataset, dataset.keys().
+
+    input: directory -> cache entry written by _parse
+
+    attributes: names -> column names, in registry order
+                dtypes -> {name: numpy dtype}
+                n_rows -> number of rows
+                source -> path of the CSV file first parsed
+    """
+
+    def __init__(self, directory):
+
+        meta = _read_json(os.path.join(directory, HEADER))
+        self.directory = directory
+        self.source = meta['source']
+        self.n_rows = meta['n_rows']
+        self.names = [name for name, _, _ in meta['columns']]
+        self.dtypes = dict((name, np.dtype(dtype))
+                           for name, dtype, _ in meta['columns'])
+        self._files = dict((name, filename)
+                           for name, _, filename in meta['columns'])
+        self._columns = {}
+
+    def __getitem__(self, name):
+        if name not in self._columns:
+            if name not in self._files:
+                raise KeyError(name)
+            self._columns[name] = np.load(
+                os.path.join(self.directory, self._files[name]),
+                mmap_mode='r')
+        return self._columns[name]
+
+    def __contains__(self, name):
+        return name in self._files
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def keys(self):
+        return list(self.names)
+
+    def __repr__(self):
+        return 'Dataset({!r}, {} rows: {})'.format(
+            os.path.basename(self.source), self.n_rows,
+            ', '.join(self.names))
+
+
+def read_table(path, columns, cache_dir=None):
+    """
+    Typed columns of a CSV file, parsed on the first call and mapped from
+    the binary cache afterwards.
+
+    input: path -> CSV file with a header line
+           columns -> list of (column name, dtype): 'f8', 'i8', ... or
+                      'U' for strings; other columns are not read
+           cache_dir -> cache directory (default is CACHE_DIR)
+
+    output: Dataset
+    """
+
+    cache_dir = cache_dir or CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    columns = [[name, dtype] for name, dtype in columns]
+    directory = os.path.join(cache_dir, _file_key(path, columns, cache_dir))
+    if not os.path.isfile(os.path.join(directory, HEADER)):
+        # parse into a temporary directory, renamed when complete
+        tmp = tempfile.mkdtemp(dir=cache_dir, suffix='.tmp')
+        try:
+            _parse(os.path.abspath(path), columns, tmp)
+            os.rename(tmp, directory)
+        except OSError:
+            # written meanwhile by another process
+            if not os.path.isfile(os.path.join(directory, HEADER)):
+                raise
+        finally:
+            if os.path.isdir(tmp):
+                shutil.rmtree(tmp)
+
+    return Dataset(directory)
+
+
+def load_dataset(name, cache_dir=None):
+    """
+    One of the registered data sets of the course.
+
+    input: name -> key of DATASETS, e.g. 'sunspot' or 'red_spirals'
+           cache_dir -> cache directory (default is CACHE_DIR)
+
+    output: Dataset
+    """
+
+    if name not in DATASETS:
+        raise ValueError('unknown data set ' + repr(name) +
+                         ', expected one of ' + ', '.join(sorted(DATASETS)))
+    path, columns = DATASETS[name]
+    return read_table(os.path.join(ROOT, path), columns, cache_dir)
@@ -0,0 +1,493 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Convergence diagnostics for MCMC output.
+
+Draws are stored as arrays of shape (n_chains, n_draws, n_params).
+"""
+
+
+import warnings
+
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import rankdata
+
+
+def _as_chains(draws):
+    """Promote draws to shape (n_chains, n_draws, n_params)."""
+
+    draws = np.asarray(draws, dtype=float)
+    if draws.ndim == 1:
+        draws = draws[None, :, None]
+    elif draws.ndim == 2:
+        draws = draws[:, :, None]
+    return draws
+
+
+def _rhat_from_moments(chain_mean, chain_var, n):
+    """
+    Potential scale reduction factor from per-chain means and variances.
+
+    input: chain_mean, chain_var -> arrays (n_chains, n_params)
+           n -> number of draws in each chain
+
+    output: array (n_params,)
+    """
+
+    within = chain_var.mean(axis=0)
+    between = n * chain_mean.var(axis=0, ddof=1)
+    var_plus = (n - 1.0) / n * within + between / n
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(var_plus / within)
+
+
+def split_rhat(draws):
+    """
+    Split potential scale reduction factor (Gelman et al., BDA3).
+
+    Each chain is cut in two halves, so the statistic also detects
+    chains that have not yet stabilised, even for a single chain.
+
+    input: draws -> array (n_chains, n_draws, n_params),
+                    (n_chains, n_draws) or (n_draws,)
+
+    output: array (n_params,) with R-hat of each parameter
+    """
+
+    draws = _as_chains(draws)
+    half = draws.shape[1] // 2
+    if half < 2:
+        return np.full(draws.shape[2], np.nan)
+
+    split = np.concatenate([draws[:, :half], draws[:, -half:]], axis=0)
+
+    return _rhat_from_moments(split.mean(axis=1), split.var(axis=1, ddof=1),
+                              half)
+
+
+def _batch_means_var(draws):
+    """
+    Variance of the sample mean of each chain and parameter, from the
+    spread of sqrt(n_draws) non-overlapping batch means.
+
+    input: draws -> array (n_chains, n_draws, n_params)
+
+    output: array (n_chains, n_params)
+    """
+
+    n_draws = draws.shape[1]
+    batch = max(1, int(np.sqrt(n_draws)))
+    n_batches = n_draws // batch
+    if n_batches < 2:
+        return np.full((draws.shape[0], draws.shape[2]), np.nan)
+
+    used = draws[:, n_draws - n_batches * batch:]
+    means = used.reshape(draws.shape[0], n_batches, batch, -1).mean(axis=2)
+    return means.var(axis=1, ddof=1) / n_batches
+
+
+def geweke_z(draws, first=0.1, last=0.5):
+    """
+    Geweke (1992) convergence score: difference between the means of the
+    first and last parts of each chain, in units of its standard error.
+    Variances of the means are estimated with batch means.
+
+    input: draws -> array (n_chains, n_draws, n_params),
+                    (n_chains, n_draws) or (n_draws,)
+           first -> fraction of the chain in the first window (default 0.1)
+           last -> fraction of the chain in the last window (default 0.5)
+
+    output: array (n_chains, n_params) of z-scores
+    """
+
+    draws = _as_chains(draws)
+    n_draws = draws.shape[1]
+    a = draws[:, :int(first * n_draws)]
+    b = draws[:, n_draws - int(last * n_draws):]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return ((a.mean(axis=1) - b.mean(axis=1)) /
+                np.sqrt(_batch_means_var(a) + _batch_means_var(b)))
+
+
+def _transient_end(draws, prob=0.05):
+    """
+    First draw from which every chain has entered the bulk of the last
+    half of the draws: the largest, over chains and parameters, index of
+    the first draw between the prob and 1 - prob quantiles of the pooled
+    last halves (n_draws if a chain never enters).
+
+    input: draws -> array (n_chains, n_draws, n_params)
+           prob -> tail probability left out of the bulk (default 0.05)
+
+    output: index of the draw
+    """
+
+    n_draws = draws.shape[1]
+    last = draws[:, n_draws // 2:].reshape(-1, draws.shape[2])
+    low, high = np.quantile(last, [prob, 1.0 - prob], axis=0)
+    inside = (draws >= low) & (draws <= high)
+    first = np.where(inside.any(axis=1), inside.argmax(axis=1), n_draws)
+    return int(first.max())
+
+
+def estimate_burn_in(draws, max_fraction=0.5, n_cuts=10, z_max=2.0,
+                     rhat_max=1.01):
+    """
+    Automatic burn-in estimate.
+
+    The initial transient ends at the first draw from which every chain
+    has entered the bulk (central 90%) of the last half of the
+    draws: a run started far out in the tail is cut there, however short
+    the transient is. From that draw on, candidate cutoffs (the draw
+    itself, then multiples of max_fraction / n_cuts of the chain) are
+    tried up to max_fraction of the chain; the first one after which the
+    remaining draws pass the test is returned. A single chain is tested
+    with the Geweke score (|z| < z_max for all parameters), several
+    chains with split R-hat (< rhat_max). If no cutoff passes, a warning
+    is issued and the end of the transient is returned.
+
+    input: draws -> array (n_chains, n_draws, n_params),
+                    (n_chains, n_draws) or (n_draws,)
+           max_fraction -> largest fraction of the chain that may be
+                           discarded (default 0.5)
+           n_cuts -> number of candidate cutoffs above zero (default 10)
+           z_max -> Geweke threshold (default 2)
+           rhat_max -> split R-hat threshold (default 1.01)
+
+    output: number of draws to discard at the start of each chain
+    """
+
+    draws = _as_chains(draws)
+    n_draws = draws.shape[1]
+    grid = np.linspace(0, max_fraction * n_draws, n_cuts + 1).astype(int)
+    transient = _transient_end(draws)
+    cuts = [cut for cut in [transient] + list(grid)
+            if transient <= cut <= grid[-1]]
+
+    for cut in cuts:
+        tail = draws[:, cut:]
+        if draws.shape[0] == 1:
+            passed = np.all(np.abs(geweke_z(tail)) < z_max)
+        else:
+            passed = np.all(split_rhat(tail) < rhat_max)
+        if passed:
+            return int(cut)
+
+    warnings.warn('no burn-in cutoff passed the convergence test; '
+                  'the chains may not have converged')
+    return int(min(transient, grid[-1]))
+
+
+def _merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """
+    Combine counts, means and sums of squared deviations of two sets
+    of draws (Chan et al., 1979).
+    """
+
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (n_b / float(n))
+    m2 = m2_a + m2_b + delta * delta * (n_a * n_b / float(n))
+    return n, mean, m2
+
+
+class OnlineDiagnostics(object):
+    """
+    Convergence diagnostics updated as draws arrive.
+
+    Running means and variances are kept with Welford/Chan updates. The
+    chains are also summarised by at most max_batches batch means (with
+    their sums of squares); when that many batches are full, adjacent
+    pairs are merged and the batch size doubles. This gives split R-hat
+    (first vs second half of the batches) and batch-means ESS at any
+    moment, in memory that does not grow with the number of draws.
+
+    input: n_chains -> number of chains
+           n_params -> number of parameters
+           max_batches -> even number of batches kept (default is 64)
+    """
+
+    def __init__(self, n_chains, n_params, max_batches=64):
+
+        if max_batches < 4 or max_batches % 2:
+            raise ValueError('max_batches must be an even number >= 4')
+
+        shape = (n_chains, n_params)
+        self.n_chains = n_chains
+        self.n_params = n_params
+        self.max_batches = max_batches
+        self.batch_size = 1
+        self.n_batches = 0
+        self.count = 0                        # draws per chain
+
+        self._mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+        self._batch_mean = np.zeros((max_batches,) + shape)
+        self._batch_m2 = np.zeros((max_batches,) + shape)
+        self._open_n = 0
+        self._open_mean = np.zeros(shape)
+        self._open_m2 = np.zeros(shape)
+
+    def update(self, draws):
+        """
+        Add new draws of every chain.
+
+        input: draws -> array (n_chains, n_params) with one draw per chain,
+                        or (n_chains, n_block, n_params) with n_block
+                        consecutive draws per chain
+        """
+
+        draws = np.asarray(draws, dtype=float)
+        if draws.ndim == 2:
+            draws = draws[:, None, :]
+        n_block = draws.shape[1]
+        if n_block == 0:
+            return self
+
+        self.count, self._mean, self._m2 = _merge_moments(
+            self.count, self._mean, self._m2, *self._moments(draws))
+
+        pos = 0
+        while pos < n_block:
+            take = min(self.batch_size - self._open_n, n_block - pos)
+            self._open_n, self._open_mean, self._open_m2 = _merge_moments(
+                self._open_n, self._open_mean, self._open_m2,
+                *self._moments(draws[:, pos:pos + take]))
+            pos += take
+            if self._open_n == self.batch_size:
+                self._close_batch()
+
+        return self
+
+    @staticmethod
+    def _moments(draws):
+        """Count, mean and sum of squared deviations along axis 1."""
+
+        mean = draws.mean(axis=1)
+        dev = draws - mean[:, None, :]
+        return draws.shape[1], mean, (dev * dev).sum(axis=1)
+
+    def _close_batch(self):
+        """Store the full open batch, halving the batches when needed."""
+
+        self._batch_mean[self.n_batches] = self._open_mean
+        self._batch_m2[self.n_batches] = self._open_m2
+        self.n_batches += 1
+        self._open_n = 0
+        self._open_mean = np.zeros_like(self._open_mean)
+        self._open_m2 = np.zeros_like(self._open_m2)
+
+        if self.n_batches == self.max_batches:
+            half = self.max_batches // 2
+            _, mean, m2 = _merge_moments(
+                self.batch_size, self._batch_mean[0::2], self._batch_m2[0::2],
+                self.batch_size, self._batch_mean[1::2], self._batch_m2[1::2])
+            self._batch_mean[:half] = mean
+            self._batch_m2[:half] = m2
+            self.n_batches = half
+            self.batch_size *= 2
+
+    def mean(self):
+        """Posterior mean of each parameter, pooling all chains."""
+
+        return self._mean.mean(axis=0)
+
+    def variance(self):
+        """Posterior variance of each parameter, pooling all chains."""
+
+        n_total = self.count * self.n_chains
+        if n_total < 2:
+            return np.full(self.n_params, np.nan)
+        dev = self._mean - self.mean()
+        m2 = self._m2.sum(axis=0) + self.count * (dev * dev).sum(axis=0)
+        return m2 / (n_total - 1.0)
+
+    def rhat(self):
+        """
+        Split R-hat of each parameter, from the first and second half of
+        the completed batches of every chain.
+        """
+
+        half = self.n_batches // 2
+        if half < 1 or half * self.batch_size < 2:
+            return np.full(self.n_params, np.nan)
+
+        n_half = half * self.batch_size
+        means = []
+        variances = []
+        for part in (slice(0, half), slice(half, 2 * half)):
+            batch_mean = self._batch_mean[part]
+            batch_m2 = self._batch_m2[part]
+            mean = batch_mean.mean(axis=0)
+            dev = batch_mean - mean
+            m2 = (batch_m2.sum(axis=0) +
+                  self.batch_size * (dev * dev).sum(axis=0))
+            means.append(mean)
+            variances.append(m2 / (n_half - 1.0))
+
+        return _rhat_from_moments(np.concatenate(means),
+                                  np.concatenate(variances), n_half)
+
+    def ess(self):
+        """
+        Batch-means effective sample size of each parameter, summed
+        over chains.
+        """
+
+        n_batches = self.n_batches
+        if n_batches < 2:
+            return np.full(self.n_params, np.nan)
+
+        batch_mean = self._batch_mean[:n_batches]
+        dev = batch_mean - batch_mean.mean(axis=(0, 1))
+        n_means = n_batches * self.n_chains
+        sigma2 = (self.batch_size * (dev * dev).sum(axis=(0, 1)) /
+                  (n_means - 1.0))
+
+        n_used = n_means * self.batch_size
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return n_used * self.variance() / sigma2
+
+    def summary(self):
+        """
+        Current state of all diagnostics.
+
+        output: dictionary with keywords n_draws (per chain), mean, sd,
+                rhat and ess (arrays of n_params)
+        """
+
+        return {'n_draws': self.count,
+                'mean': self.mean(),
+                'sd': np.sqrt(self.variance()),
+                'rhat': self.rhat(),
+                'ess': self.ess()}
+
+
+def _autocov(x):
+    """Biased autocovariance of each row of x, (n_chains, n_draws), by FFT."""
+
+    n = x.shape[1]
+    size = 2 ** int(np.ceil(np.log2(2 * n)))
+    dev = x - x.mean(axis=1, keepdims=True)
+    spec = np.fft.rfft(dev, size)
+    return np.fft.irfft(spec * np.conjugate(spec), size)[:, :n] / n
+
+
+def _ess_1d(x):
+    """
+    Effective sample size of one parameter, x of shape (n_chains, n_draws),
+    with Geyer's initial monotone sequence (Vehtari et al., 2021).
+    """
+
+    m, n = x.shape
+    if n < 4:
+        return np.nan
+
+    acov = _autocov(x)
+    mean_var = acov[:, 0].mean() * n / (n - 1.0)
+    var_plus = mean_var * (n - 1.0) / n
+    if m > 1:
+        var_plus += x.mean(axis=1).var(ddof=1)
+    if var_plus <= 0:
+        return np.nan
+
+    rho = 1.0 - (mean_var - acov.mean(axis=0)) / var_plus
+    rho[0] = 1.0
+
+    # sum pairs of autocorrelations while they stay positive ...
+    t = 1
+    while t < n - 2 and rho[t + 1] + rho[t + 2] >= 0:
+        t += 2
+    max_t = t
+    pairs = rho[:max_t + 1:2] + rho[1:max_t + 1:2]
+
+    # ... and force them to be monotone
+    pairs = np.minimum.accumulate(pairs)
+
+    tau = max(-1.0 + 2.0 * pairs.sum(), 1.0 / np.log10(m * n))
+    return m * n / tau
+
+
+def ess(draws):
+    """
+    Effective sample size of each parameter, from the autocorrelations
+    of all chains (Geyer initial monotone sequence estimator).
+
+    input: draws -> array (n_chains, n_draws, n_params),
+                    (n_chains, n_draws) or (n_draws,)
+
+    output: array (n_params,)
+    """
+
+    draws = _as_chains(draws)
+    return np.array([_ess_1d(draws[:, :, k]) for k in range(draws.shape[2])])
+
+
+def _split_chains(draws):
+    """Cut each chain in two halves: (2 n_chains, n_draws // 2, n_params)."""
+
+    half = draws.shape[1] // 2
+    return np.concatenate([draws[:, :half], draws[:, -half:]], axis=0)
+
+
+def _rank_normalize(draws):
+    """Normal scores of the ranks of all draws, parameter by parameter."""
+
+    ranks = rankdata(draws.reshape(-1, draws.shape[2]), axis=0)
+    n_total = ranks.shape[0]
+    return ndtri((ranks - 0.375) / (n_total + 0.25)).reshape(draws.shape)
+
+
+def bulk_ess(draws):
+    """
+    Bulk effective sample size: ESS of the rank-normalized split chains
+    (Vehtari et al., 2021).
+
+    input: draws -> array (n_chains, n_draws, n_params),
+                    (n_chains, n_draws) or (n_draws,)
+
+    output: array (n_params,)
+    """
+
+    return ess(_rank_normalize(_split_chains(_as_chains(draws))))
+
+
+def tail_ess(draws, prob=0.05):
+    """
+    Tail effective sample size: smallest ESS of the indicators of the
+    prob and 1 - prob quantiles, on split chains (Vehtari et al., 2021).
+
+    input: draws -> array (n_chains, n_draws, n_params),
+                    (n_chains, n_draws) or (n_draws,)
+           prob -> tail probability (default is 0.05)
+
+    output: array (n_params,)
+    """
+
+    split = _split_chains(_as_chains(draws))
+    flat = split.reshape(-1, split.shape[2])
+    lower = split <= np.quantile(flat, prob, axis=0)
+    upper = split <= np.quantile(flat, 1.0 - prob, axis=0)
+    return np.minimum(ess(lower), ess(upper))
+
+
+def rank_rhat(draws):
+    """
+    Rank-normalized split R-hat: the largest of the split R-hat of the
+    rank-normalized draws and of their folded version (Vehtari et al.,
+    2021), which also detects differences in scale between chains.
+
+    input: draws -> array (n_chains, n_draws, n_params),
+                    (n_chains, n_draws) or (n_draws,)
+
+    output: array (n_params,)
+    """
+
+    draws = _as_chains(draws)
+    folded = np.abs(draws - np.median(draws.reshape(-1, draws.shape[2]),
+                                      axis=0))
+    return np.maximum(split_rhat(_rank_normalize(draws)),
+                      split_rhat(_rank_normalize(folded)))
@@ -0,0 +1,262 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Persistent, column-oriented storage of posterior draws.
+
+A store is a directory holding one raw binary file per variable and
+chain, <variable>.<chain>.bin, with the draws of that chain one after
+the other (C order, draw index first), and a small JSON header,
+meta.json, listing for every variable the shape of one draw and the
+dtype, plus the number of chains, the thinning interval and the number
+of draws written to each chain.
+
+Draws are appended chunk by chunk, so a long run can be written while it
+goes; the header is updated (atomically) only after the data of a chunk
+is on disk, so an interrupted append never exposes partial draws.
+Reading a variable maps its files with numpy.memmap: loading 'beta' from
+a multi-GB store touches only the beta files and costs milliseconds.
+"""
+
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+HEADER = 'meta.json'
+
+
+def _element_names(name, shape):
+    """Column names of a variable, as in JAGS: beta[1], beta[2], ..."""
+
+    n_cols = int(np.prod(shape))
+    if n_cols == 1:
+        return [name]
+    return [name + '[' + str(k + 1) + ']' for k in range(n_cols)]
+
+
+def group_columns(names):
+    """
+    Group column names into variables: ['beta[1]', 'beta[2]', 'sigma'] ->
+    [('beta', (2,), [0, 1]), ('sigma', (), [2])].
+
+    input: names -> list of column names
+
+    output: list of (variable, shape of one draw, column indices)
+    """
+
+    groups = []
+    for k, name in enumerate(names):
+        base = name.split('[')[0]
+        if groups and groups[-1][0] == base and base != name:
+            groups[-1][2].append(k)
+        else:
+            groups.append((base, None, [k]))
+    return [(base, () if names[cols[0]] == base else (len(cols),), cols)
+            for base, _, cols in groups]
+
+
+class DrawsStore(object):
+    """
+    Open an existing store of draws.
+
+    input: path -> directory of the store
+
+    Use DrawsStore.create to start a new one.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        with open(os.path.join(path, HEADER)) as f:
+            self.meta = json.load(f)
+
+    @classmethod
+    def create(cls, path, variables, n_chains, thin=1, dtype=float):
+        """
+        Create an empty store.
+
+        input: path -> directory of the store (created if needed; an
+                       existing store there is overwritten)
+               variables -> ordered list of (name, shape of one draw) pairs,
+                            e.g. [('beta', (4,)), ('sigma', ())]
+               n_chains -> number of chains
+               thin -> thinning interval of the stored draws (default is 1)
+               dtype -> numpy dtype of the draws (default is float64)
+
+        output: DrawsStore
+        """
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        meta = {'n_chains': int(n_chains),
+                'thin': int(thin),
+                'n_draws': [0] * int(n_chains),
+                'variables': [{'name': name,
+                               'shape': [int(d) for d in
+                                         np.atleast_1d(shape)],
+                               'dtype': np.dtype(dtype).str}
+                              for name, shape in variables]}
+
+        # start every column file empty
+        for var in meta['variables']:
+            for chain in range(meta['n_chains']):
+                path_k = cls._column_file(path, var['name'], chain)
+                open(path_k, 'wb').close()
+
+        store = cls.__new__(cls)
+        store.path = path
+        store.meta = meta
+        store._write_header()
+        return store
+
+    @staticmethod
+    def _column_file(path, name, chain):
+        return os.path.join(path, name + '.' + str(chain) + '.bin')
+
+    def _write_header(self):
+        """Replace the header atomically."""
+
+        handle, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(handle, 'w') as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, HEADER))
+
+    @property
+    def n_chains(self):
+        return self.meta['n_chains']
+
+    @property
+    def thin(self):
+        return self.meta['thin']
+
+    @property
+    def variables(self):
+        """Names of the stored variables, in order."""
+
+        return [var['name'] for var in self.meta['variables']]
+
+    @property
+    def names(self):
+        """Column names of all variables, e.g. beta[1], ..., sigma."""
+
+        names = []
+        for var in self.meta['variables']:
+            names.extend(_element_names(var['name'], var['shape']))
+        return names
+
+    def n_draws(self, chain=0):
+        """Number of draws written to a chain."""
+
+        return self.meta['n_draws'][chain]
+
+    def _variable(self, name):
+        for var in self.meta['variables']:
+            if var['name'] == name:
+                return var
+        raise KeyError(name)
+
+    def append(self, chain, draws):
+        """
+        Write a chunk of consecutive draws of one chain.
+
+        input: chain -> chain number
+               draws -> dictionary {variable: array (n, *shape)} with the
+                        same number n of new draws for every variable
+        """
+
+        if set(draws) != set(self.variables):
+            raise ValueError('a chunk must hold every variable of the store')
+
+        n_new = None
+        for var in self.meta['variables']:
+            values = np.asarray(draws[var['name']], dtype=var['dtype'])
+            values = values.reshape((-1,) + tuple(var['shape']))
+            if n_new is None:
+                n_new = values.shape[0]
+            elif values.shape[0] != n_new:
+                raise ValueError('all variables need the same number '
+                                 'of draws')
+
+            row_bytes = (int(np.prod(var['shape'])) *
+                         np.dtype(var['dtype']).itemsize)
+            with open(self._column_file(self.path, var['name'], chain),
+                      'r+b') as f:
+                # overwrite anything left by an interrupted append
+                f.seek(self.meta['n_draws'][chain] * row_bytes)
+                f.write(np.ascontiguousarray(values).tobytes())
+                f.truncate()
+
+        self.meta['n_draws'][chain] += n_new
+        self._write_header()
+
+    def extend(self, draws):
+        """
+        Write a chunk of draws of every chain.
+
+        input: draws -> dictionary {variable: array (n_chains, n, *shape)}
+        """
+
+        for chain in range(self.n_chains):
+            self.append(chain, dict((name, values[chain])
+                                    for name, values in draws.items()))
+
+    def truncate(self, n_draws):
+        """
+        Forget the draws of every chain after the first n_draws (e.g. those
+        written after the last checkpoint of an interrupted run); they are
+        overwritten by the next append.
+        """
+
+        self.meta['n_draws'] = [min(n, int(n_draws))
+                                for n in self.meta['n_draws']]
+        self._write_header()
+
+    def load(self, name, chain=None):
+        """
+        Draws of one variable, read through memory maps.
+
+        input: name -> variable name
+               chain -> chain number; if None all chains are returned,
+                        stacked (which reads the variable into memory)
+
+        output: read-only array (n, *shape) for one chain, or
+                (n_chains, n, *shape) for all chains
+        """
+
+        var = self._variable(name)
+        if chain is None:
+            return np.stack([self.load(name, k)
+                             for k in range(self.n_chains)])
+
+        shape = (self.meta['n_draws'][chain],) + tuple(var['shape'])
+        if shape[0] == 0:
+            return np.empty(shape, dtype=var['dtype'])
+        return np.memmap(self._column_file(self.path, name, chain),
+                         dtype=var['dtype'], mode='r', shape=shape)
+
+
+def save_draws(posterior, path, thin=1, block_size=100000):
+    """
+    Write the draws of a fit_runner.Posterior to a new store.
+
+    input: posterior -> fit_runner.Posterior
+           path -> directory of the store
+           thin -> thinning interval recorded in the header (default is 1)
+           block_size -> number of draws written at a time per chain
+
+    output: DrawsStore
+    """
+
+    variables = [(var, shape) for var, shape, _ in
+                 group_columns(posterior.names)]
+
+    store = DrawsStore.create(path, variables, posterior.n_chains, thin)
+    for first in range(0, posterior.n_draws, block_size):
+        block = slice(first, first + block_size)
+        store.extend(dict((var, posterior[var][:, block])
+                          for var, _ in variables))
+    return store
@@ -0,0 +1,276 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Run MCMC until the draws are good enough, instead of for a fixed number
+of iterations.
+
+Draws are produced in chunks by a resumable sampler; after each chunk
+the bulk and tail effective sample sizes and the rank-normalized R-hat
+of the monitored parameters are recomputed, and sampling stops as soon
+as all of them pass the thresholds, or when a hard cap is reached.
+
+A resumable sampler is any object with a method draw(n) returning
+(names, draws): the list of column names and an array
+(n_chains, n, n_columns) with n new draws per chain, continuing from
+where the previous call stopped. Adapters are provided for the Day_1
+Metropolis-Hastings sampler, pystan models and pyjags models.
+"""
+
+
+import warnings
+
+import numpy as np
+
+from chain_store import ChainStore
+from diagnostics import bulk_ess, rank_rhat, tail_ess
+from draws_store import DrawsStore, group_columns
+from mcmc import metropolis_hastings_chains
+
+
+class MetropolisHastingsChunks(object):
+    """
+    mcmc.metropolis_hastings_chains run chunk by chunk. The first chunk
+    starts with n_warmup adaptive steps; later chunks restart from the
+    last state of every chain with the frozen proposal widths and the
+    same random generator.
+
+    input: log_target -> vectorized log-density, array (m, n_params) -> (m,)
+           start -> starting points, array (n_chains, n_params) or a single
+                    point shared by all chains
+           n_chains -> number of chains
+           proposal_width -> initial width of the random-walk step
+           n_warmup -> number of adaptive steps (default is 1000)
+           names -> parameter names (default is theta[0], theta[1], ...)
+           seed -> int, numpy.random.Generator or None
+    """
+
+    def __init__(self, log_target, start, n_chains, proposal_width=1.0,
+                 n_warmup=1000, names=None, seed=None):
+
+        self.log_target = log_target
+        self.state = start
+        self.n_chains = n_chains
+        self.proposal_width = proposal_width
+        self.n_warmup = n_warmup
+        self.names = names
+        self.rng = np.random.default_rng(seed)
+
+    def draw(self, n):
+        # burn-in is handled by the warm-up; skip its per-chunk estimate
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            out = metropolis_hastings_chains(
+                self.log_target, self.state, n, self.n_chains,
+                proposal_width=self.proposal_width, n_warmup=self.n_warmup,
+                seed=self.rng)
+
+        draws = np.array(out['chains'])
+        self.state = draws[:, -1]
+        self.proposal_width = out['proposal_width']
+        self.n_warmup = 0
+
+        if self.names is None:
+            self.names = ['theta[' + str(k) + ']'
+                          for k in range(draws.shape[2])]
+        return self.names, draws
+
+
+class StanChunks(object):
+    """
+    pystan (2.19+) model sampled chunk by chunk. The first chunk includes
+    the usual warm-up; later chunks restart every chain from its last
+    position with adaptation switched off, reusing the adapted step size
+    (averaged over chains, as pystan takes a single value) and inverse
+    metric.
+
+    input: model -> compiled pystan.StanModel
+           data -> data dictionary
+           n_chains -> number of chains (default is 4)
+           n_warmup -> number of warm-up iterations (default is 1000)
+           pars -> parameters to keep (default is all)
+           seed -> int or None
+           other keywords are passed to model.sampling
+    """
+
+    def __init__(self, model, data, n_chains=4, n_warmup=1000, pars=None,
+                 seed=None, **kwargs):
+
+        self.model = model
+        self.data = data
+        self.n_chains = n_chains
+        self.n_warmup = n_warmup
+        self.pars = pars
+        self.seeds = np.random.SeedSequence(seed)
+        self.kwargs = kwargs
+        self.fit = None
+
+    def _next_seed(self):
+        return int(self.seeds.spawn(1)[0].generate_state(1)[0] % 2 ** 31)
+
+    def draw(self, n):
+        kwargs = dict(self.kwargs)
+        if self.pars is not None:
+            kwargs['pars'] = self.pars
+
+        if self.fit is None:
+            fit = self.model.sampling(data=self.data, chains=self.n_chains,
+                                      iter=self.n_warmup + n,
+                                      warmup=self.n_warmup,
+                                      seed=self._next_seed(), **kwargs)
+        else:
+            control = dict(kwargs.pop('control', {}))
+            control['adapt_engaged'] = False
+            control['stepsize'] = float(np.mean(self.fit.get_stepsize()))
+            control['inv_metric'] = dict(enumerate(self.fit.get_inv_metric()))
+            fit = self.model.sampling(data=self.data, chains=self.n_chains,
+                                      iter=n, warmup=0,
+                                      init=self.fit.get_last_position(),
+                                      control=control,
+                                      seed=self._next_seed(), **kwargs)
+        self.fit = fit
+
+        # (n, n_chains, n_columns) -> (n_chains, n, n_columns)
+        draws = fit.extract(permuted=False, inc_warmup=False)
+        names = list(fit.flatnames) + ['lp__']
+        return names, np.transpose(draws, (1, 0, 2))
+
+
+def jags_names(samples):
+    """
+    Column names of a pyjags samples dictionary, {name: array (*dims, n,
+    n_chains)}, in the order of jags_to_chains. Columns of vector nodes
+    are named as in JAGS, e.g. beta[1], beta[2].
+
+    input: samples -> dictionary returned by pyjags.Model.sample
+
+    output: list of column names
+    """
+
+    names = []
+    for var in sorted(samples):
+        n_cols = int(np.prod(np.shape(samples[var])[:-2]))
+        if n_cols == 1:
+            names.append(var)
+        else:
+            names.extend(var + '[' + str(k + 1) + ']' for k in range(n_cols))
+    return names
+
+
+def jags_to_chains(samples):
+    """
+    Flatten a pyjags samples dictionary, {name: array (*dims, n, n_chains)},
+    into column names and one array (n_chains, n, n_columns).
+
+    input: samples -> dictionary returned by pyjags.Model.sample
+
+    output: (names, draws)
+    """
+
+    columns = []
+    for var in sorted(samples):
+        values = np.asarray(samples[var])
+        n_cols = int(np.prod(values.shape[:-2]))
+        columns.append(values.reshape((n_cols,) + values.shape[-2:]))
+
+    # (n_columns, n, n_chains) -> (n_chains, n, n_columns)
+    draws = np.transpose(np.concatenate(columns, axis=0), (2, 1, 0))
+    return jags_names(samples), draws
+
+
+class JagsChunks(object):
+    """
+    pyjags model sampled chunk by chunk. JAGS keeps the state of its
+    chains between calls, so every chunk simply continues them; the
+    first call runs n_warmup burn-in iterations that are not monitored.
+
+    input: model -> pyjags.Model
+           vars -> names of the monitored nodes
+           n_warmup -> number of burn-in iterations (default is 1000)
+    """
+
+    def __init__(self, model, vars, n_warmup=1000):
+
+        self.model = model
+        self.vars = list(vars)
+        self.n_warmup = n_warmup
+
+    def draw(self, n):
+        if self.n_warmup:
+            self.model.update(self.n_warmup)
+            self.n_warmup = 0
+
+        return jags_to_chains(self.model.sample(n, vars=self.vars))
+
+
+def run_until_converged(sampler, min_bulk_ess=400, min_tail_ess=400,
+                        max_rhat=1.01, chunk_size=1000, max_draws=100000,
+                        params=None, verbose=True, draws_path=None):
+    """
+    Draw chunks from a resumable sampler until every monitored parameter
+    has bulk ESS >= min_bulk_ess, tail ESS >= min_tail_ess and
+    rank-normalized R-hat <= max_rhat, or max_draws draws per chain
+    have been made.
+
+    input: sampler -> object with a draw(n) method returning
+                      (names, array (n_chains, n, n_columns)),
+                      e.g. MetropolisHastingsChunks, StanChunks, JagsChunks
+           min_bulk_ess, min_tail_ess -> ESS thresholds (default is 400)
+           max_rhat -> R-hat threshold (default is 1.01)
+           chunk_size -> draws per chain between checks (default is 1000)
+           max_draws -> hard cap on draws per chain (default is 100000)
+           params -> names of the monitored columns (default is all)
+           verbose -> print the diagnostics after each chunk
+           draws_path -> if given, every chunk is also appended to a
+                         draws_store.DrawsStore in this directory, so the
+                         draws survive the process
+
+    output: dictionary with keywords
+                names -> list of column names
+                draws -> read-only array (n_chains, n_draws, n_columns)
+                monitored -> names of the monitored columns
+                bulk_ess, tail_ess, rhat -> arrays over monitored columns
+                converged -> True if the thresholds were reached
+    """
+
+    store = None
+    while store is None or len(store) < max_draws:
+        n_new = min(chunk_size,
+                    max_draws - (0 if store is None else len(store)))
+        names, draws = sampler.draw(n_new)
+
+        if store is None:
+            store = ChainStore(max_draws, (draws.shape[0], draws.shape[2]))
+            monitored = list(names) if params is None else list(params)
+            cols = [names.index(name) for name in monitored]
+            if draws_path is not None:
+                groups = group_columns(names)
+                disk = DrawsStore.create(
+                    draws_path, [(var, shape) for var, shape, _ in groups],
+                    draws.shape[0])
+        store.extend(np.transpose(draws, (1, 0, 2)))
+        if draws_path is not None:
+            disk.extend(dict((var, draws[:, :, idx].reshape(
+                draws.shape[:2] + shape)) for var, shape, idx in groups))
+
+        kept = store.view().transpose(1, 0, 2)[:, :, cols]
+        bulk = bulk_ess(kept)
+        tail = tail_ess(kept)
+        rhat = rank_rhat(kept)
+        converged = bool(np.all(bulk >= min_bulk_ess) and
+                         np.all(tail >= min_tail_ess) and
+                         np.all(rhat <= max_rhat))
+
+        if verbose:
+            print('{:>8} draws per chain: min bulk ESS = {:.0f}, '
+                  'min tail ESS = {:.0f}, max R-hat = {:.3f}'.format(
+                      len(store), np.min(bulk), np.min(tail), np.max(rhat)))
+        if converged:
+            break
+
+    return {'names': names,
+            'draws': store.view().transpose(1, 0, 2),
+            'monitored': monitored,
+            'bulk_ess': bulk,
+            'tail_ess': tail,
+            'rhat': rhat,
+            'converged': converged}
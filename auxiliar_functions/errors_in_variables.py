@@ -0,0 +1,172 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Linear regression with measurement errors in both variables (Day_2
+Ex1_Errors_in_measurements and Ex2_M_sigma), with the latent true values
+optionally integrated out.
+
+The model is
+
+    x_i ~ normal(x_mean, x_sd)          (flat if x_sd is None)
+    obsx_i ~ normal(x_i, errx_i)
+    y_i ~ normal(alpha + beta x_i, epsilon)
+    obsy_i ~ normal(y_i, erry_i)
+
+Sampled as written it has 2N + 3 parameters. Every latent variable is
+Gaussian, so they can be integrated out exactly:
+
+    marginalize='y': obsy_i ~ normal(alpha + beta x_i,
+                                     sqrt(epsilon^2 + erry_i^2)),
+                     N + 3 parameters;
+    marginalize='xy': given obsx_i, x_i ~ normal(xhat_i, sqrt(vx_i)), with
+                      xhat_i = obsx_i and vx_i = errx_i^2 for a flat prior
+                      (otherwise the usual normal-normal update), and
+                      obsy_i ~ normal(alpha + beta xhat_i,
+                                      sqrt(beta^2 vx_i + epsilon^2 +
+                                           erry_i^2)),
+                      3 parameters.
+
+The posterior of (alpha, beta, epsilon) is the same in all three cases.
+"""
+
+
+import numpy as np
+from scipy.special import expit
+
+from glm import _beta_prior, _positive
+
+
+class ErrorsInVariablesModel(object):
+    """
+    Errors-in-variables linear model for hmc.nuts (see glm for the
+    log_density_grad / constrain / initial_point interface).
+
+    theta = (alpha, beta, log epsilon [or logit(epsilon / sigma_max)],
+    x[1..N] unless marginalize is 'xy', y[1..N] if marginalize is None).
+
+    input: obsx, errx -> observed x and their uncertainties, arrays (N,)
+           obsy, erry -> observed y and their uncertainties, arrays (N,)
+           marginalize -> None, 'y' or 'xy': latent values integrated out
+                          (default is 'xy')
+           prior_sd -> sd of the normal priors on alpha and beta
+                       (default is None: flat)
+           sigma_max -> upper bound of the flat prior on epsilon
+                        (default is None)
+           x_mean, x_sd -> normal prior on the true x (default is flat)
+           names -> names of (alpha, beta, epsilon)
+                    (default is ('alpha', 'beta', 'epsilon'))
+    """
+
+    def __init__(self, obsx, errx, obsy, erry, marginalize='xy',
+                 prior_sd=None, sigma_max=None, x_mean=0.0, x_sd=None,
+                 names=('alpha', 'beta', 'epsilon')):
+
+        if marginalize not in (None, 'y', 'xy'):
+            raise ValueError("marginalize must be None, 'y' or 'xy'")
+
+        self.obsx = np.asarray(obsx, dtype=float)
+        self.obsy = np.asarray(obsy, dtype=float)
+        self.varx = np.asarray(errx, dtype=float) ** 2
+        self.vary = np.asarray(erry, dtype=float) ** 2
+        self.marginalize = marginalize
+        self.prior_sd = prior_sd
+        self.sigma_max = sigma_max
+        self.x_mean = x_mean
+        self.x_sd = x_sd
+
+        n = self.obsx.shape[0]
+        self.names = list(names)
+        if marginalize != 'xy':
+            self.names.extend('x[' + str(k + 1) + ']' for k in range(n))
+        if marginalize is None:
+            self.names.extend('y[' + str(k + 1) + ']' for k in range(n))
+        self.n_params = len(self.names)
+
+        # x given obsx, for marginalize='xy'
+        if x_sd is None:
+            self.xhat, self.vx = self.obsx, self.varx
+        else:
+            k = x_sd ** 2 / (x_sd ** 2 + self.varx)
+            self.xhat = x_mean + k * (self.obsx - x_mean)
+            self.vx = k * self.varx
+
+    def _x_terms(self, x):
+        """Log-prior and measurement term of the true x, and gradient."""
+
+        resid = self.obsx - x
+        lp = -0.5 * (resid * resid / self.varx).sum(axis=-1)
+        grad = resid / self.varx
+        if self.x_sd is not None:
+            dev = (x - self.x_mean) / self.x_sd
+            lp = lp - 0.5 * (dev * dev).sum(axis=-1)
+            grad = grad - dev / self.x_sd
+        return lp, grad
+
+    def log_density_grad(self, theta):
+        alpha, beta, u = theta[..., 0], theta[..., 1], theta[..., 2]
+        eps, log_jac, dlog_jac = _positive(u, self.sigma_max)
+        dlogeps_du = dlog_jac if self.sigma_max is None else \
+            1.0 - expit(u)
+        a_, b_, eps_ = alpha[..., None], beta[..., None], eps[..., None]
+
+        prior, dprior = _beta_prior(theta[..., :2], self.prior_sd)
+        lp = prior + log_jac
+        grad = np.zeros_like(theta, dtype=float)
+        grad[..., :2] += dprior
+
+        if self.marginalize == 'xy':
+            # obsy ~ normal(alpha + beta xhat, sqrt(beta^2 vx + eps^2 + vary))
+            var = b_ * b_ * self.vx + eps_ * eps_ + self.vary
+            resid = self.obsy - a_ - b_ * self.xhat
+            z = resid / var
+            excess = (resid * z - 1.0) / var
+            lp = lp - 0.5 * (np.log(var) + resid * z).sum(axis=-1)
+            grad[..., 0] += z.sum(axis=-1)
+            grad[..., 1] += (z * self.xhat +
+                             b_ * self.vx * excess).sum(axis=-1)
+            deps = (eps_ * excess).sum(axis=-1)
+            grad[..., 2] += deps * eps * dlogeps_du + dlog_jac
+            return lp, grad
+
+        n = self.obsx.shape[0]
+        x = theta[..., 3:3 + n]
+        lp_x, grad_x = self._x_terms(x)
+        lp = lp + lp_x
+        grad[..., 3:3 + n] = grad_x
+
+        if self.marginalize == 'y':
+            # obsy ~ normal(alpha + beta x, sqrt(eps^2 + vary))
+            var = eps_ * eps_ + self.vary
+            resid = self.obsy - a_ - b_ * x
+            z = resid / var
+            lp = lp - 0.5 * (np.log(var) + resid * z).sum(axis=-1)
+            deps = (eps_ * (resid * z - 1.0) / var).sum(axis=-1)
+        else:
+            y = theta[..., 3 + n:]
+            resid = y - a_ - b_ * x
+            z = resid / (eps_ * eps_)
+            resid_y = self.obsy - y
+            lp = lp - n * np.log(eps) - 0.5 * (
+                (resid * z).sum(axis=-1) +
+                (resid_y * resid_y / self.vary).sum(axis=-1))
+            deps = ((resid * z).sum(axis=-1) - n) / eps
+            grad[..., 3 + n:] = resid_y / self.vary - z
+
+        grad[..., 0] += z.sum(axis=-1)
+        grad[..., 1] += (z * x).sum(axis=-1)
+        grad[..., 2] += deps * eps * dlogeps_du + dlog_jac
+        grad[..., 3:3 + n] += b_ * z
+        return lp, grad
+
+    def constrain(self, theta):
+        out = np.array(theta, dtype=float)
+        out[..., 2] = _positive(out[..., 2], self.sigma_max)[0]
+        return out
+
+    def initial_point(self):
+        theta = [0.0, 0.0, 0.0]
+        if self.marginalize != 'xy':
+            theta.extend(self.obsx)
+        if self.marginalize is None:
+            theta.extend(self.obsy)
+        return np.array(theta)
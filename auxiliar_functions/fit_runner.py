@@ -0,0 +1,487 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+One entry point for fitting a model with Stan, JAGS or one of the
+in-process samplers of this package.
+
+A run is described by a plain dictionary, e.g.
+
+    config = {'backend': 'stan',
+              'model': stan_code,
+              'data': data,
+              'n_chains': 3,
+              'n_warmup': 2500,
+              'n_samples': 2500,
+              'options': {'n_jobs': 3}}
+    posterior = run_fit(config)
+    posterior.summary(['beta0', 'beta1', 'sigma'])
+
+and every backend returns the same Posterior container. Summaries are
+computed only for the parameters asked for, instead of formatting the
+full str(fit) table of every generated quantity.
+
+Configuration keywords:
+    backend -> 'stan', 'jags' or 'numpy' (see BACKENDS)
+    model -> Stan or JAGS program, or for 'numpy' either a model object
+             with log_density_grad (e.g. glm.GaussianGLM, sampled with
+             hmc.nuts, or exactly with its sample_exact method if its
+             conjugate attribute is true, as regression.LinearRegression,
+             or with its sample_gibbs or sample_sgmcmc method if it has
+             one, as polya_gamma.PolyaGammaLogit or
+             sgmcmc.MinibatchLogit) or a vectorized log-target
+             (sampled with mcmc.metropolis_hastings_chains)
+    data -> data dictionary (not used by 'numpy')
+    pars -> names of the monitored parameters (default is all for Stan,
+            required for JAGS)
+    n_chains -> number of chains (default is 3)
+    n_warmup -> warm-up / burn-in iterations per chain (default is 1000)
+    n_samples -> stored draws per chain (default is 1000)
+    thin -> thinning interval (default is 1)
+    seed -> int or None
+    options -> dictionary of backend-specific keywords; for 'jags',
+               n_jobs runs the chains in that many processes
+               (parallel.run_parallel_jags), as n_jobs does for pystan
+    draws_path -> if given, the draws are also saved there as a
+                  draws_store.DrawsStore, readable later with
+                  Posterior.from_store(draws_path); the 'jags' backend
+                  then samples in checkpointed chunks
+                  (jags_checkpoint.CheckpointedJagsRun), so running the
+                  same configuration again resumes or extends the run;
+                  a smaller n_samples returns the first n_samples
+                  stored draws of each chain
+"""
+
+
+import numpy as np
+
+from diagnostics import bulk_ess, rank_rhat
+
+
+DEFAULTS = {'data': None,
+            'pars': None,
+            'n_chains': 3,
+            'n_warmup': 1000,
+            'n_samples': 1000,
+            'thin': 1,
+            'seed': None,
+            'options': None,
+            'draws_path': None}
+
+
+class Posterior(object):
+    """
+    Draws of a fitted model, whatever the backend.
+
+    Variables are extracted on first use and cached; posterior['beta'] and
+    posterior.get('beta', chain=0, index=2) hand out NumPy views of the
+    cached arrays, so repeated access never copies draws. Use
+    Posterior.from_stan and Posterior.from_jags to wrap existing pystan
+    fits and pyjags sample dictionaries, and Posterior.from_store to read
+    draws saved on disk.
+
+    input: names -> list of column names, e.g. ['beta[1]', 'beta[2]', 'sigma']
+           draws -> array (n_chains, n_draws, n_columns), or a callable
+                    returning it, called on first use
+           source -> native output of the backend (pystan fit, pyjags
+                     samples dictionary or sampler output dictionary)
+    """
+
+    def __init__(self, names, draws, source=None):
+
+        self.names = list(names)
+        self._draws = draws
+        self.source = source
+        self._loader = None
+        self._vars = {}
+        self._stats = {}
+
+    @classmethod
+    def from_stan(cls, fit):
+        """
+        Posterior of a pystan fit. All draws are extracted in one call
+        of fit.extract, the first time a variable is accessed; variables
+        are views of column blocks of that array.
+        """
+
+        return cls(list(fit.flatnames) + ['lp__'],
+                   lambda: stan_draws(fit)[1], source=fit)
+
+    @classmethod
+    def from_jags(cls, samples):
+        """
+        Posterior of a pyjags samples dictionary, {name: array (*dims, n,
+        n_chains)}. Variables are views of the dictionary arrays, with
+        chains and draws moved to the first two axes; nothing is copied
+        unless the full (n_chains, n_draws, n_columns) array is needed.
+        """
+
+        from early_stopping import jags_names, jags_to_chains
+
+        def load(name):
+            if name in samples:
+                # (*dims, n_draws, n_chains) -> (n_chains, n_draws, *dims)
+                return np.moveaxis(np.asarray(samples[name]), (-1, -2),
+                                   (0, 1))
+
+        posterior = cls(jags_names(samples),
+                        lambda: jags_to_chains(samples)[1], source=samples)
+        posterior._loader = load
+        return posterior
+
+    @classmethod
+    def from_store(cls, store, n_draws=None):
+        """
+        Posterior read from a draws_store.DrawsStore (or the path of one).
+        Each variable is read from its own files on first access; only
+        the first n_draws draws of each chain are read if n_draws is
+        given (default is all of them).
+        """
+
+        from draws_store import DrawsStore
+
+        if not isinstance(store, DrawsStore):
+            store = DrawsStore(store)
+        n = store.n_draws() if n_draws is None else \
+            min(n_draws, store.n_draws())
+
+        def load(name):
+            if name in store.variables:
+                return np.stack([store.load(name, k)[:n]
+                                 for k in range(store.n_chains)])
+
+        def load_all():
+            return np.concatenate(
+                [load(name).reshape(store.n_chains, n, -1)
+                 for name in store.variables], axis=2)
+
+        posterior = cls(store.names, load_all, source=store)
+        posterior._loader = load
+        return posterior
+
+    @property
+    def draws(self):
+        """All columns, array (n_chains, n_draws, n_columns)."""
+
+        if callable(self._draws):
+            self._draws = self._draws()
+        self._draws = np.asarray(self._draws)
+        return self._draws
+
+    @property
+    def n_chains(self):
+        return self._column(0).shape[0]
+
+    @property
+    def n_draws(self):
+        return self._column(0).shape[1]
+
+    def columns(self, params=None):
+        """
+        Indices of the columns of params. A name selects either the column
+        of that name or, for a vector node such as 'beta', all of its
+        elements 'beta[1]', 'beta[2]', ...
+
+        input: params -> name or list of names (default is all columns)
+
+        output: list of column indices
+        """
+
+        if params is None:
+            return list(range(len(self.names)))
+        if isinstance(params, str):
+            params = [params]
+
+        cols = []
+        for name in params:
+            if name in self.names:
+                cols.append(self.names.index(name))
+                continue
+            found = [k for k, col in enumerate(self.names)
+                     if col.startswith(name + '[')]
+            if not found:
+                raise KeyError(name)
+            cols.extend(found)
+        return cols
+
+    def _variable(self, name):
+        """Extract one variable, as a view whenever possible."""
+
+        values = None if self._loader is None else self._loader(name)
+        if values is not None:
+            if values.ndim > 3:
+                values = values.reshape(values.shape[:2] + (-1,))
+            if values.ndim == 3 and values.shape[2] == 1 and \
+                    name in self.names:
+                values = values[:, :, 0]
+            return values
+
+        cols = self.columns(name)
+        if name in self.names:
+            return self.draws[:, :, cols[0]]
+        if cols == list(range(cols[0], cols[-1] + 1)):
+            return self.draws[:, :, cols[0]:cols[-1] + 1]
+        return self.draws[:, :, cols]
+
+    def __getitem__(self, name):
+        """
+        Draws of one parameter: array (n_chains, n_draws) for a scalar,
+        (n_chains, n_draws, n_elements) for a vector node.
+        """
+
+        if name not in self._vars:
+            self._vars[name] = self._variable(name)
+        return self._vars[name]
+
+    def get(self, name, chain=None, draws=None, index=None):
+        """
+        Slice of the draws of one parameter, as a view.
+
+        input: name -> parameter name, e.g. 'sigma' or 'beta'
+               chain -> chain number or slice (default is all chains;
+                        an integer drops the chain axis)
+               draws -> slice of draws, e.g. slice(-100, None) (default
+                        is all)
+               index -> element of a vector node, counted from 0, or a
+                        slice of elements (default is all)
+
+        output: array, e.g. (n_draws,) for get('beta', chain=0, index=1)
+        """
+
+        values = self[name]
+        values = values[(slice(None) if chain is None else chain,
+                         slice(None) if draws is None else draws)]
+        if index is not None:
+            values = values[..., index]
+        return values
+
+    def _column(self, col):
+        """Draws of one column, array (n_chains, n_draws)."""
+
+        name = self.names[col]
+        base = name.split('[')[0]
+        if base == name:
+            return self[name]
+        return self[base][:, :, self.columns(base).index(col)]
+
+    def _column_stats(self, col, probs):
+        """Summary statistics of one column, computed once."""
+
+        key = (col, tuple(probs))
+        if key not in self._stats:
+            values = self._column(col)
+            quantiles = np.percentile(values, 100 * np.asarray(probs))
+            self._stats[key] = ((values.mean(), values.std(ddof=1)) +
+                                tuple(quantiles) +
+                                (bulk_ess(values)[0], rank_rhat(values)[0]))
+        return self._stats[key]
+
+    def summary(self, params=None, probs=(0.025, 0.5, 0.975), verbose=True):
+        """
+        Table of posterior mean, sd, quantiles, bulk ESS and rank-normalized
+        R-hat, computed only for the selected parameters.
+
+        input: params -> name or list of names (default is all columns)
+               probs -> quantile levels (default is 2.5%, 50%, 97.5%)
+               verbose -> print the table
+
+        output: the table as a string
+        """
+
+        cols = self.columns(params)
+        width = max([len(self.names[k]) for k in cols] + [4])
+
+        header = ['{:<{}}'.format('', width), '{:>9}'.format('mean'),
+                  '{:>9}'.format('sd')]
+        header += ['{:>9}'.format('{:g}%'.format(100 * q)) for q in probs]
+        header += ['{:>7}'.format('n_eff'), '{:>6}'.format('Rhat')]
+        lines = [' '.join(header)]
+
+        for k in cols:
+            stats = self._column_stats(k, probs)
+            line = ['{:<{}}'.format(self.names[k], width)]
+            line += ['{:>9.3g}'.format(v) for v in stats[:-2]]
+            line += ['{:>7.0f}'.format(stats[-2]),
+                     '{:>6.3f}'.format(stats[-1])]
+            lines.append(' '.join(line))
+
+        table = '\n'.join(lines)
+        if verbose:
+            print(table)
+        return table
+
+
+def stan_draws(fit):
+    """
+    Column names and draws of a pystan fit.
+
+    input: fit -> pystan fit object
+
+    output: (names, array (n_chains, n_draws, n_columns)), warm-up excluded
+    """
+
+    # (n_draws, n_chains, n_columns) -> (n_chains, n_draws, n_columns)
+    draws = fit.extract(permuted=False, inc_warmup=False)
+    names = list(fit.flatnames) + ['lp__']
+    return names, np.transpose(draws, (1, 0, 2))
+
+
+def _stan_backend(config):
+    """Sample a Stan program with pystan, through the model cache."""
+
+    from stan_cache import load_stan_model
+
+    options = dict(config['options'] or {})
+    compile_kwargs = options.pop('compile_kwargs', {})
+    model = load_stan_model(config['model'], **compile_kwargs)
+
+    if config['pars'] is not None:
+        options['pars'] = config['pars']
+    if config['seed'] is not None:
+        options['seed'] = config['seed']
+    fit = model.sampling(data=config['data'], chains=config['n_chains'],
+                         iter=(config['n_warmup'] +
+                               config['n_samples'] * config['thin']),
+                         warmup=config['n_warmup'], thin=config['thin'],
+                         **options)
+
+    return Posterior.from_stan(fit)
+
+
+def _jags_backend(config):
+    """Sample a JAGS program with pyjags."""
+
+    import pyjags
+
+    if config['pars'] is None:
+        raise ValueError('the jags backend needs the monitored pars')
+
+    options = dict(config['options'] or {})
+    # as for pystan, n_jobs is the number of processes (-1 for all CPUs)
+    n_jobs = options.pop('n_jobs', 1)
+    if config['draws_path'] is not None:
+        from jags_checkpoint import CheckpointedJagsRun
+        run = CheckpointedJagsRun(config['draws_path'], config['model'],
+                                  config['data'], config['pars'],
+                                  n_chains=config['n_chains'],
+                                  n_warmup=config['n_warmup'],
+                                  thin=config['thin'], seed=config['seed'],
+                                  **options)
+        return run.sample(config['n_samples'])
+
+    if n_jobs != 1:
+        from parallel import run_parallel_jags
+        samples = run_parallel_jags(config['model'], config['data'],
+                                    config['pars'], config['n_samples'],
+                                    n_chains=config['n_chains'],
+                                    n_warmup=config['n_warmup'],
+                                    thin=config['thin'], seed=config['seed'],
+                                    max_workers=None if n_jobs < 0
+                                    else n_jobs, **options)
+        return Posterior.from_jags(samples)
+
+    if config['seed'] is not None and 'init' not in options:
+        options['init'] = [{'.RNG.name': 'base::Mersenne-Twister',
+                            '.RNG.seed': config['seed'] + k}
+                           for k in range(config['n_chains'])]
+    model = pyjags.Model(config['model'], data=config['data'],
+                         chains=config['n_chains'], **options)
+    if config['n_warmup']:
+        model.update(config['n_warmup'])
+    samples = model.sample(config['n_samples'] * config['thin'],
+                           vars=list(config['pars']), thin=config['thin'])
+
+    return Posterior.from_jags(samples)
+
+
+def _numpy_backend(config):
+    """
+    Sample in process: exact draws for conjugate models, Gibbs sampling
+    for models with sample_gibbs, stochastic-gradient MCMC for models
+    with sample_sgmcmc, NUTS for models with log_density_grad,
+    vectorized Metropolis-Hastings for plain log-targets.
+    """
+
+    model = config['model']
+    options = dict(config['options'] or {})
+    n_chains = config['n_chains']
+    n_stored = config['n_samples'] * config['thin']
+
+    if getattr(model, 'conjugate', False):
+        # independent draws, no warm-up (e.g. regression.LinearRegression)
+        out = model.sample_exact(n_stored, n_chains, seed=config['seed'])
+        draws = out['chains']
+        names = list(model.names)
+    elif hasattr(model, 'sample_gibbs'):
+        # exact conditional updates (e.g. polya_gamma.PolyaGammaLogit)
+        out = model.sample_gibbs(n_stored, n_chains,
+                                 n_warmup=config['n_warmup'],
+                                 seed=config['seed'], **options)
+        draws = out['chains']
+        names = list(model.names)
+    elif hasattr(model, 'sample_sgmcmc'):
+        # minibatch gradients (e.g. sgmcmc.MinibatchLogit)
+        out = model.sample_sgmcmc(n_stored, n_chains,
+                                  n_warmup=config['n_warmup'],
+                                  seed=config['seed'], **options)
+        draws = out['chains']
+        names = list(model.names)
+    elif hasattr(model, 'log_density_grad'):
+        from hmc import nuts
+
+        start = options.pop('start', model.initial_point())
+        out = nuts(model.log_density_grad, start, n_stored, n_chains,
+                   n_warmup=config['n_warmup'], seed=config['seed'],
+                   **options)
+        draws = model.constrain(out['chains'])
+        names = list(model.names)
+    else:
+        from mcmc import metropolis_hastings_chains
+
+        if 'start' not in options:
+            raise ValueError("the numpy backend needs options['start'] "
+                             'for a plain log-target')
+        start = options.pop('start')
+        names = options.pop('names', None)
+        out = metropolis_hastings_chains(model, start, n_stored, n_chains,
+                                         n_warmup=config['n_warmup'],
+                                         seed=config['seed'], **options)
+        draws = np.asarray(out['chains'])
+        if names is None:
+            names = ['theta[' + str(k + 1) + ']'
+                     for k in range(draws.shape[2])]
+
+    draws = np.concatenate([draws, out['log_target'][:, :, None]], axis=2)
+    return Posterior(names + ['lp__'], draws[:, ::config['thin']], out)
+
+
+BACKENDS = {'stan': _stan_backend,
+            'jags': _jags_backend,
+            'numpy': _numpy_backend}
+
+
+def run_fit(config, **overrides):
+    """
+    Fit a model as described by a configuration dictionary.
+
+    input: config -> dictionary with the keywords listed in the module
+                     docstring; backend and model are required
+           overrides -> keywords replacing those of config, e.g.
+                        run_fit(config, n_samples=100) for a quick test
+
+    output: Posterior
+    """
+
+    config = dict(DEFAULTS, **config)
+    config.update(overrides)
+
+    if config['backend'] not in BACKENDS:
+        raise ValueError('unknown backend ' + repr(config['backend']) +
+                         ', expected one of ' + ', '.join(sorted(BACKENDS)))
+
+    posterior = BACKENDS[config['backend']](config)
+    if config['draws_path'] is not None:
+        from draws_store import DrawsStore, save_draws
+        # checkpointed runs have written their draws already
+        if not isinstance(posterior.source, DrawsStore):
+            save_draws(posterior, config['draws_path'], thin=config['thin'])
+    return posterior
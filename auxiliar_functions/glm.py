@@ -0,0 +1,266 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Log-posteriors and their analytic gradients for the generalized linear
+models of Day_2 (Gaussian, Bernoulli-logit, Poisson and negative
+binomial), for gradient-based samplers such as hmc.nuts.
+
+Every model works on an unconstrained parameter vector theta: the
+coefficients beta followed, where needed, by a transformed scale
+parameter. log_density_grad(theta) returns the log-posterior (including
+the Jacobian of the transformation) and its gradient; theta may also be
+an array (m, n_params), evaluated as m points at once. constrain maps
+unconstrained draws back to the natural parameters.
+
+Coefficients have independent normal(0, prior_sd) priors, or flat
+priors if prior_sd is None.
+"""
+
+
+import numpy as np
+from scipy.special import digamma, expit, gammaln
+
+from likelihoods import LinearGaussianLikelihood
+
+
+def _beta_prior(beta, prior_sd):
+    """Log-prior of the coefficients and its gradient."""
+
+    if prior_sd is None:
+        return 0.0, 0.0
+    prec = 1.0 / (prior_sd * prior_sd)
+    return -0.5 * prec * (beta * beta).sum(axis=-1), -prec * beta
+
+
+def _positive(u, upper=None):
+    """
+    Map an unconstrained u to a scale parameter on (0, upper), or on
+    (0, inf) if upper is None.
+
+    output: value, log-Jacobian and derivative of the log-Jacobian
+            with respect to u
+    """
+
+    if upper is None:
+        return np.exp(u), u, np.ones_like(u)
+    s = expit(u)
+    return (upper * s, np.log(upper) + np.log(s) + np.log1p(-s),
+            1.0 - 2.0 * s)
+
+
+def _bounded(u, lower, upper):
+    """Map an unconstrained u to (lower, upper), as _positive."""
+
+    s = expit(u)
+    return (lower + (upper - lower) * s,
+            np.log(upper - lower) + np.log(s) + np.log1p(-s), 1.0 - 2.0 * s)
+
+
+def _unbounded(value, lower, upper):
+    """Inverse of _bounded."""
+
+    s = (value - lower) / float(upper - lower)
+    return np.log(s) - np.log1p(-s)
+
+
+class GaussianGLM(object):
+    """
+    Normal linear model, y ~ normal(X beta, sigma), with a flat prior on
+    sigma over (0, sigma_max) (over (0, inf) if sigma_max is None).
+
+    theta = (beta, log sigma), or (beta, logit(sigma / sigma_max)).
+    The data enter only through X^T X, X^T y and y^T y, so a gradient
+    costs O(p^2).
+
+    input: X -> design matrix (n, p), or a LinearGaussianLikelihood
+                (then y is ignored)
+           y -> response vector (n,)
+           prior_sd -> sd of the normal priors on beta (default is None)
+           sigma_max -> upper bound of the prior on sigma (default is None)
+    """
+
+    def __init__(self, X, y=None, prior_sd=None, sigma_max=None):
+
+        if isinstance(X, LinearGaussianLikelihood):
+            self.likelihood = X
+        else:
+            self.likelihood = LinearGaussianLikelihood(X, y)
+        self.prior_sd = prior_sd
+        self.sigma_max = sigma_max
+
+        p = self.likelihood.xtx.shape[0]
+        self.n_params = p + 1
+        self.names = ['beta[' + str(k + 1) + ']' for k in range(p)]
+        self.names.append('sigma')
+
+    def log_density_grad(self, theta):
+        beta = theta[..., :-1]
+        sigma, log_jac, dlog_jac = _positive(theta[..., -1], self.sigma_max)
+
+        lik = self.likelihood
+        gram_beta = np.dot(beta, lik.xtx)
+        rss = (lik.yty - 2.0 * np.dot(beta, lik.xty) +
+               (gram_beta * beta).sum(axis=-1))
+        inv_var = 1.0 / (sigma * sigma)
+        prior, dprior = _beta_prior(beta, self.prior_sd)
+
+        lp = -lik.n * np.log(sigma) - 0.5 * rss * inv_var + log_jac + prior
+
+        grad = np.empty_like(theta, dtype=float)
+        grad[..., :-1] = (lik.xty - gram_beta) * inv_var[..., None] + dprior
+
+        # d/du through d sigma / du = sigma * dlog_jac_sigma
+        dlogsigma_du = dlog_jac if self.sigma_max is None else \
+            1.0 - expit(theta[..., -1])
+        grad[..., -1] = (-lik.n + rss * inv_var) * dlogsigma_du + dlog_jac
+
+        return lp, grad
+
+    def constrain(self, theta):
+        out = np.array(theta, dtype=float)
+        out[..., -1] = _positive(out[..., -1], self.sigma_max)[0]
+        return out
+
+    def initial_point(self):
+        return np.zeros(self.n_params)
+
+
+class BernoulliLogitGLM(object):
+    """
+    Logistic regression, y ~ bernoulli_logit(X beta).
+
+    theta = beta.
+
+    input: X -> design matrix (n, p)
+           y -> array (n,) of 0/1 responses
+           prior_sd -> sd of the normal priors on beta (default is 100)
+    """
+
+    def __init__(self, X, y, prior_sd=100.0):
+
+        self.X = np.asarray(X, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.prior_sd = prior_sd
+        self.n_params = self.X.shape[1]
+        self.names = ['beta[' + str(k + 1) + ']' for k in range(self.n_params)]
+
+    def log_density_grad(self, theta):
+        eta = np.dot(theta, self.X.T)
+        prior, dprior = _beta_prior(theta, self.prior_sd)
+
+        # log p(y | eta) = y eta - log(1 + exp(eta))
+        lp = (self.y * eta - np.logaddexp(0.0, eta)).sum(axis=-1) + prior
+        grad = np.dot(self.y - expit(eta), self.X) + dprior
+
+        return lp, grad
+
+    def constrain(self, theta):
+        return np.array(theta, dtype=float)
+
+    def initial_point(self):
+        return np.zeros(self.n_params)
+
+
+class PoissonGLM(object):
+    """
+    Poisson regression with log link, y ~ poisson(exp(X beta)).
+
+    theta = beta.
+
+    input: X -> design matrix (n, p)
+           y -> array (n,) of counts
+           prior_sd -> sd of the normal priors on beta (default is 100)
+    """
+
+    def __init__(self, X, y, prior_sd=100.0):
+
+        self.X = np.asarray(X, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.prior_sd = prior_sd
+        self.n_params = self.X.shape[1]
+        self.names = ['beta[' + str(k + 1) + ']' for k in range(self.n_params)]
+        self._const = -gammaln(self.y + 1.0).sum()
+
+    def log_density_grad(self, theta):
+        eta = np.dot(theta, self.X.T)
+        mu = np.exp(eta)
+        prior, dprior = _beta_prior(theta, self.prior_sd)
+
+        lp = (self.y * eta - mu).sum(axis=-1) + self._const + prior
+        grad = np.dot(self.y - mu, self.X) + dprior
+
+        return lp, grad
+
+    def constrain(self, theta):
+        return np.array(theta, dtype=float)
+
+    def initial_point(self):
+        return np.zeros(self.n_params)
+
+
+class NegativeBinomialGLM(object):
+    """
+    Negative binomial regression with log link and size theta, as in
+    Day_2/poisson/NB_GC.R: y ~ NB(mean exp(X beta), size), with
+    size ~ uniform(size_min, size_max).
+
+    theta = (beta, logit((size - size_min) / (size_max - size_min))).
+
+    input: X -> design matrix (n, p)
+           y -> array (n,) of counts
+           prior_sd -> sd of the normal priors on beta (default is 100)
+           size_min, size_max -> bounds of the prior on size
+                                 (default is 0.01 and 100)
+    """
+
+    def __init__(self, X, y, prior_sd=100.0, size_min=0.01, size_max=100.0):
+
+        self.X = np.asarray(X, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.prior_sd = prior_sd
+        self.size_min = size_min
+        self.size_max = size_max
+        p = self.X.shape[1]
+        self.n_params = p + 1
+        self.names = ['beta[' + str(k + 1) + ']' for k in range(p)]
+        self.names.append('size')
+        self._const = -gammaln(self.y + 1.0).sum()
+
+    def log_density_grad(self, theta):
+        beta = theta[..., :-1]
+        u = theta[..., -1]
+        size, log_jac, dlog_jac = _bounded(u, self.size_min, self.size_max)
+        size_ = size[..., None]
+
+        eta = np.dot(beta, self.X.T)
+        mu = np.exp(eta)
+        log_denom = np.log(size_ + mu)
+        prior, dprior = _beta_prior(beta, self.prior_sd)
+
+        loglik = (gammaln(self.y + size_) - gammaln(size_) +
+                  size_ * (np.log(size_) - log_denom) +
+                  self.y * (eta - log_denom)).sum(axis=-1) + self._const
+        lp = loglik + log_jac + prior
+
+        grad = np.empty_like(theta, dtype=float)
+        grad[..., :-1] = (np.dot((self.y - mu) * size_ / (size_ + mu), self.X)
+                          + dprior)
+
+        dsize = (digamma(self.y + size_) - digamma(size_) +
+                 np.log(size_) - log_denom + 1.0 -
+                 (self.y + size_) / (size_ + mu)).sum(axis=-1)
+        dsize_du = (size - self.size_min) * (1.0 - expit(u))
+        grad[..., -1] = dsize * dsize_du + dlog_jac
+
+        return lp, grad
+
+    def constrain(self, theta):
+        out = np.array(theta, dtype=float)
+        out[..., -1] = _bounded(out[..., -1], self.size_min,
+                                self.size_max)[0]
+        return out
+
+    def initial_point(self):
+        theta = np.zeros(self.n_params)
+        theta[-1] = _unbounded(1.0, self.size_min, self.size_max)
+        return theta
@@ -0,0 +1,358 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+No-U-Turn sampler (Hoffman & Gelman, 2014) in pure NumPy.
+
+The target is given as log_density_grad(theta) -> (log-density, gradient)
+on an unconstrained parameter vector, e.g. the log_density_grad method of
+the models in glm.py. The step size is tuned by dual averaging towards a
+target acceptance statistic and a diagonal mass matrix is estimated in
+Stan-style expanding windows during warm-up; both are then frozen.
+
+Since nothing has to be compiled, the first draws of a small model are
+available in a fraction of a second.
+"""
+
+
+import numpy as np
+
+from chain_store import ChainStore
+from diagnostics import split_rhat
+
+
+MAX_DELTA_H = 1000.0             # energy error flagged as a divergence
+
+
+def _safe(lp):
+    """Treat non-finite log-densities as -inf."""
+
+    return lp if np.isfinite(lp) else -np.inf
+
+
+class _Hamiltonian(object):
+    """Leapfrog integrator with a diagonal inverse metric."""
+
+    def __init__(self, log_density_grad, inv_metric):
+        self.f = log_density_grad
+        self.inv_metric = inv_metric
+        self.n_grad = 0
+        self.divergent = False
+
+    def leapfrog(self, theta, r, grad, eps):
+        r = r + 0.5 * eps * grad
+        theta = theta + eps * self.inv_metric * r
+        # far-off trial steps (step size search, divergences) may overflow
+        with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+            lp, grad = self.f(theta)
+        self.n_grad += 1
+        r = r + 0.5 * eps * grad
+        return theta, r, _safe(lp), grad
+
+    def kinetic(self, r):
+        return 0.5 * np.dot(r, self.inv_metric * r)
+
+    def no_u_turn(self, theta_minus, theta_plus, r_minus, r_plus):
+        delta = theta_plus - theta_minus
+        return (np.dot(delta, self.inv_metric * r_minus) >= 0 and
+                np.dot(delta, self.inv_metric * r_plus) >= 0)
+
+
+def _build_tree(ham, theta, r, grad, log_u, direction, depth, eps, joint0,
+                rng):
+    """
+    Recursive tree doubling of the efficient NUTS (Hoffman & Gelman, 2014,
+    algorithm 6).
+
+    output: (theta_minus, r_minus, grad_minus, theta_plus, r_plus, grad_plus,
+             theta_new, lp_new, grad_new, n_valid, keep_going, sum_alpha,
+             n_alpha)
+    """
+
+    if depth == 0:
+        theta1, r1, lp1, grad1 = ham.leapfrog(theta, r, grad,
+                                              direction * eps)
+        joint = lp1 - ham.kinetic(r1)
+        if not np.isfinite(joint):
+            joint = -np.inf
+        n_valid = int(log_u <= joint)
+        keep_going = log_u < joint + MAX_DELTA_H
+        ham.divergent = ham.divergent or not keep_going
+        alpha = np.exp(min(0.0, joint - joint0))
+        return (theta1, r1, grad1, theta1, r1, grad1, theta1, lp1, grad1,
+                n_valid, keep_going, alpha, 1)
+
+    out = _build_tree(ham, theta, r, grad, log_u, direction, depth - 1, eps,
+                      joint0, rng)
+    (theta_m, r_m, grad_m, theta_p, r_p, grad_p, theta_new, lp_new,
+     grad_new, n_valid, keep_going, sum_alpha, n_alpha) = out
+
+    if keep_going:
+        if direction == -1:
+            (theta_m, r_m, grad_m, _, _, _, theta2, lp2, grad2, n2, s2, a2,
+             na2) = _build_tree(ham, theta_m, r_m, grad_m, log_u, direction,
+                                depth - 1, eps, joint0, rng)
+        else:
+            (_, _, _, theta_p, r_p, grad_p, theta2, lp2, grad2, n2, s2, a2,
+             na2) = _build_tree(ham, theta_p, r_p, grad_p, log_u, direction,
+                                depth - 1, eps, joint0, rng)
+
+        if n_valid + n2 > 0 and rng.random() < n2 / float(n_valid + n2):
+            theta_new, lp_new, grad_new = theta2, lp2, grad2
+
+        n_valid += n2
+        keep_going = s2 and ham.no_u_turn(theta_m, theta_p, r_m, r_p)
+        sum_alpha += a2
+        n_alpha += na2
+
+    return (theta_m, r_m, grad_m, theta_p, r_p, grad_p, theta_new, lp_new,
+            grad_new, n_valid, keep_going, sum_alpha, n_alpha)
+
+
+def _nuts_step(ham, theta, lp, grad, eps, max_depth, rng):
+    """
+    One NUTS transition.
+
+    output: (theta, lp, grad, accept_stat, depth, divergent)
+    """
+
+    r0 = rng.standard_normal(theta.shape) / np.sqrt(ham.inv_metric)
+    joint0 = lp - ham.kinetic(r0)
+    log_u = joint0 + np.log(rng.random())
+    ham.divergent = False
+
+    theta_m = theta_p = theta
+    r_m = r_p = r0
+    grad_m = grad_p = grad
+    n_valid = 1
+    keep_going = True
+    depth = 0
+    sum_alpha = 0.0
+    n_alpha = 1
+
+    while keep_going and depth < max_depth:
+        direction = 1 if rng.random() < 0.5 else -1
+        if direction == -1:
+            (theta_m, r_m, grad_m, _, _, _, theta2, lp2, grad2, n2, s2,
+             sum_alpha, n_alpha) = _build_tree(ham, theta_m, r_m, grad_m,
+                                               log_u, direction, depth, eps,
+                                               joint0, rng)
+        else:
+            (_, _, _, theta_p, r_p, grad_p, theta2, lp2, grad2, n2, s2,
+             sum_alpha, n_alpha) = _build_tree(ham, theta_p, r_p, grad_p,
+                                               log_u, direction, depth, eps,
+                                               joint0, rng)
+
+        if s2 and rng.random() < n2 / float(n_valid):
+            theta, lp, grad = theta2, lp2, grad2
+
+        n_valid += n2
+        keep_going = s2 and ham.no_u_turn(theta_m, theta_p, r_m, r_p)
+        depth += 1
+
+    return theta, lp, grad, sum_alpha / n_alpha, depth, ham.divergent
+
+
+def _find_reasonable_step(ham, theta, lp, grad, rng):
+    """Heuristic initial step size (Hoffman & Gelman, 2014, algorithm 4)."""
+
+    eps = 1.0
+    r = rng.standard_normal(theta.shape) / np.sqrt(ham.inv_metric)
+    joint0 = lp - ham.kinetic(r)
+
+    def log_ratio(eps):
+        _, r1, lp1, _ = ham.leapfrog(theta, r, grad, eps)
+        joint = lp1 - ham.kinetic(r1)
+        return joint - joint0 if np.isfinite(joint) else -np.inf
+
+    direction = 1.0 if log_ratio(eps) > np.log(0.5) else -1.0
+    for _ in range(100):
+        if direction * log_ratio(eps) <= -direction * np.log(2.0):
+            break
+        eps *= 2.0 ** direction
+    return eps
+
+
+def _warmup_windows(n_warmup, init_buffer=75, term_buffer=50, base=25):
+    """
+    Mass-matrix adaptation windows, as in Stan: a fast initial buffer,
+    slow windows of doubling size, a fast final buffer.
+
+    output: first iteration of the slow windows and list of their ends
+    """
+
+    if n_warmup < 20:
+        return n_warmup, []
+    if init_buffer + base + term_buffer > n_warmup:
+        init_buffer = int(0.15 * n_warmup)
+        term_buffer = int(0.1 * n_warmup)
+        base = n_warmup - init_buffer - term_buffer
+
+    ends = []
+    start, size = init_buffer, base
+    last = n_warmup - term_buffer
+    while start < last:
+        end = start + size
+        if end + 2 * size > last:
+            end = last
+        ends.append(end)
+        start, size = end, 2 * size
+    return init_buffer, ends
+
+
+def nuts_chain(log_density_grad, start, n_samples, n_warmup=1000,
+               target_accept=0.8, max_depth=10, inv_metric=None,
+               step_size=None, memory_limit=2 ** 30, seed=None):
+    """
+    One NUTS chain with step size and diagonal mass matrix adaptation.
+
+    input: log_density_grad -> callable theta -> (log-density, gradient)
+           start -> unconstrained starting point, array (n_params,)
+           n_samples -> number of draws to store
+           n_warmup -> number of adaptation iterations, not stored
+                       (default is 1000)
+           target_accept -> target mean acceptance statistic (default 0.8)
+           max_depth -> maximum tree depth (default is 10)
+           inv_metric -> initial diagonal inverse mass matrix (default ones)
+           step_size -> initial step size (default: heuristic search)
+           memory_limit -> size in bytes above which draws are kept in a
+                           memory-mapped file (default is 1 GB)
+           seed -> int, numpy.random.Generator or None
+
+    output: dictionary with keywords
+                chain -> read-only array (n_samples, n_params) of draws
+                log_target -> read-only array (n_samples,)
+                acceptance_rate -> mean acceptance statistic after warm-up
+                step_size -> adapted step size
+                inv_metric -> adapted diagonal inverse mass matrix
+                n_divergent -> number of divergent transitions after warm-up
+                tree_depth -> array (n_samples,) of tree depths
+                n_grad -> number of gradient evaluations, warm-up included
+    """
+
+    rng = np.random.default_rng(seed)
+
+    theta = np.array(start, dtype=float)
+    n_params = theta.shape[0]
+    if inv_metric is None:
+        inv_metric = np.ones(n_params)
+    ham = _Hamiltonian(log_density_grad, np.array(inv_metric, dtype=float))
+
+    lp, grad = log_density_grad(theta)
+    if not np.isfinite(lp):
+        raise ValueError('log density is not finite at the starting point')
+
+    eps = step_size or _find_reasonable_step(ham, theta, lp, grad, rng)
+
+    # dual averaging (Hoffman & Gelman, 2014, section 3.2)
+    gamma, t0, kappa = 0.05, 10.0, 0.75
+
+    def restart(eps):
+        return {'mu': np.log(10.0 * eps), 'h_bar': 0.0, 'log_eps_bar': 0.0,
+                'm': 0}
+
+    dual = restart(eps)
+    window_start, windows = _warmup_windows(n_warmup)
+    w_n, w_mean, w_m2 = 0, np.zeros(n_params), np.zeros(n_params)
+
+    chain = ChainStore(n_samples, (n_params,), memory_limit=memory_limit)
+    log_prob = ChainStore(n_samples, memory_limit=memory_limit)
+    depths = np.empty(n_samples, dtype=int)
+    sum_accept = 0.0
+    n_divergent = 0
+
+    for it in range(n_warmup + n_samples):
+        theta, lp, grad, accept, depth, divergent = _nuts_step(
+            ham, theta, lp, grad, eps, max_depth, rng)
+
+        if it < n_warmup:
+            dual['m'] += 1
+            m = dual['m']
+            w = 1.0 / (m + t0)
+            dual['h_bar'] = (1.0 - w) * dual['h_bar'] + \
+                w * (target_accept - accept)
+            log_eps = dual['mu'] - np.sqrt(m) / gamma * dual['h_bar']
+            eta = m ** -kappa
+            dual['log_eps_bar'] = eta * log_eps + \
+                (1.0 - eta) * dual['log_eps_bar']
+            eps = np.exp(log_eps)
+
+            # slow windows: collect draws for the diagonal metric
+            if windows and window_start <= it < windows[-1]:
+                w_n += 1
+                delta = theta - w_mean
+                w_mean += delta / w_n
+                w_m2 += delta * (theta - w_mean)
+                if it + 1 in windows:
+                    var = w_m2 / max(w_n - 1, 1)
+                    # regularize towards 1e-3, as Stan does
+                    ham.inv_metric = ((w_n / (w_n + 5.0)) * var +
+                                      1e-3 * (5.0 / (w_n + 5.0)))
+                    w_n, w_mean, w_m2 = 0, np.zeros(n_params), \
+                        np.zeros(n_params)
+                    eps = _find_reasonable_step(ham, theta, lp, grad, rng)
+                    dual = restart(eps)
+
+            if it == n_warmup - 1:
+                eps = np.exp(dual['log_eps_bar'])
+        else:
+            chain.append(theta)
+            log_prob.append(lp)
+            depths[it - n_warmup] = depth
+            sum_accept += accept
+            n_divergent += divergent
+
+    return {'chain': chain.view(),
+            'log_target': log_prob.view(),
+            'acceptance_rate': sum_accept / max(n_samples, 1),
+            'step_size': eps,
+            'inv_metric': ham.inv_metric,
+            'n_divergent': n_divergent,
+            'tree_depth': depths,
+            'n_grad': ham.n_grad}
+
+
+def nuts(log_density_grad, start, n_samples, n_chains=4, n_warmup=1000,
+         seed=None, **kwargs):
+    """
+    Several NUTS chains, each with its own random stream spawned from one
+    root seed (see parallel.run_parallel_chains to run them in parallel
+    processes).
+
+    input: log_density_grad -> callable theta -> (log-density, gradient)
+           start -> unconstrained starting points, array (n_chains, n_params)
+                    or a single point shared by all chains
+           n_samples -> number of draws to store per chain
+           n_chains -> number of chains (default is 4)
+           n_warmup -> number of adaptation iterations (default is 1000)
+           seed -> root seed: int, SeedSequence or None
+           other keywords are passed to nuts_chain
+
+    output: dictionary with keywords
+                chains -> array (n_chains, n_samples, n_params) of draws
+                log_target -> array (n_chains, n_samples)
+                acceptance_rate, step_size, n_divergent, n_grad ->
+                    arrays (n_chains,)
+                inv_metric -> array (n_chains, n_params)
+                rhat -> array (n_params,) of split R-hat
+    """
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+
+    start = np.asarray(start, dtype=float)
+    if start.ndim < 2:
+        start = np.tile(start, (n_chains, 1))
+
+    results = [nuts_chain(log_density_grad, start[c], n_samples,
+                          n_warmup=n_warmup,
+                          seed=np.random.default_rng(child), **kwargs)
+               for c, child in enumerate(seed.spawn(n_chains))]
+
+    chains = np.stack([r['chain'] for r in results])
+    out = {'chains': chains,
+           'log_target': np.stack([r['log_target'] for r in results]),
+           'rhat': split_rhat(chains)}
+    for key in ('acceptance_rate', 'step_size', 'n_divergent', 'n_grad',
+                'inv_metric'):
+        out[key] = np.array([r[key] for r in results])
+    return out
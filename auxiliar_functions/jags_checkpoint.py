@@ -0,0 +1,172 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+pyjags runs that survive a crash and can be extended later.
+
+Instead of one blocking model.sample(N) call, the run is sampled in
+chunks. After every chunk the draws are appended to a
+draws_store.DrawsStore and the state of the JAGS chains (parameter values
+and random number generator state, from pyjags.Model.state) is written
+to a checkpoint file next to them. Starting the same run again in the
+same directory rebuilds the model from that state and carries on where
+the last checkpoint left off; asking for more draws than are stored
+extends the run.
+
+A checkpoint is only reused if the model code, data, monitored nodes,
+number of chains, thinning, adaptation, burn-in and seed are unchanged;
+otherwise the run starts afresh. A resumed model is built with adapt=0,
+so JAGS samplers restart from their default tuning rather than the
+adapted one.
+"""
+
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from draws_store import DrawsStore
+from fit_runner import Posterior
+
+
+CHECKPOINT = 'jags_state.pkl'
+
+
+def _run_key(model_code, data, vars, n_chains, thin, adapt, n_warmup,
+             seed):
+    """Hash of everything that must match to resume a run."""
+
+    h = hashlib.sha256()
+    h.update(model_code.encode('utf-8'))
+    for name in sorted(data):
+        values = np.asarray(data[name])
+        h.update(name.encode('utf-8'))
+        h.update(str((values.dtype.str, values.shape)).encode('utf-8'))
+        h.update(np.ascontiguousarray(values).tobytes())
+    settings = (sorted(vars), int(n_chains), int(thin), int(adapt),
+                int(n_warmup), seed)
+    h.update(repr(settings).encode('utf-8'))
+    return h.hexdigest()
+
+
+class CheckpointedJagsRun(object):
+    """
+    A pyjags run sampled in chunks, with draws and chain state saved to
+    the directory path after every chunk.
+
+    input: path -> directory of the run (draws store and checkpoint)
+           model_code -> JAGS program
+           data -> data dictionary
+           vars -> names of the monitored nodes
+           n_chains -> number of chains (default is 3)
+           adapt -> adaptation iterations of a new run (default is 1000)
+           n_warmup -> burn-in iterations of a new run, not stored
+                       (default is 0)
+           thin -> thinning interval (default is 1)
+           chunk_size -> stored draws per chain between checkpoints
+                         (default is 1000)
+           seed -> seed of the JAGS random number generators of a new run,
+                   chain k using seed + k (default is None)
+           other keywords are passed to pyjags.Model
+    """
+
+    def __init__(self, path, model_code, data, vars, n_chains=3, adapt=1000,
+                 n_warmup=0, thin=1, chunk_size=1000, seed=None, **kwargs):
+
+        import pyjags
+
+        self.path = path
+        self.vars = list(vars)
+        self.n_chains = n_chains
+        self.thin = thin
+        self.chunk_size = chunk_size
+        self.key = _run_key(model_code, data, self.vars, n_chains, thin,
+                            adapt, n_warmup, seed)
+
+        checkpoint = self._read_checkpoint()
+        if checkpoint is not None and checkpoint['key'] == self.key:
+            self.model = pyjags.Model(model_code, data=data,
+                                      init=checkpoint['state'],
+                                      chains=n_chains, adapt=0, **kwargs)
+            self.n_draws = checkpoint['n_draws']
+            self.store = None
+            if self.n_draws:
+                # drop draws written after the last checkpoint
+                self.store = DrawsStore(path)
+                self.store.truncate(self.n_draws)
+        else:
+            if seed is not None and 'init' not in kwargs:
+                kwargs['init'] = [{'.RNG.name': 'base::Mersenne-Twister',
+                                   '.RNG.seed': seed + k}
+                                  for k in range(n_chains)]
+            self.model = pyjags.Model(model_code, data=data,
+                                      chains=n_chains, adapt=adapt, **kwargs)
+            if n_warmup:
+                self.model.update(n_warmup)
+            self.n_draws = 0
+            self.store = None
+            self._write_checkpoint()
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.path, CHECKPOINT), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _write_checkpoint(self):
+        """Save the chain state atomically."""
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        checkpoint = {'key': self.key,
+                      'n_draws': self.n_draws,
+                      'state': self.model.state}
+        handle, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, os.path.join(self.path, CHECKPOINT))
+
+    def sample(self, n_samples, verbose=True):
+        """
+        Sample until n_samples draws per chain are stored, checkpointing
+        after every chunk. Draws already stored are not sampled again; if
+        more than n_samples are stored, only the first n_samples are
+        returned (the others stay in the store).
+
+        input: n_samples -> total number of stored draws per chain
+               verbose -> print progress after each chunk
+
+        output: fit_runner.Posterior reading the stored draws
+        """
+
+        if n_samples < 1 and self.store is None:
+            raise ValueError('no draws are stored yet: n_samples must be '
+                             'at least 1')
+
+        while self.n_draws < n_samples:
+            n = min(self.chunk_size, n_samples - self.n_draws)
+            samples = self.model.sample(n * self.thin, vars=self.vars,
+                                        thin=self.thin)
+
+            # (*dims, n, n_chains) -> (n_chains, n, *dims)
+            draws = dict((var, np.moveaxis(np.asarray(values), (-1, -2),
+                                           (0, 1)))
+                         for var, values in samples.items())
+            if self.store is None:
+                self.store = DrawsStore.create(
+                    self.path, [(var, draws[var].shape[2:])
+                                for var in sorted(draws)],
+                    self.n_chains, self.thin)
+            self.store.extend(draws)
+
+            self.n_draws += n
+            self._write_checkpoint()
+            if verbose:
+                print('{:>8} draws per chain stored in {}'.format(
+                    self.n_draws, self.path))
+
+        return Posterior.from_store(self.store, n_samples)
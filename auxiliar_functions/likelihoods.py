@@ -0,0 +1,160 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Likelihoods summarised by sufficient statistics.
+
+For a Gaussian model the data only enter the likelihood through
+n, the sample mean and the centred sum of squares, so once these are
+computed every evaluation costs O(1) whatever the size of the data set.
+"""
+
+
+import numpy as np
+
+
+LOG_2PI = np.log(2.0 * np.pi)
+
+
+class NormalLikelihood(object):
+    """
+    Gaussian likelihood of i.i.d. observations, stored as
+    sufficient statistics.
+
+    input: data -> array of observations (optional, may be added
+                   later in chunks with update)
+           std -> known standard deviation (optional)
+    """
+
+    def __init__(self, data=None, std=None):
+        self.n = 0
+        self.mean = 0.0
+        self.ss = 0.0                 # sum of squared deviations from mean
+        self.std = std
+
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        """
+        Add a chunk of observations, merging its statistics with the
+        current ones (Chan et al. parallel update).
+
+        input: data -> array of observations
+        """
+
+        data = np.asarray(data, dtype=float).ravel()
+        n_new = data.size
+        if n_new == 0:
+            return self
+
+        mean_new = data.mean()
+        ss_new = np.dot(data - mean_new, data - mean_new)
+
+        n_tot = self.n + n_new
+        delta = mean_new - self.mean
+        self.ss = self.ss + ss_new + delta * delta * self.n * n_new / n_tot
+        self.mean = self.mean + delta * n_new / n_tot
+        self.n = n_tot
+
+        return self
+
+    def log_likelihood(self, mu, std=None):
+        """
+        Gaussian log-likelihood of the whole data set.
+
+        input: mu -> mean, scalar or array
+               std -> standard deviation, scalar or array broadcastable
+                      to mu (default is the known std given at creation)
+
+        output: log-likelihood, broadcast shape of mu and std
+        """
+
+        if std is None:
+            std = self.std
+        if std is None:
+            raise ValueError('std must be given for an unknown-variance model')
+
+        mu = np.asarray(mu, dtype=float)
+        std = np.asarray(std, dtype=float)
+
+        # sum_i (x_i - mu)^2 = ss + n * (mean - mu)^2
+        dev = self.mean - mu
+        sq = self.ss + self.n * dev * dev
+
+        return -0.5 * sq / (std * std) - self.n * (np.log(std) + 0.5 * LOG_2PI)
+
+
+class LinearGaussianLikelihood(object):
+    """
+    Likelihood of the Gaussian linear model y ~ N(X beta, sd^2), stored
+    as the Gram matrix X^T X, X^T y, y^T y and n.
+
+    After these are accumulated (in one pass, or chunk by chunk with
+    update) each evaluation costs O(p^2) instead of O(n p).
+
+    input: X -> design matrix (n, p), including the intercept column
+                (optional, may be added later in chunks with update)
+           y -> response vector (n,)
+    """
+
+    def __init__(self, X=None, y=None):
+        self.n = 0
+        self.xtx = None
+        self.xty = None
+        self.yty = 0.0
+
+        if X is not None:
+            self.update(X, y)
+
+    def update(self, X, y):
+        """
+        Add a chunk of rows.
+
+        input: X -> design matrix (n_rows, p)
+               y -> response vector (n_rows,)
+        """
+
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float).ravel()
+        if X.ndim == 1:
+            X = X[:, None]
+
+        if self.xtx is None:
+            self.xtx = np.zeros((X.shape[1], X.shape[1]))
+            self.xty = np.zeros(X.shape[1])
+
+        self.n += y.size
+        self.xtx += np.dot(X.T, X)
+        self.xty += np.dot(X.T, y)
+        self.yty += np.dot(y, y)
+
+        return self
+
+    def rss(self, beta):
+        """
+        Residual sum of squares.
+
+        input: beta -> coefficients, array (p,) or (m, p)
+
+        output: scalar or array (m,)
+        """
+
+        beta = np.asarray(beta, dtype=float)
+
+        # |y - X beta|^2 = y'y - 2 beta'X'y + beta'X'X beta
+        quad = np.einsum('...i,ij,...j->...', beta, self.xtx, beta)
+        return self.yty - 2.0 * np.dot(beta, self.xty) + quad
+
+    def log_likelihood(self, beta, sd):
+        """
+        Gaussian log-likelihood of the whole data set.
+
+        input: beta -> coefficients, array (p,) or (m, p)
+               sd -> standard deviation, scalar or array (m,)
+
+        output: scalar or array (m,)
+        """
+
+        sd = np.asarray(sd, dtype=float)
+        return (-0.5 * self.rss(beta) / (sd * sd) -
+                self.n * (np.log(sd) + 0.5 * LOG_2PI))
@@ -0,0 +1,153 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Metropolis-Hastings for the Gaussian linear model, ported from
+Day_1/Ex4_my_MCMC_lm.R.
+
+Parameters are (beta_1, ..., beta_p, sd), with Gaussian priors on the
+coefficients and a uniform prior on sd. The likelihood is evaluated from
+the precomputed Gram matrix (likelihoods.LinearGaussianLikelihood), so a
+step costs O(p^2) whatever the number of rows, and all chains advance
+together as one (n_chains, p + 1) array.
+"""
+
+
+import functools
+
+import numpy as np
+
+from chain_store import ChainStore
+from diagnostics import estimate_burn_in, split_rhat
+from likelihoods import LinearGaussianLikelihood
+from mcmc import normal_logpdf
+
+
+def linear_model_log_posterior(likelihood, prior_sd=10.0, sd_min=0.001,
+                               sd_max=30.0):
+    """
+    Log-posterior of the Gaussian linear model with the priors of
+    Ex4_my_MCMC_lm.R: beta_k ~ N(0, prior_sd), sd ~ U(sd_min, sd_max).
+
+    input: likelihood -> LinearGaussianLikelihood, or a tuple (X, y)
+           prior_sd -> standard deviation of the coefficient priors
+                       (default is 10)
+           sd_min, sd_max -> bounds of the uniform prior on sd
+                             (default is 0.001 and 30)
+
+    output: vectorized log-target, mapping an array (m, p + 1) of
+            (beta, sd) into m log-posterior values
+    """
+
+    if not isinstance(likelihood, LinearGaussianLikelihood):
+        likelihood = LinearGaussianLikelihood(*likelihood)
+
+    return functools.partial(_linear_model_log_target, likelihood=likelihood,
+                             prior_sd=prior_sd, sd_min=sd_min, sd_max=sd_max)
+
+
+def _linear_model_log_target(theta, likelihood, prior_sd, sd_min, sd_max):
+    """Log-target built by linear_model_log_posterior."""
+
+    beta = theta[:, :-1]
+    sd = theta[:, -1]
+
+    inside = (sd > sd_min) & (sd < sd_max)
+    safe_sd = np.where(inside, sd, 1.0)
+
+    log_prior = (normal_logpdf(beta, 0.0, prior_sd).sum(axis=1) -
+                 np.log(sd_max - sd_min))
+    log_post = likelihood.log_likelihood(beta, safe_sd) + log_prior
+
+    return np.where(inside, log_post, -np.inf)
+
+
+def linear_model_mh(log_target, start, n_samples, n_chains=1,
+                    beta_width=0.25, sd_width=1.0, sd_floor=1e-3,
+                    block_size=1000, memory_limit=2 ** 30, monitor=None,
+                    seed=None):
+    """
+    Metropolis-Hastings with the proposal of Ex4_my_MCMC_lm.R: a Gaussian
+    random walk on the coefficients and a uniform step on sd, truncated
+    from below, sd' = max(sd_floor, U(sd - sd_width, sd + sd_width)).
+
+    input: log_target -> vectorized log-density of (beta, sd), e.g. from
+                         linear_model_log_posterior
+           start -> starting point (beta, sd), array (p + 1,) shared by all
+                    chains or array (n_chains, p + 1)
+           n_samples -> number of draws to store per chain
+           n_chains -> number of chains advanced together (default is 1)
+           beta_width -> standard deviation of the coefficient steps,
+                         scalar or array (p,) (default is 0.25)
+           sd_width -> half width of the uniform sd step (default is 1)
+           sd_floor -> lower truncation of the sd proposal (default 1e-3)
+           block_size -> number of steps whose random numbers are
+                         drawn at once (default is 1000)
+           memory_limit -> size in bytes above which draws are kept in a
+                           memory-mapped file (default is 1 GB)
+           monitor -> diagnostics.OnlineDiagnostics updated with the stored
+                      draws after every block (optional)
+           seed -> int, numpy.random.Generator or None
+
+    output: dictionary with keywords
+                chains -> read-only array (n_chains, n_samples, p + 1)
+                log_target -> read-only array (n_chains, n_samples)
+                acceptance_rate -> array (n_chains,) of acceptance fractions
+                burn_in -> estimated number of draws per chain to discard
+                rhat -> array (p + 1,) of split R-hat after burn_in
+    """
+
+    rng = np.random.default_rng(seed)
+
+    start = np.asarray(start, dtype=float)
+    if start.ndim < 2:
+        start = np.tile(start, (n_chains, 1))
+    current = start.copy()
+    n_params = current.shape[1]
+    width = np.broadcast_to(np.asarray(beta_width, dtype=float),
+                            (n_params - 1,))
+
+    lp_current = log_target(current)
+    if not np.all(np.isfinite(lp_current)):
+        raise ValueError('log_target is not finite at some starting points')
+
+    block_size = max(1, min(block_size, 2 ** 20 // (n_chains * n_params)))
+
+    chains = ChainStore(n_samples, (n_chains, n_params),
+                        memory_limit=memory_limit)
+    log_prob = ChainStore(n_samples, (n_chains,), memory_limit=memory_limit)
+    n_accept = np.zeros(n_chains)
+
+    for first in range(0, n_samples, block_size):
+        n_block = min(block_size, n_samples - first)
+        n_stored = len(chains)
+        beta_steps = rng.standard_normal((n_block, n_chains, n_params - 1))
+        beta_steps *= width
+        sd_steps = rng.uniform(-sd_width, sd_width, (n_block, n_chains))
+        log_u = np.log(rng.random((n_block, n_chains)))
+
+        for i in range(n_block):
+            proposal = np.empty_like(current)
+            proposal[:, :-1] = current[:, :-1] + beta_steps[i]
+            proposal[:, -1] = np.maximum(sd_floor,
+                                         current[:, -1] + sd_steps[i])
+            lp_proposal = log_target(proposal)
+
+            accept = log_u[i] < lp_proposal - lp_current
+            current[accept] = proposal[accept]
+            lp_current[accept] = lp_proposal[accept]
+            n_accept += accept
+
+            chains.append(current)
+            log_prob.append(lp_current)
+
+        if monitor is not None:
+            monitor.update(chains.view()[n_stored:].transpose(1, 0, 2))
+
+    chains = chains.view().transpose(1, 0, 2)
+    burn_in = estimate_burn_in(chains)
+
+    return {'chains': chains,
+            'log_target': log_prob.view().T,
+            'acceptance_rate': n_accept / float(n_samples),
+            'burn_in': burn_in,
+            'rhat': split_rhat(chains[:, burn_in:])}
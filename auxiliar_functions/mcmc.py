@@ -0,0 +1,304 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Random-walk Metropolis-Hastings sampler working on log-densities.
+
+The target is given as a vectorized log-density: a callable that receives
+an array of shape (m, n_params) and returns the m log-densities. Working
+in log space avoids the underflow of raw likelihood products, and all
+random numbers (proposal steps and acceptance uniforms) are drawn in
+blocks instead of one frozen scipy.stats object per step.
+"""
+
+
+import functools
+
+import numpy as np
+
+from chain_store import ChainStore
+from diagnostics import estimate_burn_in, split_rhat
+from likelihoods import NormalLikelihood
+
+
+LOG_2PI = np.log(2.0 * np.pi)
+
+
+def normal_logpdf(x, loc, scale):
+    """
+    Log of the Gaussian probability density function.
+
+    input: x -> array of points
+           loc -> mean (scalar or array broadcastable to x)
+           scale -> standard deviation (scalar or array broadcastable to x)
+
+    output: array with log-densities, broadcast shape of the inputs
+    """
+
+    z = (x - loc) / scale
+    return -0.5 * z * z - np.log(scale) - 0.5 * LOG_2PI
+
+
+def normal_mean_log_posterior(data, std, prior_mean, prior_std):
+    """
+    Log-posterior for the mean of a Gaussian with known, constant
+    standard deviation and a Gaussian prior on the mean (model of
+    Day_1/Ex3b_my_MCMC_normal_hist.py).
+
+    The data are reduced to their sufficient statistics once, so each
+    evaluation costs O(1) instead of a pass over the data.
+
+    input: data -> array of observations or a NormalLikelihood
+           std -> known standard deviation of the observations
+           prior_mean, prior_std -> parameters of the Gaussian prior
+
+    output: vectorized log-target, mapping an array of shape (m, 1)
+            into m log-posterior values
+    """
+
+    if not isinstance(data, NormalLikelihood):
+        data = NormalLikelihood(data)
+
+    # a partial of a module-level function can be sent to worker processes
+    return functools.partial(_normal_mean_log_target, likelihood=data,
+                             std=std, prior_mean=prior_mean,
+                             prior_std=prior_std)
+
+
+def _normal_mean_log_target(theta, likelihood, std, prior_mean, prior_std):
+    """Log-target built by normal_mean_log_posterior."""
+
+    mu = theta[:, 0]
+    return (likelihood.log_likelihood(mu, std) +
+            normal_logpdf(mu, prior_mean, prior_std))
+
+
+def _target_acceptance(n_params):
+    """Optimal random-walk acceptance rate (Roberts & Rosenthal, 2001)."""
+
+    return 0.44 if n_params == 1 else 0.234
+
+
+def _adapt_log_scale(log_scale, log_ratio, step, target):
+    """
+    Robbins-Monro update of the log proposal scale towards a target
+    acceptance rate, with a decaying gain so the adaptation settles.
+    """
+
+    accept_prob = np.exp(np.minimum(0.0, np.nan_to_num(log_ratio, nan=-np.inf)))
+    return log_scale + (accept_prob - target) / (step + 1.0) ** 0.6
+
+
+def metropolis_hastings(log_target, start, n_samples, proposal_width=1.0,
+                        n_warmup=0, target_acceptance=None, block_size=1000,
+                        memory_limit=2 ** 30, monitor=None, seed=None):
+    """
+    Random-walk Metropolis-Hastings with Gaussian proposals.
+
+    During the first n_warmup steps the proposal width is scaled towards
+    the target acceptance rate; it is then frozen and the following
+    n_samples draws are stored. The number of stored draws still far
+    from convergence is estimated automatically (end of the initial
+    transient, confirmed by a Geweke test).
+
+    input: log_target -> vectorized log-density, array (m, n_params) -> (m,)
+           start -> starting point, scalar or array of n_params
+           n_samples -> number of draws to store
+           proposal_width -> standard deviation of the random-walk step,
+                             scalar or array of n_params (default is 1);
+                             starting value if n_warmup > 0
+           n_warmup -> number of adaptive steps, not stored (default is 0)
+           target_acceptance -> acceptance rate targeted during warm-up
+                                (default is 0.44 for one parameter,
+                                0.234 otherwise)
+           block_size -> number of steps whose random numbers are
+                         drawn at once (default is 1000)
+           memory_limit -> size in bytes above which draws are kept in a
+                           memory-mapped file (default is 1 GB)
+           monitor -> diagnostics.OnlineDiagnostics updated with the stored
+                      draws after every block (optional)
+           seed -> int, numpy.random.Generator or None
+
+    output: dictionary with keywords
+                chain -> read-only array (n_samples, n_params) of draws
+                log_target -> array (n_samples,) of log-target values
+                acceptance_rate -> fraction of accepted proposals after warm-up
+                proposal_width -> array (n_params,) of the frozen widths
+                burn_in -> estimated number of draws of chain to discard
+    """
+
+    rng = np.random.default_rng(seed)
+
+    current = np.atleast_1d(np.asarray(start, dtype=float)).copy()
+    n_params = current.shape[0]
+    base_width = np.broadcast_to(np.asarray(proposal_width, dtype=float),
+                                 (n_params,))
+    if target_acceptance is None:
+        target_acceptance = _target_acceptance(n_params)
+
+    lp_current = log_target(current[None, :])[0]
+    if not np.isfinite(lp_current):
+        raise ValueError('log_target is not finite at the starting point')
+
+    n_total = n_warmup + n_samples
+    chain = ChainStore(n_samples, (n_params,), memory_limit=memory_limit)
+    log_prob = ChainStore(n_samples, memory_limit=memory_limit)
+    n_accept = 0
+    log_scale = 0.0
+    width = base_width
+
+    for first in range(0, n_total, block_size):
+        n_block = min(block_size, n_total - first)
+        n_stored = len(chain)
+        steps = rng.standard_normal((n_block, n_params))
+        log_u = np.log(rng.random(n_block))
+
+        for i in range(n_block):
+            t = first + i
+            proposal = current + steps[i] * width
+            lp_proposal = log_target(proposal[None, :])[0]
+            log_ratio = lp_proposal - lp_current
+
+            # accept with probability min(1, p_proposal / p_current)
+            accept = log_u[i] < log_ratio
+            if accept:
+                current = proposal
+                lp_current = lp_proposal
+
+            if t < n_warmup:
+                log_scale = _adapt_log_scale(log_scale, log_ratio, t,
+                                             target_acceptance)
+                width = base_width * np.exp(log_scale)
+            else:
+                n_accept += accept
+                chain.append(current)
+                log_prob.append(lp_current)
+
+        if monitor is not None and len(chain) > n_stored:
+            monitor.update(chain.view()[None, n_stored:])
+
+    chain = chain.view()
+
+    return {'chain': chain,
+            'log_target': log_prob.view(),
+            'acceptance_rate': n_accept / float(n_samples),
+            'proposal_width': np.array(width),
+            'burn_in': estimate_burn_in(chain[None])}
+
+
+def metropolis_hastings_chains(log_target, start, n_samples, n_chains,
+                               proposal_width=1.0, n_warmup=0,
+                               target_acceptance=None, block_size=1000,
+                               memory_limit=2 ** 30, monitor=None,
+                               seed=None):
+    """
+    Random-walk Metropolis-Hastings advancing many chains at once.
+
+    The state of all chains is kept in one array of shape
+    (n_chains, n_params); proposals, log-target evaluations and the
+    accept/reject step are single vectorized operations across chains,
+    so the log-target must accept an (n_chains, n_params) array.
+    Warm-up adaptation and burn-in detection (split R-hat) work as in
+    metropolis_hastings, with one proposal scale per chain.
+
+    input: log_target -> vectorized log-density, array (m, n_params) -> (m,)
+           start -> starting points, array (n_chains, n_params) or a single
+                    point (scalar or array of n_params) shared by all chains
+           n_samples -> number of draws to store per chain
+           n_chains -> number of chains
+           proposal_width -> standard deviation of the random-walk step,
+                             scalar, array of n_params or array
+                             (n_chains, n_params) (default is 1);
+                             starting value if n_warmup > 0
+           n_warmup -> number of adaptive steps, not stored (default is 0)
+           target_acceptance -> acceptance rate targeted during warm-up
+                                (default is 0.44 for one parameter,
+                                0.234 otherwise)
+           block_size -> number of steps whose random numbers are
+                         drawn at once (default is 1000)
+           memory_limit -> size in bytes above which draws are kept in a
+                           memory-mapped file (default is 1 GB)
+           monitor -> diagnostics.OnlineDiagnostics updated with the stored
+                      draws after every block (optional)
+           seed -> int, numpy.random.Generator or None
+
+    output: dictionary with keywords
+                chains -> read-only array (n_chains, n_samples, n_params)
+                          of draws
+                log_target -> read-only array (n_chains, n_samples) of
+                              log-target values
+                acceptance_rate -> array (n_chains,) of acceptance fractions
+                                   after warm-up
+                proposal_width -> array (n_chains, n_params) of frozen widths
+                burn_in -> estimated number of draws per chain to discard
+                rhat -> array (n_params,) of split R-hat across chains,
+                        after discarding burn_in draws
+    """
+
+    rng = np.random.default_rng(seed)
+
+    start = np.asarray(start, dtype=float)
+    if start.ndim < 2:
+        start = np.tile(np.atleast_1d(start), (n_chains, 1))
+    current = start.copy()
+    if current.shape[0] != n_chains:
+        raise ValueError('start must have one row per chain')
+    n_params = current.shape[1]
+    base_width = np.broadcast_to(np.asarray(proposal_width, dtype=float),
+                                 (n_chains, n_params))
+    if target_acceptance is None:
+        target_acceptance = _target_acceptance(n_params)
+
+    lp_current = log_target(current)
+    if not np.all(np.isfinite(lp_current)):
+        raise ValueError('log_target is not finite at some starting points')
+
+    # keep the pre-drawn random numbers within a few MB
+    block_size = max(1, min(block_size, 2 ** 20 // (n_chains * n_params)))
+
+    n_total = n_warmup + n_samples
+    chains = ChainStore(n_samples, (n_chains, n_params),
+                        memory_limit=memory_limit)
+    log_prob = ChainStore(n_samples, (n_chains,), memory_limit=memory_limit)
+    n_accept = np.zeros(n_chains)
+    log_scale = np.zeros(n_chains)
+    width = base_width
+
+    for first in range(0, n_total, block_size):
+        n_block = min(block_size, n_total - first)
+        n_stored = len(chains)
+        steps = rng.standard_normal((n_block, n_chains, n_params))
+        log_u = np.log(rng.random((n_block, n_chains)))
+
+        for i in range(n_block):
+            t = first + i
+            proposal = current + steps[i] * width
+            lp_proposal = log_target(proposal)
+            log_ratio = lp_proposal - lp_current
+
+            accept = log_u[i] < log_ratio
+            current[accept] = proposal[accept]
+            lp_current[accept] = lp_proposal[accept]
+
+            if t < n_warmup:
+                log_scale = _adapt_log_scale(log_scale, log_ratio, t,
+                                             target_acceptance)
+                width = base_width * np.exp(log_scale)[:, None]
+            else:
+                n_accept += accept
+                chains.append(current)
+                log_prob.append(lp_current)
+
+        if monitor is not None and len(chains) > n_stored:
+            monitor.update(chains.view()[n_stored:].transpose(1, 0, 2))
+
+    # stores index draws first; hand out (n_chains, n_samples, ...) views
+    chains = chains.view().transpose(1, 0, 2)
+    log_prob = log_prob.view().T
+    burn_in = estimate_burn_in(chains)
+
+    return {'chains': chains,
+            'log_target': log_prob,
+            'acceptance_rate': n_accept / float(n_samples),
+            'proposal_width': np.array(width),
+            'burn_in': burn_in,
+            'rhat': split_rhat(chains[:, burn_in:])}
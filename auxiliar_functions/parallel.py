@@ -0,0 +1,201 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Independent MCMC chains run in parallel worker processes.
+
+Every chain gets its own numpy.random.Generator, spawned from a single
+root SeedSequence. Streams are attached to chains, not to workers, so
+the merged output for a given root seed is bit-identical whatever the
+number of workers, and no chain touches the global numpy random state.
+
+JAGS runs all chains of a pyjags.Model in one process, on one core;
+run_parallel_jags builds a one-chain model per worker process instead,
+each chain with its own JAGS random number generator seed, and merges
+the draws back into the layout of pyjags.Model.sample.
+"""
+
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from diagnostics import estimate_burn_in, split_rhat
+from mcmc import metropolis_hastings
+
+
+def chain_generators(n_chains, seed=None):
+    """
+    Independent random generators, one per chain.
+
+    input: n_chains -> number of generators
+           seed -> int, SeedSequence or None (fresh entropy)
+
+    output: list of n_chains numpy.random.Generator
+    """
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [np.random.default_rng(child) for child in seed.spawn(n_chains)]
+
+
+def _run_chain(sampler, log_target, start, rng, kwargs):
+    """Run one chain in a worker process."""
+
+    return sampler(log_target, start, seed=rng, **kwargs)
+
+
+def run_parallel_chains(log_target, start, n_samples, n_chains, seed=None,
+                        max_workers=None, sampler=metropolis_hastings,
+                        **kwargs):
+    """
+    Run independent chains in a pool of worker processes and merge them.
+
+    log_target (and sampler) must be picklable, e.g. module-level
+    functions or functools.partial objects such as the ones returned by
+    mcmc.normal_mean_log_posterior.
+
+    input: log_target -> vectorized log-density, array (m, n_params) -> (m,)
+           start -> starting points, array (n_chains, n_params) or a single
+                    point (scalar or array of n_params) shared by all chains
+           n_samples -> number of draws to store per chain
+           n_chains -> number of chains
+           seed -> root seed: int, SeedSequence or None (fresh entropy)
+           max_workers -> number of worker processes (default is the
+                          number of CPUs); 1 runs the chains in this process
+           sampler -> single-chain sampler with the signature of
+                      mcmc.metropolis_hastings (default) or hmc.nuts_chain
+           other keywords are passed to the sampler
+
+    output: dictionary with keywords
+                chains -> array (n_chains, n_samples, n_params) of draws
+                log_target -> array (n_chains, n_samples) of log-target values
+                burn_in -> estimated number of draws per chain to discard
+                rhat -> array (n_params,) of split R-hat across chains,
+                        after discarding burn_in draws
+                seed_entropy -> entropy of the root SeedSequence, which
+                                reproduces the run when given as seed
+            and the other outputs of the sampler, stacked over chains
+            (e.g. acceptance_rate, proposal_width or step_size)
+    """
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    rngs = chain_generators(n_chains, seed)
+
+    start = np.asarray(start, dtype=float)
+    if start.ndim < 2:
+        start = np.tile(np.atleast_1d(start), (n_chains, 1))
+    if start.shape[0] != n_chains:
+        raise ValueError('start must have one row per chain')
+
+    kwargs['n_samples'] = n_samples
+    args = ([sampler] * n_chains, [log_target] * n_chains, list(start),
+            rngs, [kwargs] * n_chains)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, n_chains)
+
+    if max_workers == 1:
+        results = list(map(_run_chain, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_run_chain, *args))
+
+    chains = np.stack([r['chain'] for r in results])
+    burn_in = estimate_burn_in(chains)
+
+    out = {'chains': chains,
+           'log_target': np.stack([r['log_target'] for r in results]),
+           'burn_in': burn_in,
+           'rhat': split_rhat(chains[:, burn_in:]),
+           'seed_entropy': seed.entropy}
+
+    # other per-chain outputs (acceptance rate, step size, ...) are stacked
+    for key in results[0]:
+        if key not in ('chain', 'log_target', 'burn_in'):
+            out[key] = np.array([r[key] for r in results])
+
+    return out
+
+
+def _jags_inits(n_chains, seed=None, init=None):
+    """
+    Initial values of every chain, with its own JAGS random number
+    generator: chain k uses seed + k, as in fit_runner, so a parallel
+    run reproduces the chains of a single-process run with the same seed.
+    """
+
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0] % 2 ** 30)
+    if init is None or isinstance(init, dict):
+        init = [init] * n_chains
+    if len(init) != n_chains:
+        raise ValueError('init must hold one dictionary per chain')
+
+    return [dict(init_k or {}, **{'.RNG.name': 'base::Mersenne-Twister',
+                                  '.RNG.seed': seed + k})
+            for k, init_k in enumerate(init)]
+
+
+def _run_jags_chain(model_code, data, vars, init, n_samples, adapt,
+                    n_warmup, thin, kwargs):
+    """Run one JAGS chain in a worker process."""
+
+    import pyjags
+
+    model = pyjags.Model(model_code, data=data, init=[init], chains=1,
+                         adapt=adapt, **kwargs)
+    if n_warmup:
+        model.update(n_warmup)
+    samples = model.sample(n_samples * thin, vars=vars, thin=thin)
+    return dict((var, np.asarray(values)) for var, values in samples.items())
+
+
+def run_parallel_jags(model_code, data, vars, n_samples, n_chains=3,
+                      adapt=1000, n_warmup=0, thin=1, seed=None, init=None,
+                      max_workers=None, **kwargs):
+    """
+    Run the chains of a JAGS program in a pool of worker processes, one
+    pyjags.Model of a single chain per process.
+
+    input: model_code -> JAGS program
+           data -> data dictionary
+           vars -> names of the monitored nodes
+           n_samples -> number of stored draws per chain
+           n_chains -> number of chains (default is 3)
+           adapt -> adaptation iterations (default is 1000)
+           n_warmup -> burn-in iterations, not stored (default is 0)
+           thin -> thinning interval (default is 1)
+           seed -> seed of the JAGS random number generators, chain k
+                   using seed + k (default is None: random)
+           init -> initial values, one dictionary shared by all chains or
+                   a list with one per chain (default is None)
+           max_workers -> number of worker processes (default is the
+                          number of CPUs); 1 runs the chains in this process
+           other keywords are passed to pyjags.Model
+
+    output: dictionary {name: array (*dims, n_samples, n_chains)}, as
+            returned by pyjags.Model.sample
+    """
+
+    inits = _jags_inits(n_chains, seed, init)
+    args = ([model_code] * n_chains, [data] * n_chains,
+            [list(vars)] * n_chains, inits, [n_samples] * n_chains,
+            [adapt] * n_chains, [n_warmup] * n_chains, [thin] * n_chains,
+            [kwargs] * n_chains)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, n_chains)
+
+    if max_workers == 1:
+        results = list(map(_run_jags_chain, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_run_jags_chain, *args))
+
+    # one-chain arrays (*dims, n, 1) are joined along the chain axis
+    return dict((var, np.concatenate([r[var] for r in results], axis=-1))
+                for var in results[0])
@@ -0,0 +1,201 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Gibbs sampling of logistic regression by Polya-Gamma data augmentation
+(Polson, Scott & Windle 2013, JASA 108, 1339).
+
+For y_i ~ bernoulli_logit(x_i beta) and omega_i ~ PG(1, x_i beta),
+
+    omega_i | beta ~ PG(1, x_i beta)
+    beta | omega, y ~ normal(V X^T kappa, V),
+                      V = (X^T diag(omega) X + B^-1)^-1, kappa = y - 1/2
+
+for a normal(0, B) prior on beta. Both conditionals are sampled exactly,
+so the chain moves the whole of beta at every iteration and mixes in a
+few steps, whatever the number of columns of X. The PG(1, c) draws use
+Devroye's exact accept-reject sampler, run on all observations at once.
+"""
+
+
+import numpy as np
+from scipy.special import ndtr
+
+from glm import BernoulliLogitGLM, _beta_prior
+
+
+TRUNC = 0.64                        # switch point of the two proposals
+
+
+def _series_rate(x):
+    """
+    Rate of the alternating series of the J*(1, z) density at x, whose
+    n-th term relative to the first is 2 (n + 1/2) exp(-((n + 1/2)^2 -
+    1/4) rate): pi^2 x / 2 above TRUNC, 2 / x below.
+    """
+
+    return np.where(x > TRUNC, 0.5 * np.pi * np.pi * x, 2.0 / x)
+
+
+def _truncated_inverse_gaussian(z, rng):
+    """Inverse-Gaussian(1 / z, 1) draws truncated to (0, TRUNC)."""
+
+    x = np.empty(z.shape)
+    with np.errstate(divide='ignore'):
+        mu = 1.0 / z
+
+    # large mean: t / (1 + t E)^2 proposals, accepted w.p. exp(-z^2 x / 2)
+    todo = np.flatnonzero(mu > TRUNC)
+    while todo.size:
+        e1 = rng.standard_exponential(todo.size)
+        e2 = rng.standard_exponential(todo.size)
+        proposal = TRUNC / (1.0 + TRUNC * e1) ** 2
+        ok = (e1 * e1 <= 2.0 * e2 / TRUNC) & \
+            (rng.random(todo.size) <= np.exp(-0.5 * z[todo] ** 2 * proposal))
+        x[todo[ok]] = proposal[ok]
+        todo = todo[~ok]
+
+    # small mean: untruncated inverse-Gaussian draws, kept below TRUNC
+    todo = np.flatnonzero(mu <= TRUNC)
+    while todo.size:
+        m = mu[todo]
+        y = rng.standard_normal(todo.size) ** 2
+        proposal = m + 0.5 * m * m * y - \
+            0.5 * m * np.sqrt(4.0 * m * y + (m * y) ** 2)
+        flip = rng.random(todo.size) > m / (m + proposal)
+        proposal = np.where(flip, m * m / proposal, proposal)
+        ok = proposal < TRUNC
+        x[todo[ok]] = proposal[ok]
+        todo = todo[~ok]
+
+    return x
+
+
+def random_polya_gamma(c, rng=None):
+    """
+    Draws of PG(1, c), with Devroye's exact sampler vectorized over c.
+
+    Each PG(1, c) is J*(1, |c| / 2) / 4. J* is proposed from an
+    exponential tail above TRUNC or a truncated inverse-Gaussian below
+    it and accepted by evaluating the alternating series of its density
+    until the decision is certain (more than 99.9% of proposals are
+    accepted, after about two series terms).
+
+    input: c -> array of tilting parameters
+           rng -> int, numpy.random.Generator or None
+
+    output: array of the shape of c
+    """
+
+    rng = np.random.default_rng(rng)
+    c = np.asarray(c, dtype=float)
+    z = 0.5 * np.abs(c).ravel()
+
+    # mixture weights of the two proposals, p / (p + q); p underflows
+    # first for large z, where the tail proposal is never used
+    k = 0.125 * np.pi * np.pi + 0.5 * z * z
+    p = 0.5 * np.pi / k * np.exp(-k * TRUNC)
+    root = np.sqrt(TRUNC)
+    with np.errstate(over='ignore', invalid='ignore'):
+        q = 2.0 * (np.exp(-z) * ndtr((TRUNC * z - 1.0) / root) +
+                   np.exp(z) * ndtr(-(TRUNC * z + 1.0) / root))
+        prob_tail = np.where(p > 0.0, p / (p + q), 0.0)
+
+    out = np.empty(z.size)
+    todo = np.arange(z.size)
+    while todo.size:
+        tail = rng.random(todo.size) < prob_tail[todo]
+        x = np.empty(todo.size)
+        x[tail] = TRUNC + \
+            rng.standard_exponential(tail.sum()) / k[todo[tail]]
+        x[~tail] = _truncated_inverse_gaussian(z[todo[~tail]], rng)
+
+        # alternating series, relative to its first term: accept below a
+        # lower partial sum, reject above an upper one
+        rate = _series_rate(x)
+        s = np.ones(todo.size)
+        u = rng.random(todo.size)
+        accept = np.zeros(todo.size, dtype=bool)
+        active = np.arange(todo.size)
+        n = 0
+        while active.size:
+            n += 1
+            h = n + 0.5
+            term = 2.0 * h * np.exp(-(h * h - 0.25) * rate[active])
+            if n % 2:
+                s[active] -= term
+                done = u[active] <= s[active]
+                accept[active[done]] = True
+            else:
+                s[active] += term
+                done = u[active] > s[active]
+            active = active[~done]
+
+        out[todo[accept]] = 0.25 * x[accept]
+        todo = todo[~accept]
+
+    return out.reshape(c.shape)
+
+
+class PolyaGammaLogit(BernoulliLogitGLM):
+    """
+    Logistic regression, y ~ bernoulli_logit(X beta), sampled by
+    Polya-Gamma Gibbs sampling with the 'numpy' backend of fit_runner
+    (log_density_grad is still available for hmc.nuts).
+
+    input: X -> design matrix (n, p)
+           y -> array (n,) of 0/1 responses
+           prior_sd -> sd of the normal priors on beta (default is 100;
+                       None for flat priors)
+    """
+
+    def sample_gibbs(self, n_samples, n_chains=1, n_warmup=0, seed=None,
+                     start=None):
+        """
+        Polya-Gamma Gibbs chains, run side by side.
+
+        input: n_samples -> stored draws per chain
+               n_chains -> number of chains (default is 1)
+               n_warmup -> discarded iterations per chain (default is 0)
+               seed -> int, numpy.random.Generator or None
+               start -> initial beta, array (p,) or (n_chains, p)
+                        (default is 0)
+
+        output: dictionary with keywords
+                    chains -> array (n_chains, n_samples, p) of beta
+                    log_target -> array (n_chains, n_samples) of the
+                                  log-posterior of the draws
+        """
+
+        rng = np.random.default_rng(seed)
+        X, p = self.X, self.n_params
+        prec0 = np.zeros((p, p)) if self.prior_sd is None else \
+            np.eye(p) / self.prior_sd ** 2
+        xkappa = np.dot(self.y - 0.5, X)
+
+        beta = np.zeros((n_chains, p))
+        if start is not None:
+            beta[:] = start
+        eta = np.dot(beta, X.T)
+
+        chains = np.empty((n_chains, n_samples, p))
+        log_target = np.empty((n_chains, n_samples))
+        for it in range(n_warmup + n_samples):
+            omega = random_polya_gamma(eta, rng)
+
+            # beta | omega ~ normal(P^-1 X^T kappa, P^-1), P = L L^T
+            prec = np.matmul(np.swapaxes(X * omega[:, :, None], 1, 2), X) + \
+                prec0
+            chol = np.linalg.cholesky(prec)
+            z = np.linalg.solve(chol, np.broadcast_to(
+                xkappa[:, None], (n_chains, p, 1)))
+            z += rng.standard_normal((n_chains, p, 1))
+            beta = np.linalg.solve(np.swapaxes(chol, 1, 2), z)[..., 0]
+            eta = np.dot(beta, X.T)
+
+            if it >= n_warmup:
+                chains[:, it - n_warmup] = beta
+                log_target[:, it - n_warmup] = \
+                    (self.y * eta - np.logaddexp(0.0, eta)).sum(axis=-1) + \
+                    _beta_prior(beta, self.prior_sd)[0]
+
+        return {'chains': chains, 'log_target': log_target}
@@ -0,0 +1,189 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Posterior predictions computed after sampling, from the parameter draws
+alone.
+
+Predictions on a grid used to be generated inside the samplers (Stan
+generated quantities, JAGS prediction nodes), which writes n_draws x
+n_points values per node through the sampler output. Here the sampler
+keeps only the parameters; expected responses, their quantile bands
+and replicated data are computed afterwards with NumPy, a block of grid
+points at a time, so the grid can be as fine as needed without holding
+the full (n_draws, n_points) matrix in memory.
+
+A model is described by two callables:
+    mean_fn(params, x) -> array (n_draws, n_points) of expected responses
+        for parameter draws params (n_draws, n_params) at grid points x;
+    noise(mean, params, rng) -> replicated data with the shape of mean,
+        drawn from the observation model.
+Factories are provided for polynomial predictors with an optional inverse
+link and for normal, Bernoulli and Poisson observations.
+"""
+
+
+import numpy as np
+from scipy.special import expit
+
+
+def polynomial_mean(coef_cols, inv_link=None):
+    """
+    Expected response of a polynomial predictor,
+    inv_link(b_0 + b_1 x + b_2 x^2 + ...).
+
+    input: coef_cols -> columns of params holding b_0, b_1, ...
+           inv_link -> inverse link function, e.g. scipy.special.expit or
+                       numpy.exp (default is the identity)
+
+    output: callable mean_fn(params, x)
+    """
+
+    coef_cols = list(coef_cols)
+
+    def mean_fn(params, x):
+        x = np.asarray(x, dtype=float)
+        powers = x[None, :] ** np.arange(len(coef_cols))[:, None]
+        eta = np.dot(params[:, coef_cols], powers)
+        return eta if inv_link is None else inv_link(eta)
+
+    return mean_fn
+
+
+def logit_mean(coef_cols):
+    """Polynomial predictor with logistic inverse link (Bernoulli-logit)."""
+
+    return polynomial_mean(coef_cols, inv_link=expit)
+
+
+def normal_noise(sd_col):
+    """
+    Normal observations around the mean.
+
+    input: sd_col -> column of params holding the standard deviation
+    """
+
+    def noise(mean, params, rng):
+        return rng.normal(mean, params[:, sd_col, None])
+
+    return noise
+
+
+def bernoulli_noise():
+    """Bernoulli observations with success probability equal to the mean."""
+
+    def noise(mean, params, rng):
+        return (rng.random(mean.shape) < mean).astype(int)
+
+    return noise
+
+
+def poisson_noise():
+    """Poisson observations with rate equal to the mean."""
+
+    def noise(mean, params, rng):
+        return rng.poisson(mean)
+
+    return noise
+
+
+def _flatten_draws(params):
+    """Merge chains: (n_chains, n_draws, n_params) -> (n, n_params)."""
+
+    params = np.asarray(params, dtype=float)
+    if params.ndim == 1:
+        params = params[:, None]
+    elif params.ndim == 3:
+        params = params.reshape(-1, params.shape[-1])
+    return params
+
+
+def _chunk_size(n_draws, memory_limit):
+    """Number of grid points per block for a given memory budget."""
+
+    return max(1, int(memory_limit // (8 * n_draws)))
+
+
+def predictive_bands(params, mean_fn, x, noise=None,
+                     probs=(0.025, 0.5, 0.975), memory_limit=2 ** 27,
+                     seed=None):
+    """
+    Posterior mean and quantile bands of the expected response on a grid,
+    and, if noise is given, quantile bands of new observations.
+
+    input: params -> parameter draws, array (n_draws, n_params) or
+                     (n_chains, n_draws, n_params)
+           mean_fn -> callable (params, x) -> array (n_draws, n_points)
+           x -> grid, array (n_points,)
+           noise -> callable (mean, params, rng) -> replicated data
+                    (default is None: bands of the expected response only)
+           probs -> quantile levels (default is 2.5%, 50% and 97.5%)
+           memory_limit -> bytes of the largest block of predictions held
+                           in memory (default is 128 MB)
+           seed -> int, numpy.random.Generator or None
+
+    output: dictionary with keywords
+                mean -> array (n_points,) of posterior mean responses
+                quantiles -> array (len(probs), n_points) of the expected
+                             response
+                pred_quantiles -> array (len(probs), n_points) of new
+                                  observations (only if noise is given)
+    """
+
+    params = _flatten_draws(params)
+    x = np.asarray(x, dtype=float)
+    rng = np.random.default_rng(seed)
+    q = 100 * np.asarray(probs)
+
+    out = {'mean': np.empty(x.shape[0]),
+           'quantiles': np.empty((len(probs), x.shape[0]))}
+    if noise is not None:
+        out['pred_quantiles'] = np.empty((len(probs), x.shape[0]))
+
+    step = _chunk_size(params.shape[0], memory_limit)
+    for start in range(0, x.shape[0], step):
+        block = slice(start, start + step)
+        mean = mean_fn(params, x[block])
+        out['mean'][block] = mean.mean(axis=0)
+        out['quantiles'][:, block] = np.percentile(mean, q, axis=0)
+        if noise is not None:
+            out['pred_quantiles'][:, block] = np.percentile(
+                noise(mean, params, rng), q, axis=0)
+
+    return out
+
+
+def replicate(params, mean_fn, x, noise, n_rep=1, memory_limit=2 ** 27,
+              seed=None):
+    """
+    Replicated data sets, each drawn with a different posterior draw.
+
+    input: params -> parameter draws, array (n_draws, n_params) or
+                     (n_chains, n_draws, n_params)
+           mean_fn -> callable (params, x) -> array (n_draws, n_points)
+           x -> grid or covariates, array (n_points,)
+           noise -> callable (mean, params, rng) -> replicated data
+           n_rep -> number of replicated data sets (default is 1)
+           memory_limit -> bytes of the largest block held in memory
+                           (default is 128 MB)
+           seed -> int, numpy.random.Generator or None
+
+    output: array (n_rep, n_points)
+    """
+
+    params = _flatten_draws(params)
+    x = np.asarray(x, dtype=float)
+    rng = np.random.default_rng(seed)
+
+    chosen = params[rng.choice(params.shape[0], n_rep,
+                               replace=n_rep > params.shape[0])]
+
+    reps = None
+    step = _chunk_size(n_rep, memory_limit)
+    for start in range(0, x.shape[0], step):
+        block = slice(start, start + step)
+        values = noise(mean_fn(chosen, x[block]), chosen, rng)
+        if reps is None:
+            reps = np.empty((n_rep, x.shape[0]), dtype=values.dtype)
+        reps[:, block] = values
+
+    return reps
@@ -0,0 +1,160 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Gaussian linear regression, y ~ normal(X beta, sigma), through a centred
+and QR-decomposed design.
+
+The non-constant columns of X are centred (if X has an intercept column)
+and the centred design is factorized as Q* R*, with Q* = Q sqrt(n - 1)
+and R* = R / sqrt(n - 1), as in the QR reparameterization of the Stan
+user's guide. In the coordinates theta = R* beta (up to the intercept
+shift of the centring) the coefficients are uncorrelated a posteriori
+whatever the conditioning of X, e.g. for raw powers 1, x, x^2, x^3.
+
+With a flat prior on beta and a flat prior on sigma (on (0, sigma_max)),
+as in the Stan programs of Day_2, the posterior is normal-inverse-gamma:
+
+    sigma^2 | y ~ inverse-gamma((n - p - 1) / 2, RSS / 2)
+    theta | sigma, y ~ normal(theta_hat, sigma / sqrt(n - 1))
+
+and independent draws are generated exactly. Other priors (normal priors
+on beta, as in the JAGS programs) are sampled with hmc.nuts in the theta
+coordinates, where the posterior is close to isotropic.
+"""
+
+
+import numpy as np
+from scipy.linalg import solve_triangular
+from scipy.stats import gamma
+
+from glm import GaussianGLM, _beta_prior
+
+
+class QRDesign(object):
+    """
+    Centred, scaled thin QR decomposition of a design matrix.
+
+    input: X -> design matrix (n, p); columns are centred only if one of
+                them is constant (the intercept)
+
+    attributes: q -> array (n, p), Q* with q^T q = (n - 1) I
+                a -> array (p, p) mapping theta to beta = a theta
+                center -> array (p,) of column means removed from X
+    """
+
+    def __init__(self, X):
+
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X[:, None]
+        n, p = X.shape
+
+        constant = np.all(X == X[0], axis=0)
+        self.center = np.zeros(p)
+        if constant.any():
+            self.center[~constant] = X[:, ~constant].mean(axis=0)
+
+        q, r = np.linalg.qr(X - self.center)
+        scale = np.sqrt(n - 1.0)
+        self.q = q * scale
+
+        # X beta = (X - center) beta', beta' = beta + e_0 (center . beta),
+        # with e_0 the intercept column; beta' = R*^-1 theta
+        self.a = solve_triangular(r / scale, np.eye(p))
+        if constant.any():
+            intercept = np.argmax(constant)
+            self.a[intercept] -= np.dot(self.center, self.a)
+
+    def to_beta(self, theta):
+        """Coefficients of the original design, array (..., p)."""
+
+        return np.dot(theta, self.a.T)
+
+
+class LinearRegression(GaussianGLM):
+    """
+    Normal linear model on a QR-reparameterized design, for the 'numpy'
+    backend of fit_runner.
+
+    theta = (R* beta, log sigma), or (R* beta, logit(sigma / sigma_max)).
+    names, constrain and the draws refer to the original beta and sigma.
+    If prior_sd is None the model is conjugate and sample_exact draws
+    from the posterior directly; otherwise log_density_grad is used by
+    hmc.nuts.
+
+    input: X -> design matrix (n, p)
+           y -> response vector (n,)
+           prior_sd -> sd of independent normal priors on beta
+                       (default is None: flat)
+           sigma_max -> upper bound of the flat prior on sigma
+                        (default is None)
+    """
+
+    def __init__(self, X, y, prior_sd=None, sigma_max=None):
+
+        self.design = QRDesign(X)
+        GaussianGLM.__init__(self, self.design.q, y, sigma_max=sigma_max)
+        self.beta_prior_sd = prior_sd
+        self.conjugate = prior_sd is None
+
+    def log_density_grad(self, theta):
+        lp, grad = GaussianGLM.log_density_grad(self, theta)
+        if self.beta_prior_sd is not None:
+            beta = self.design.to_beta(theta[..., :-1])
+            prior, dprior = _beta_prior(beta, self.beta_prior_sd)
+            lp = lp + prior
+            grad[..., :-1] += np.dot(dprior, self.design.a)
+        return lp, grad
+
+    def constrain(self, theta):
+        out = GaussianGLM.constrain(self, theta)
+        out[..., :-1] = self.design.to_beta(out[..., :-1])
+        return out
+
+    def sample_exact(self, n_samples, n_chains=1, seed=None):
+        """
+        Independent posterior draws of the conjugate model.
+
+        input: n_samples -> number of draws per chain
+               n_chains -> number of chains (default is 1)
+               seed -> int, numpy.random.Generator or None
+
+        output: dictionary with keywords
+                    chains -> array (n_chains, n_samples, p + 1) of
+                              (beta, sigma)
+                    log_target -> array (n_chains, n_samples) of the
+                                  log-density of the unconstrained draws
+        """
+
+        if not self.conjugate:
+            raise ValueError('exact sampling needs flat priors on beta')
+
+        rng = np.random.default_rng(seed)
+        lik = self.likelihood
+        p = lik.xtx.shape[0]
+        shape = (n_chains, n_samples)
+
+        scale = lik.n - 1.0
+        theta_hat = lik.xty / scale
+        rss = max(lik.yty - scale * np.dot(theta_hat, theta_hat), 0.0)
+
+        # sigma^2 = (rss / 2) / g with g ~ gamma((n - p - 1) / 2),
+        # truncated to sigma < sigma_max by inversion
+        shape_a = 0.5 * (lik.n - p - 1)
+        u = rng.random(shape)
+        if self.sigma_max is not None:
+            low = gamma.cdf(0.5 * rss / self.sigma_max ** 2, shape_a)
+            u = low + (1.0 - low) * u
+        sigma = np.sqrt(0.5 * rss / gamma.ppf(u, shape_a))
+
+        theta = np.empty(shape + (p + 1,))
+        theta[..., :-1] = theta_hat + (sigma / np.sqrt(scale))[..., None] * \
+            rng.standard_normal(shape + (p,))
+        if self.sigma_max is None:
+            theta[..., -1] = np.log(sigma)
+        else:
+            s = sigma / self.sigma_max
+            theta[..., -1] = np.log(s) - np.log1p(-s)
+
+        return {'chains': self.constrain(theta),
+                'log_target': self.log_density_grad(theta)[0]}
@@ -0,0 +1,205 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Stochastic-gradient MCMC for logistic regression on catalogues too large
+to be held in memory (or in a Stan data block).
+
+The design matrix and responses may be numpy.memmap arrays, e.g.
+np.load('X.npy', mmap_mode='r'): they are never copied. Full-data passes
+(only needed to find the posterior mode) read them in chunks of fixed
+size; every sampling iteration reads one minibatch of randomly chosen
+rows. Both the cost of an iteration and the memory in use are set by
+the batch size, whatever the number of rows N.
+
+The minibatch gradient uses control variates around the posterior mode
+theta_hat (Baker et al. 2019, Statistics and Computing 29, 599):
+
+    grad(theta) ~ grad(theta_hat) + grad_prior(theta) - grad_prior(theta_hat)
+                  + N / b sum_batch [grad_i(theta) - grad_i(theta_hat)]
+
+with grad(theta_hat) computed once over all rows. Near the mode the
+terms in brackets nearly cancel, so the gradient noise shrinks with the
+distance to the mode instead of growing with N.
+
+Sampling runs in coordinates whitened by the Laplace approximation,
+theta = theta_hat + L phi with L L^T the inverse Hessian at the mode, in
+which the posterior is close to normal(0, I), with either
+
+    SGLD:  phi <- phi + eps / 2 grad + sqrt(eps) xi
+    SGHMC: v <- (1 - alpha) v + eta grad + sqrt(2 alpha eta) xi,
+           phi <- phi + v
+
+(Welling & Teh 2011; Chen, Fox & Guestrin 2014), xi ~ normal(0, I). Both
+have no Metropolis correction: the draws are biased by O(eps) (O(eta))
+and by the gradient noise, which benchmark_batch_sizes in stan_benchmark
+measures against a full-data posterior.
+"""
+
+
+import numpy as np
+from scipy.special import expit
+
+from glm import BernoulliLogitGLM, _beta_prior
+
+
+class MinibatchLogit(BernoulliLogitGLM):
+    """
+    Logistic regression, y ~ bernoulli_logit(X beta), sampled by
+    stochastic-gradient MCMC with the 'numpy' backend of fit_runner.
+
+    input: X -> design matrix (N, p), numpy array or memmap
+           y -> array (N,) of 0/1 responses, numpy array or memmap
+           prior_sd -> sd of the normal priors on beta (default is 100)
+           chunk_size -> rows read at a time in full-data passes
+                         (default is 100000)
+    """
+
+    def __init__(self, X, y, prior_sd=100.0, chunk_size=100000):
+
+        # no np.asarray(X, dtype=float): that would copy a memmap
+        self.X = X
+        self.y = y
+        self.prior_sd = prior_sd
+        self.chunk_size = chunk_size
+        self.n_params = X.shape[1]
+        self.names = ['beta[' + str(k + 1) + ']' for k in range(self.n_params)]
+        self.mode = None
+
+    def _rows(self, idx):
+        """Rows idx (sorted, for sequential disk reads) as float arrays."""
+
+        return (np.asarray(self.X[idx], dtype=float),
+                np.asarray(self.y[idx], dtype=float))
+
+    def _full_pass(self, beta):
+        """
+        Log-likelihood, gradient and Hessian at beta, one chunk in memory
+        at a time.
+        """
+
+        p = self.n_params
+        lp, grad, hess = 0.0, np.zeros(p), np.zeros((p, p))
+        for start in range(0, self.X.shape[0], self.chunk_size):
+            X, y = self._rows(slice(start, start + self.chunk_size))
+            eta = np.dot(X, beta)
+            mu = expit(eta)
+            lp += np.sum(y * eta - np.logaddexp(0.0, eta))
+            grad += np.dot(y - mu, X)
+            hess -= np.dot(X.T * (mu * (1.0 - mu)), X)
+        return lp, grad, hess
+
+    def find_mode(self, n_iter=50, tol=1e-8):
+        """
+        Posterior mode by Newton's method over full-data passes; sets the
+        centre and scale of the control variates and of the whitened
+        coordinates.
+
+        input: n_iter -> maximum number of Newton steps (default is 50)
+               tol -> stop when the step is below tol (default is 1e-8)
+
+        output: the mode, array (p,)
+        """
+
+        p = self.n_params
+        prec0 = np.zeros((p, p)) if self.prior_sd is None else \
+            np.eye(p) / self.prior_sd ** 2
+        beta = np.zeros(p)
+        for _ in range(n_iter):
+            lp, grad, hess = self._full_pass(beta)
+            grad = grad + _beta_prior(beta, self.prior_sd)[1]
+            step = np.linalg.solve(prec0 - hess, grad)
+            beta = beta + step
+            if np.max(np.abs(step)) < tol:
+                break
+
+        lp, grad, hess = self._full_pass(beta)
+        prior, dprior = _beta_prior(beta, self.prior_sd)
+        self.mode = beta
+        self.mode_log_post = lp + prior
+        self.mode_grad = grad + dprior
+        self.mode_scale = np.linalg.cholesky(np.linalg.inv(prec0 - hess))
+        return beta
+
+    def _estimate(self, beta, X, y):
+        """
+        Control-variate estimates of the log-posterior and its gradient
+        at beta (n_chains, p), from the minibatches X (n_chains, b, p),
+        y (n_chains, b).
+        """
+
+        scale = self.X.shape[0] / float(y.shape[1])
+        eta = np.einsum('cbp,cp->cb', X, beta)
+        eta_hat = np.dot(X, self.mode)
+        prior, dprior = _beta_prior(beta, self.prior_sd)
+        prior_hat, dprior_hat = _beta_prior(self.mode, self.prior_sd)
+
+        lp = self.mode_log_post + prior - prior_hat + scale * np.sum(
+            y * (eta - eta_hat) - np.logaddexp(0.0, eta) +
+            np.logaddexp(0.0, eta_hat), axis=1)
+        grad = self.mode_grad + dprior - dprior_hat + scale * np.einsum(
+            'cb,cbp->cp', expit(eta_hat) - expit(eta), X)
+        return lp, grad
+
+    def sample_sgmcmc(self, n_samples, n_chains=1, n_warmup=0, seed=None,
+                      method='sghmc', batch_size=1000, step_size=None,
+                      friction=0.3):
+        """
+        Stochastic-gradient chains, run side by side, each reading its
+        own minibatches.
+
+        input: n_samples -> stored draws per chain
+               n_chains -> number of chains (default is 1)
+               n_warmup -> discarded iterations per chain (default is 0)
+               seed -> int, numpy.random.Generator or None
+               method -> 'sghmc' or 'sgld' (default is 'sghmc')
+               batch_size -> rows per gradient estimate (default is 1000)
+               step_size -> eps of SGLD or eta of SGHMC, in whitened
+                            coordinates (default is 0.2 for SGLD and
+                            0.09 for SGHMC)
+               friction -> alpha of SGHMC (default is 0.3)
+
+        output: dictionary with keywords
+                    chains -> array (n_chains, n_samples, p) of beta
+                    log_target -> array (n_chains, n_samples) of
+                                  minibatch (control-variate) estimates
+                                  of the log-posterior of the draws
+        """
+
+        if method not in ('sghmc', 'sgld'):
+            raise ValueError("method must be 'sghmc' or 'sgld'")
+        if step_size is None:
+            step_size = 0.2 if method == 'sgld' else 0.09
+        if self.mode is None:
+            self.find_mode()
+
+        rng = np.random.default_rng(seed)
+        n, p = self.X.shape[0], self.n_params
+        scale = self.mode_scale
+
+        # start from the Laplace approximation
+        phi = rng.standard_normal((n_chains, p))
+        v = np.zeros((n_chains, p))
+
+        chains = np.empty((n_chains, n_samples, p))
+        log_target = np.empty((n_chains, n_samples))
+        for it in range(n_warmup + n_samples):
+            idx = np.sort(rng.integers(0, n, (n_chains, batch_size)), axis=1)
+            X, y = self._rows(idx)
+            beta = self.mode + np.dot(phi, scale.T)
+            lp, grad = self._estimate(beta, X, y)
+            grad = np.dot(grad, scale)
+
+            if it >= n_warmup:
+                chains[:, it - n_warmup] = beta
+                log_target[:, it - n_warmup] = lp
+
+            noise = rng.standard_normal((n_chains, p))
+            if method == 'sgld':
+                phi = phi + 0.5 * step_size * grad + \
+                    np.sqrt(step_size) * noise
+            else:
+                v = (1.0 - friction) * v + step_size * grad + \
+                    np.sqrt(2.0 * friction * step_size) * noise
+                phi = phi + v
+
+        return {'chains': chains, 'log_target': log_target}
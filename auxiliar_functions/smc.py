@@ -0,0 +1,293 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Sequential Monte Carlo for the AR(1) sunspot model of
+Ex3_sunspot_time_series, updated as new observations arrive:
+
+    Y[1] ~ normal(Y[1], tau)
+    Y[t] ~ normal(phi[1] + phi[2] Y[t - 1], tau)
+    phi[k] ~ normal(0, prior_sd), tau ~ gamma(shape, rate)
+
+The posterior is held as M weighted particles (phi, tau) (iterated batch
+importance sampling, Chopin 2002). A new observation multiplies every
+weight by its one-step predictive density, in O(M). When the effective
+sample size (ESS) falls below ess_min * M the particles are resampled
+and rejuvenated by a few MCMC sweeps that leave the current posterior
+invariant: a Gibbs draw of phi given tau (a normal) and a random-walk
+Metropolis step on log tau. The data enter these sweeps only through the
+sufficient statistics of likelihoods.LinearGaussianLikelihood, so they
+cost O(M) too, however long the series is.
+
+The first posterior is reached from the prior by likelihood tempering,
+prior x likelihood^beta with beta going from 0 to 1 in steps chosen to
+keep the ESS at ess_min * M, with the same resampling and sweeps.
+
+If a path is given, the particles, weights, statistics, the series seen
+so far and the random number generator are saved atomically after every
+update, so each run of a monitoring job only pays for the new values. If
+earlier values of the series were revised, or the priors or number of
+particles changed, the sampler starts afresh.
+"""
+
+
+import os
+import pickle
+import tempfile
+
+import numpy as np
+from scipy.special import logsumexp
+
+from fit_runner import Posterior
+from likelihoods import LOG_2PI, LinearGaussianLikelihood
+
+
+STATE = ('y', 'phi', 'log_tau', 'logw', 'stats', 'log_evidence', 'rng')
+
+
+def _normalize(logw):
+    """Normalized weights and effective sample size of log-weights."""
+
+    w = np.exp(logw - logw.max())
+    w /= w.sum()
+    return w, 1.0 / np.dot(w, w)
+
+
+def _systematic_resample(w, rng):
+    """Indices of a systematic resampling of the normalized weights w."""
+
+    positions = (rng.random() + np.arange(w.size)) / w.size
+    return np.minimum(np.searchsorted(np.cumsum(w), positions), w.size - 1)
+
+
+def _next_temperature_step(loglik, max_step, ess_target, n_iter=60):
+    """
+    Largest increment of the tempering exponent, up to max_step, for
+    which the incremental weights keep an ESS of ess_target, found by
+    bisection.
+    """
+
+    if _normalize(max_step * loglik)[1] >= ess_target:
+        return max_step
+    low, high = 0.0, max_step
+    for _ in range(n_iter):
+        mid = 0.5 * (low + high)
+        if _normalize(mid * loglik)[1] >= ess_target:
+            low = mid
+        else:
+            high = mid
+    return high
+
+
+class SequentialAR1(object):
+    """
+    Particle approximation of the posterior of the AR(1) sunspot model,
+    updated one observation at a time.
+
+    input: path -> file of the saved sampler state (default is None: not
+                   saved); an existing state is loaded if its settings
+                   match
+           n_particles -> number of particles M (default is 4000)
+           prior_sd -> sd of the normal priors on phi (default is 100)
+           tau_prior -> (shape, rate) of the gamma prior on tau
+                        (default is (0.001, 0.001))
+           ess_min -> fraction of M below which the particles are
+                      resampled and rejuvenated (default is 0.5)
+           n_moves -> MCMC sweeps per rejuvenation (default is 5)
+           seed -> int, numpy.random.Generator or None, for a new sampler
+
+    attributes: y -> series absorbed so far
+                phi, log_tau, logw -> particles (M, 2), (M,) and their
+                                      log-weights (M,)
+                log_evidence -> log marginal likelihood of y
+    """
+
+    names = ['phi[1]', 'phi[2]', 'tau']
+
+    def __init__(self, path=None, n_particles=4000, prior_sd=100.0,
+                 tau_prior=(0.001, 0.001), ess_min=0.5, n_moves=5,
+                 seed=None):
+
+        self.path = path
+        self.settings = {'n_particles': int(n_particles),
+                         'prior_sd': float(prior_sd),
+                         'tau_prior': tuple(float(v) for v in tau_prior)}
+        self.ess_min = ess_min
+        self.n_moves = n_moves
+        self._reset(np.random.default_rng(seed))
+
+        state = self._read_state()
+        if state is not None and state['settings'] == self.settings:
+            for name in STATE:
+                setattr(self, name, state[name])
+
+    def _reset(self, rng):
+        self.y = np.empty(0)
+        self.phi = self.log_tau = self.logw = self.stats = None
+        self.log_evidence = 0.0
+        self.rng = rng
+
+    def _read_state(self):
+        if self.path is None:
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _write_state(self):
+        """Save the sampler state atomically."""
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        state = dict((name, getattr(self, name)) for name in STATE)
+        state['settings'] = self.settings
+        handle, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+    def _log_likelihood(self, phi, log_tau):
+        """Log-likelihood of the series absorbed so far, per particle."""
+
+        with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            tau = np.exp(log_tau)
+            lp = self.stats.log_likelihood(phi, tau) - log_tau - \
+                0.5 * LOG_2PI
+        return np.where(np.isnan(lp), -np.inf, lp)
+
+    def _move(self, beta):
+        """
+        Gibbs / Metropolis sweeps leaving prior x likelihood^beta
+        invariant, applied to every particle at once.
+        """
+
+        shape, rate = self.settings['tau_prior']
+        prec0 = np.eye(2) / self.settings['prior_sd'] ** 2
+        xtx, xty = self.stats.xtx, self.stats.xty
+        n = self.phi.shape[0]
+        step = max(self.log_tau.std(), 1e-3)
+
+        def log_target(phi, log_tau):
+            # gamma prior on tau, with the Jacobian of log tau
+            return shape * log_tau - rate * np.exp(log_tau) + \
+                beta * self._log_likelihood(phi, log_tau)
+
+        for _ in range(self.n_moves):
+            # phi | tau ~ normal(prec^-1 s X'y, prec^-1), prec = s X'X +
+            # prec0, with s = beta / tau^2
+            s = beta * np.exp(-2.0 * self.log_tau)
+            prec = s[:, None, None] * xtx + prec0
+            chol = np.linalg.cholesky(prec)
+            mean = np.linalg.solve(prec, (s[:, None] * xty)[..., None])
+            z = self.rng.standard_normal((n, 2, 1))
+            self.phi = (mean + np.linalg.solve(np.swapaxes(chol, 1, 2),
+                                               z))[..., 0]
+
+            # log tau | phi, random-walk Metropolis
+            current = log_target(self.phi, self.log_tau)
+            proposal = self.log_tau + step * self.rng.standard_normal(n)
+            accept = np.log(self.rng.random(n)) < \
+                log_target(self.phi, proposal) - current
+            self.log_tau = np.where(accept, proposal, self.log_tau)
+
+    def _resample_move(self, beta):
+        idx = _systematic_resample(_normalize(self.logw)[0], self.rng)
+        self.phi, self.log_tau = self.phi[idx], self.log_tau[idx]
+        self.logw = np.zeros(idx.size)
+        self._move(beta)
+
+    def _initialize(self, y):
+        """Temper from the prior to the posterior of the series y."""
+
+        if y.size < 3:
+            raise ValueError('at least 3 observations are needed to start')
+
+        n = self.settings['n_particles']
+        shape, rate = self.settings['tau_prior']
+        self.y = y
+        self.stats = LinearGaussianLikelihood(
+            np.column_stack([np.ones(y.size - 1), y[:-1]]), y[1:])
+
+        # prior draws; log tau = log(G U^(1 / shape) / rate), G ~
+        # gamma(shape + 1), does not underflow for small shapes
+        self.phi = self.settings['prior_sd'] * \
+            self.rng.standard_normal((n, 2))
+        self.log_tau = np.log(self.rng.gamma(shape + 1.0, size=n)) + \
+            np.log(self.rng.random(n)) / shape - np.log(rate)
+        self.logw = np.zeros(n)
+        self.log_evidence = 0.0
+
+        beta = 0.0
+        while beta < 1.0:
+            loglik = self._log_likelihood(self.phi, self.log_tau)
+            if not np.isfinite(loglik).any():
+                raise ValueError('no particle has a finite likelihood; '
+                                 'increase n_particles')
+            step = _next_temperature_step(loglik, 1.0 - beta,
+                                          self.ess_min * n)
+            self.logw = step * loglik
+            self.log_evidence += logsumexp(self.logw) - np.log(n)
+            beta = min(beta + step, 1.0)
+            self._resample_move(beta)
+
+    def update(self, y):
+        """
+        Bring the posterior up to date with the series y, absorbing only
+        the values not seen before (the whole series on the first call),
+        and save the state if a path was given.
+
+        input: y -> the whole series so far, array (N,)
+
+        output: self
+        """
+
+        y = np.asarray(y, dtype=float).ravel()
+        n_old = self.y.size
+        if self.phi is not None and \
+                (y.size < n_old or not np.array_equal(y[:n_old], self.y)):
+            # earlier values were revised
+            self._reset(self.rng)
+            n_old = 0
+
+        if self.phi is None:
+            self._initialize(y)
+        else:
+            ess_target = self.ess_min * self.logw.size
+            for t in range(n_old, y.size):
+                # weight by the one-step predictive density of y[t]
+                tau = np.exp(self.log_tau)
+                resid = (y[t] - self.phi[:, 0] - self.phi[:, 1] * y[t - 1]) \
+                    / tau
+                logw = self.logw - self.log_tau - 0.5 * (LOG_2PI +
+                                                         resid * resid)
+                self.log_evidence += logsumexp(logw) - logsumexp(self.logw)
+                self.logw = logw
+
+                self.stats.update([[1.0, y[t - 1]]], [y[t]])
+                if _normalize(self.logw)[1] < ess_target:
+                    self._resample_move(1.0)
+            self.y = y
+
+        if self.path is not None:
+            self._write_state()
+        return self
+
+    def ess(self):
+        """Effective sample size of the current weights."""
+
+        return _normalize(self.logw)[1]
+
+    def posterior(self):
+        """
+        Equally weighted resample of the particles.
+
+        output: fit_runner.Posterior with one chain of M draws of
+                (phi[1], phi[2], tau)
+        """
+
+        idx = _systematic_resample(_normalize(self.logw)[0], self.rng)
+        draws = np.column_stack([self.phi[idx], np.exp(self.log_tau[idx])])
+        return Posterior(self.names, draws[None], source=self)
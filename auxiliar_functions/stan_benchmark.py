@@ -0,0 +1,239 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Side-by-side timing of equivalent Stan programs, e.g. the element-wise
+loop version of a model against its vectorized rewrite, and of
+equivalent in-process models sampled with hmc.nuts. benchmark_batch_sizes
+measures instead the accuracy of stochastic-gradient MCMC
+(sgmcmc.MinibatchLogit) against a full-data posterior.
+
+Every program is compiled (through the model cache) before the clock
+starts and then sampled with the same data, seed and settings. For each
+one the benchmark reports
+
+    gradient evaluations per second: leapfrog steps of all chains,
+        warm-up included, divided by the sampling wall time;
+    ESS per second: smallest bulk ESS of the compared parameters divided
+        by the sampling wall time;
+    max |z|: largest difference of posterior means with respect to the
+        first (reference) program, in units of the combined Monte Carlo
+        standard error, so values below ~3 mean the posteriors agree.
+"""
+
+
+import time
+
+import numpy as np
+
+from diagnostics import bulk_ess
+from fit_runner import Posterior, run_fit
+
+
+def _moments(posterior, pars, elapsed, n_grad):
+    """Timings and posterior moments of the parameters pars."""
+
+    cols = posterior.columns(pars)
+    values = posterior.draws[:, :, cols]
+    ess = bulk_ess(values)
+
+    return {'time': elapsed,
+            'grad_per_s': n_grad / elapsed,
+            'ess_per_s': np.min(ess) / elapsed,
+            'min_ess': np.min(ess),
+            'names': [posterior.names[k] for k in cols],
+            'mean': values.mean(axis=(0, 1)),
+            'mcse': values.std(axis=(0, 1), ddof=1) / np.sqrt(ess)}
+
+
+def _time_program(model_code, data, pars, n_chains, n_warmup, n_samples,
+                  seed, kwargs):
+    """Sample one program and collect its timings and posterior moments."""
+
+    from stan_cache import load_stan_model
+
+    model = load_stan_model(model_code)
+
+    start = time.time()
+    fit = model.sampling(data=data, chains=n_chains,
+                         iter=n_warmup + n_samples, warmup=n_warmup,
+                         seed=seed, **kwargs)
+    elapsed = time.time() - start
+
+    n_grad = sum(np.sum(chain['n_leapfrog__'])
+                 for chain in fit.get_sampler_params(inc_warmup=True))
+
+    return _moments(Posterior.from_stan(fit), pars, elapsed, n_grad)
+
+
+def _compare(timed, verbose):
+    """Add max_z with respect to the first result and print the table."""
+
+    results = {}
+    reference = timed[0][1]
+    for label, res in timed:
+        res['max_z'] = np.max(np.abs(res['mean'] - reference['mean']) /
+                              np.hypot(res['mcse'], reference['mcse']))
+        results[label] = res
+
+    if verbose:
+        width = max(len(label) for label, _ in timed)
+        print('{:<{}} {:>9} {:>12} {:>9} {:>8} {:>7}'.format(
+            '', width, 'time [s]', 'grad evals/s', 'min ESS', 'ESS/s',
+            'max |z|'))
+        row = '{:<{}} {:>9.2f} {:>12.0f} {:>9.0f} {:>8.1f} {:>7.2f}'
+        for label, res in timed:
+            print(row.format(label, width, res['time'], res['grad_per_s'],
+                             res['min_ess'], res['ess_per_s'], res['max_z']))
+        for label, res in timed[1:]:
+            if res['grad_per_s'] and reference['grad_per_s']:
+                print('{}: {:.1f}x gradient evaluations/s, {:.1f}x '
+                      'ESS/s'.format(label, res['grad_per_s'] /
+                                     reference['grad_per_s'],
+                                     res['ess_per_s'] /
+                                     reference['ess_per_s']))
+            else:
+                # gradient-free samplers, e.g. Gibbs
+                print('{}: {:.1f}x ESS/s'.format(
+                    label, res['ess_per_s'] / reference['ess_per_s']))
+
+    return results
+
+
+def benchmark_stan(programs, data, pars, n_chains=4, n_warmup=1000,
+                   n_samples=1000, seed=1, verbose=True, **kwargs):
+    """
+    Time equivalent Stan programs and check that their posteriors match.
+
+    input: programs -> list of (label, Stan code) pairs; the first one is
+                       the reference for the comparison of posteriors
+           data -> data dictionary, valid for every program
+           pars -> names of the parameters compared (e.g. ['beta', 'sigma'])
+           n_chains -> number of chains (default is 4)
+           n_warmup -> warm-up iterations per chain (default is 1000)
+           n_samples -> stored draws per chain (default is 1000)
+           seed -> seed passed to pystan (default is 1)
+           verbose -> print a table of the results
+           other keywords are passed to StanModel.sampling (e.g. n_jobs)
+
+    output: dictionary {label: results}, each results a dictionary with
+            keywords time, grad_per_s, ess_per_s, min_ess, names, mean,
+            mcse and max_z
+    """
+
+    return _compare([(label, _time_program(code, data, pars, n_chains,
+                                           n_warmup, n_samples, seed,
+                                           kwargs))
+                     for label, code in programs], verbose)
+
+
+def benchmark_models(models, pars, n_chains=4, n_warmup=1000,
+                     n_samples=1000, seed=1, verbose=True, **kwargs):
+    """
+    Time equivalent in-process models (objects with log_density_grad, as
+    in glm, sampled with hmc.nuts, or with sample_gibbs, as
+    polya_gamma.PolyaGammaLogit) and check that their posteriors match.
+
+    input: models -> list of (label, model) pairs; the first one is the
+                     reference for the comparison of posteriors
+           pars -> names of the parameters compared, as in model.names
+           n_chains -> number of chains (default is 4)
+           n_warmup -> warm-up iterations per chain (default is 1000)
+           n_samples -> stored draws per chain (default is 1000)
+           seed -> root seed of hmc.nuts (default is 1)
+           verbose -> print a table of the results
+           other keywords are passed to hmc.nuts_chain (or sample_gibbs)
+
+    output: dictionary {label: results}, as benchmark_stan
+    """
+
+    timed = []
+    for label, model in models:
+        config = {'backend': 'numpy', 'model': model, 'n_chains': n_chains,
+                  'n_warmup': n_warmup, 'n_samples': n_samples,
+                  'seed': seed, 'options': kwargs}
+        start = time.time()
+        posterior = run_fit(config)
+        elapsed = time.time() - start
+        timed.append((label, _moments(posterior, pars, elapsed,
+                                      np.sum(posterior.source.get('n_grad',
+                                                                  0)))))
+
+    return _compare(timed, verbose)
+
+
+def benchmark_batch_sizes(model, reference, pars, batch_sizes=(100, 1000,
+                                                               10000),
+                          n_chains=4, n_warmup=500, n_samples=2000, seed=1,
+                          verbose=True, **kwargs):
+    """
+    Accuracy and speed of stochastic-gradient MCMC for several batch
+    sizes, against a posterior sampled with all the data.
+
+    input: model -> model with sample_sgmcmc, e.g. sgmcmc.MinibatchLogit
+           reference -> Posterior of the same model from a full-data
+                        sampler (Stan, NUTS, Polya-Gamma Gibbs)
+           pars -> names of the parameters compared
+           batch_sizes -> rows per gradient estimate
+                          (default is (100, 1000, 10000))
+           n_chains -> number of chains (default is 4)
+           n_warmup -> warm-up iterations per chain (default is 500)
+           n_samples -> stored draws per chain (default is 2000)
+           seed -> seed of the chains (default is 1)
+           verbose -> print a table of the results
+           other keywords are passed to sample_sgmcmc (method, step_size,
+           friction)
+
+    The posterior mode is found once, before the runs, and its time is
+    reported apart: the times of the runs only cover sampling.
+
+    output: dictionary {batch size: results}, with the keywords of
+            benchmark_stan and
+                mean_error -> largest |mean - reference mean|, in units of
+                              the reference posterior sd
+                sd_error -> largest |sd / reference sd - 1|
+    """
+
+    ref = _moments(reference, pars, 1.0, 0)
+    ref_values = reference.draws[:, :, reference.columns(pars)]
+    ref_sd = ref_values.std(axis=(0, 1), ddof=1)
+
+    # the mode is shared by all batch sizes: find it once, outside the
+    # timed runs
+    start = time.time()
+    if model.mode is None:
+        model.find_mode()
+    mode_time = time.time() - start
+
+    results = {}
+    for batch_size in batch_sizes:
+        options = dict(kwargs, batch_size=batch_size)
+        config = {'backend': 'numpy', 'model': model, 'n_chains': n_chains,
+                  'n_warmup': n_warmup, 'n_samples': n_samples,
+                  'seed': seed, 'options': options}
+        start = time.time()
+        posterior = run_fit(config)
+        res = _moments(posterior, pars, time.time() - start, 0)
+
+        values = posterior.draws[:, :, posterior.columns(pars)]
+        res['max_z'] = np.max(np.abs(res['mean'] - ref['mean']) /
+                              np.hypot(res['mcse'], ref['mcse']))
+        res['mean_error'] = np.max(np.abs(res['mean'] - ref['mean']) /
+                                   ref_sd)
+        res['sd_error'] = np.max(np.abs(values.std(axis=(0, 1), ddof=1) /
+                                        ref_sd - 1.0))
+        results[batch_size] = res
+
+    if verbose:
+        print('posterior mode (full-data passes, once): '
+              '{:.2f} s'.format(mode_time))
+        print('{:>10} {:>9} {:>9} {:>8} {:>10} {:>8} {:>7}'.format(
+            'batch', 'time [s]', 'min ESS', 'ESS/s', 'mean err', 'sd err',
+            'max |z|'))
+        row = '{:>10} {:>9.2f} {:>9.0f} {:>8.1f} {:>10.3f} {:>8.3f} {:>7.2f}'
+        for batch_size in batch_sizes:
+            res = results[batch_size]
+            print(row.format(batch_size, res['time'], res['min_ess'],
+                             res['ess_per_s'], res['mean_error'],
+                             res['sd_error'], res['max_z']))
+
+    return results
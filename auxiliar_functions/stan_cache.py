@@ -0,0 +1,154 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+On-disk cache of compiled pystan models.
+
+pystan.stan(model_code=...) compiles the C++ model on every run. Here
+the model is looked up by a hash of its source and of everything that
+affects the compiled object (compiler settings, pystan and Python
+versions, platform); a pickled StanModel is reused when found and
+compiled and stored otherwise. The cache directory is kept under a size
+cap by removing the least recently used models.
+
+The cache lives in $STAN_MODEL_CACHE if set, else in
+~/.cache/bayes_estec/stan.
+"""
+
+
+import hashlib
+import os
+import pickle
+import platform
+import sys
+import tempfile
+
+import pystan
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'bayes_estec', 'stan')
+
+DEFAULT_MAX_SIZE = 2 * 2 ** 30               # 2 GB
+
+
+def cache_dir():
+    """Directory of the model cache."""
+
+    return os.environ.get('STAN_MODEL_CACHE', DEFAULT_CACHE_DIR)
+
+
+def model_key(model_code, **compile_kwargs):
+    """
+    Hash identifying a compiled model.
+
+    Line endings and trailing white space of the source are normalised,
+    so cosmetic edits do not trigger a recompilation.
+
+    input: model_code -> Stan program
+           compile_kwargs -> keywords passed to pystan.StanModel
+
+    output: hexadecimal string
+    """
+
+    source = '\n'.join(line.rstrip() for line in model_code.splitlines())
+    settings = sorted((k, repr(v)) for k, v in compile_kwargs.items())
+
+    h = hashlib.sha256()
+    for item in (source, repr(settings), pystan.__version__, sys.version,
+                 platform.platform()):
+        h.update(item.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _evict(directory, max_size, keep):
+    """Remove least recently used models until the cache fits max_size."""
+
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.pkl'):
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def load_stan_model(model_code, directory=None, max_size=DEFAULT_MAX_SIZE,
+                    verbose=False, **compile_kwargs):
+    """
+    Compiled pystan model for model_code, from the cache when possible.
+
+    input: model_code -> Stan program
+           directory -> cache directory (default is cache_dir())
+           max_size -> size cap of the cache in bytes (default is 2 GB)
+           verbose -> print whether the model was found in the cache
+           compile_kwargs -> keywords passed to pystan.StanModel
+
+    output: pystan.StanModel
+    """
+
+    if directory is None:
+        directory = cache_dir()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    path = os.path.join(directory,
+                        model_key(model_code, **compile_kwargs) + '.pkl')
+
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                model = pickle.load(f)
+            os.utime(path, None)              # mark as recently used
+            if verbose:
+                print('Stan model loaded from cache: ' + path)
+            return model
+        except Exception:
+            # unreadable entry (e.g. interrupted write): compile again
+            os.remove(path)
+
+    model = pystan.StanModel(model_code=model_code, **compile_kwargs)
+
+    # write to a temporary file first so concurrent jobs never read
+    # a partial pickle
+    handle, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'wb') as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    if verbose:
+        print('Stan model compiled and cached: ' + path)
+
+    _evict(directory, max_size, keep=path)
+    return model
+
+
+def stan(model_code, data=None, compile_kwargs=None, **kwargs):
+    """
+    Drop-in replacement for pystan.stan(model_code=..., data=..., ...)
+    that compiles through the model cache.
+
+    input: model_code -> Stan program
+           data -> data dictionary
+           compile_kwargs -> dictionary of keywords for pystan.StanModel
+           other keywords are passed to StanModel.sampling
+                 (iter, chains, warmup, thin, n_jobs, ...)
+
+    output: pystan fit object
+    """
+
+    model = load_stan_model(model_code, **(compile_kwargs or {}))
+    return model.sampling(data=data, **kwargs)
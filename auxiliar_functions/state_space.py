@@ -0,0 +1,366 @@
+"""
+ESTEC Bayesian course - shared Python helpers.
+
+Scalar linear-Gaussian state-space models: an AR(1) (or random walk)
+latent process observed with Gaussian noise,
+
+    x_1 ~ normal(m0, sqrt(p0))      (p0: steady-state variance by default)
+    x_t = c + phi x_{t-1} + tau w_t,       w_t ~ normal(0, 1)
+    y_t = x_t + sigma v_t,                 v_t ~ normal(0, 1)
+
+The random walk of Day_2/Normal/Random_Walk.R is c = 0, phi = 1, and the
+AR(1) of Ex3_sunspot_time_series is the limit sigma -> 0.
+
+The latent states are integrated out by a Kalman filter, which returns
+the exact marginal likelihood of (c, phi, tau, sigma) and, by carrying
+the derivatives of the filter recursions along, its gradient, in O(N).
+Only these few hyperparameters are sampled (e.g. with hmc.nuts); the
+latent path is drawn afterwards, for any number of hyperparameter draws
+at once, by forward filtering, backward sampling (FFBS).
+
+All functions take the hyperparameters as arrays of m values and run the
+m filters side by side; missing observations are given as NaN.
+"""
+
+
+import numpy as np
+from scipy.signal import lfilter
+
+from likelihoods import LOG_2PI
+
+
+def _initial_mean(y, m0):
+    """Default prior mean of x_1: the first observation."""
+
+    if m0 is None:
+        m0 = y[np.isfinite(y)][0]
+    return float(m0)
+
+
+def _steady_variance(phi, q, r, grad=False):
+    """
+    Fixed point of the predicted variance, P = phi^2 P r / (P + r) + q,
+    i.e. the positive root of P^2 + b P - q r with b = r (1 - phi^2) - q,
+    and its derivatives with respect to (c, phi, log tau, log sigma).
+    """
+
+    b = r * (1.0 - phi * phi) - q
+    root = np.sqrt(b * b + 4.0 * q * r)
+    p = 0.5 * (root - b)
+    if not grad:
+        return p, None
+
+    # implicit differentiation: (2 P + b) dP = -(P db - d(q r))
+    db = np.zeros(p.shape + (4,))
+    db[:, 1] = -2.0 * phi * r
+    db[:, 2] = -2.0 * q
+    db[:, 3] = 2.0 * r * (1.0 - phi * phi)
+    dqr = np.zeros(p.shape + (4,))
+    dqr[:, 2:] = 2.0 * (q * r)[:, None]
+    return p, (dqr - p[:, None] * db) / root[:, None]
+
+
+def _steady_segment(y, out, t0, t1, c, phi, r, a_var, da_var, dr, mean,
+                    dmean):
+    """
+    Filter the complete stretch y[t0:t1] once the predicted variance has
+    converged: the gain is then constant and the filtered means follow a
+    first-order linear recursion, run with scipy.signal.lfilter instead
+    of a Python loop.
+
+    output: filtered mean, variance and, if dmean is not None, their
+            derivatives at t1 - 1
+    """
+
+    y_seg = y[t0:t1]
+    n_seg = t1 - t0
+    f = a_var + r
+    k = a_var / f
+    g = (1.0 - k) * phi
+    grad = dmean is not None
+    if grad:
+        df = da_var + dr
+        dk = (da_var - k[:, None] * df) / f[:, None]
+        dmean_end = np.empty_like(dmean)
+
+    for j in range(c.shape[0]):
+        # mean_t = g_j mean_{t-1} + (1 - k_j) c_j + k_j y_t
+        filtered = lfilter([1.0], [1.0, -g[j]],
+                           (1.0 - k[j]) * c[j] + k[j] * y_seg,
+                           zi=[g[j] * mean[j]])[0]
+        previous = np.concatenate([[mean[j]], filtered[:-1]])
+        v = y_seg - c[j] - phi[j] * previous
+
+        out['log_lik'][j] -= 0.5 * (n_seg * (LOG_2PI + np.log(f[j])) +
+                                    np.dot(v, v) / f[j])
+        out['mean'][t0:t1, j] = filtered
+        out['pred_mean'][t0:t1, j] = y_seg - v
+
+        if grad:
+            # da_t = d(c + phi mean_{t-1}), dmean_t = (1 - k) da_t + dk v_t
+            direct = np.zeros((4, n_seg))
+            direct[0] = 1.0
+            direct[1] = previous
+            dfiltered = lfilter([1.0], [1.0, -g[j]],
+                                (1.0 - k[j]) * direct + dk[j][:, None] * v,
+                                axis=1, zi=g[j] * dmean[j][:, None])[0]
+            dprevious = np.concatenate([dmean[j][:, None],
+                                        dfiltered[:, :-1]], axis=1)
+            da = direct + phi[j] * dprevious
+            out['grad'][j] -= 0.5 * (df[j] * (n_seg - np.dot(v, v) / f[j]) -
+                                     2.0 * np.dot(da, v)) / f[j]
+            dmean_end[j] = dfiltered[:, -1]
+
+    out['pred_var'][t0:t1] = a_var
+    out['var'][t0:t1] = k * r
+
+    if not grad:
+        return out['mean'][t1 - 1], k * r, None, None
+    return (out['mean'][t1 - 1], k * r, dmean_end,
+            dk * r[:, None] + k[:, None] * dr)
+
+
+def kalman_filter(y, c, phi, tau, sigma, m0=None, p0=None, grad=False,
+                  tol=1e-10):
+    """
+    Kalman filter of the AR(1) plus noise model.
+
+    Once the predicted variance (and its gradient) stops changing, every
+    stretch of consecutive observations is filtered in closed form (see
+    _steady_segment) instead of step by step, so the cost of a long
+    series is dominated by a few vectorized passes.
+
+    input: y -> observations, array (N,), NaN where missing
+           c, phi, tau, sigma -> hyperparameters, scalars or arrays (m,)
+           m0, p0 -> mean and variance of x_1 (default is the first
+                     observation and the steady-state predicted
+                     variance, with which the whole series after the
+                     first observation is filtered in closed form)
+           grad -> also return the gradient of the log-likelihood with
+                   respect to (c, phi, log tau, log sigma)
+           tol -> relative change of the predicted variance below which
+                  it is taken as converged (default is 1e-10)
+
+    output: dictionary with keywords
+                log_lik -> array (m,) of log-likelihoods
+                grad -> array (m, 4) (only if grad is True)
+                mean, var -> arrays (N, m) of filtered means and variances
+                pred_mean, pred_var -> arrays (N, m) of one-step-ahead
+                                       predicted means and variances
+    """
+
+    y = np.asarray(y, dtype=float)
+    m0 = _initial_mean(y, m0)
+    c, phi, tau, sigma = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(v, dtype=float))
+          for v in (c, phi, tau, sigma)])
+    q, r = tau * tau, sigma * sigma
+    n, m = y.shape[0], c.shape[0]
+
+    out = {'log_lik': np.zeros(m),
+           'mean': np.empty((n, m)), 'var': np.empty((n, m)),
+           'pred_mean': np.empty((n, m)), 'pred_var': np.empty((n, m))}
+
+    # end of the stretch of observations starting at every t
+    observed = np.isfinite(y)
+    missing = np.append(np.flatnonzero(~observed), n)
+    stretch_end = missing[np.searchsorted(missing, np.arange(n))].tolist()
+
+    a = np.full(m, m0)
+    if p0 is None:
+        p, dp = _steady_variance(phi, q, r, grad)
+    else:
+        p, dp = np.full(m, float(p0)), None
+        if grad:
+            dp = np.zeros((m, 4))
+    da = dr = dmean = None
+    if grad:
+        # derivatives with respect to (c, phi, log tau, log sigma)
+        da = np.zeros((m, 4))
+        dr = np.zeros((m, 4))
+        dr[:, 3] = 2.0 * r
+        out['grad'] = np.zeros((m, 4))
+
+    t = 0
+    while t < n:
+        if t > 0:
+            # predict: a = c + phi m, p = phi^2 C + q
+            p_last, dp_last = p, dp
+            if grad:
+                da = phi[:, None] * dmean
+                da[:, 0] += 1.0
+                da[:, 1] += mean
+                dp = phi[:, None] ** 2 * dvar
+                dp[:, 1] += 2.0 * phi * var
+                dp[:, 2] += 2.0 * q
+            a = c + phi * mean
+            p = phi * phi * var + q
+
+            # converged if the last observed step left p unchanged
+            end = stretch_end[t]
+            if end > t + 1 and observed[t - 1] and \
+                    (np.abs(p - p_last) <= tol * p).all() and \
+                    (not grad or (np.abs(dp - dp_last) <=
+                                  tol * (np.abs(dp) + p[:, None])).all()):
+                mean, var, dmean, dvar = _steady_segment(
+                    y, out, t, end, c, phi, r, p, dp, dr, mean, dmean)
+                t = end
+                continue
+
+        out['pred_mean'][t] = a
+        out['pred_var'][t] = p
+
+        if observed[t]:
+            v = y[t] - a
+            f = p + r
+            k = p / f
+            out['log_lik'] -= 0.5 * (LOG_2PI + np.log(f) + v * v / f)
+            mean = a + k * v
+            var = k * r
+            if grad:
+                df = dp + dr
+                dk = (dp - k[:, None] * df) / f[:, None]
+                out['grad'] -= 0.5 * (df * (1.0 - v * v / f)[:, None] -
+                                      2.0 * v[:, None] * da) / f[:, None]
+                dmean = da + dk * v[:, None] - k[:, None] * da
+                dvar = dk * r[:, None] + k[:, None] * dr
+        else:
+            mean, var = a, p
+            if grad:
+                dmean, dvar = da, dp
+
+        out['mean'][t] = mean
+        out['var'][t] = var
+        t += 1
+
+    return out
+
+
+def ffbs(y, c, phi, tau, sigma, m0=None, p0=None, seed=None):
+    """
+    Draw latent paths by forward filtering, backward sampling, one path
+    per hyperparameter value.
+
+    input: y -> observations, array (N,), NaN where missing
+           c, phi, tau, sigma -> hyperparameters, scalars or arrays (m,),
+                                 e.g. posterior draws
+           m0, p0 -> mean and variance of x_1 (see kalman_filter)
+           seed -> int, numpy.random.Generator or None
+
+    output: array (m, N) of latent paths
+    """
+
+    rng = np.random.default_rng(seed)
+    kf = kalman_filter(y, c, phi, tau, sigma, m0, p0)
+    phi = np.broadcast_to(np.asarray(phi, dtype=float),
+                          kf['log_lik'].shape)
+    n, m = kf['mean'].shape
+
+    z = rng.standard_normal((n, m))
+    x = np.empty((n, m))
+    x[-1] = kf['mean'][-1] + np.sqrt(kf['var'][-1]) * z[-1]
+    for t in range(n - 2, -1, -1):
+        # x_t | x_{t+1} ~ normal(m_t + J (x_{t+1} - a_{t+1}),
+        #                      C_t - J phi C_t), J = phi C_t / P_{t+1}
+        gain = phi * kf['var'][t] / kf['pred_var'][t + 1]
+        mean = kf['mean'][t] + gain * (x[t + 1] - kf['pred_mean'][t + 1])
+        var = np.maximum(kf['var'][t] - gain * phi * kf['var'][t], 0.0)
+        x[t] = mean + np.sqrt(var) * z[t]
+
+    return x.T
+
+
+class StateSpaceModel(object):
+    """
+    Marginal posterior of the hyperparameters of the AR(1) plus noise
+    model, for hmc.nuts (see glm for the log_density_grad / constrain /
+    initial_point interface).
+
+    theta = (c, phi, log tau, log sigma), or (log tau, log sigma) for a
+    random walk. Priors: c, phi ~ normal(0, prior_sd); tau and sigma ~
+    gamma(scale_prior) (shape, rate), as the gamma(0.001, 0.001) prior
+    of tau in Ex3_sunspot_time_series.
+
+    input: y -> observations, array (N,), NaN where missing
+           random_walk -> fix c = 0 and phi = 1 (default is False)
+           prior_sd -> sd of the normal priors on c and phi (default 100)
+           scale_prior -> (shape, rate) of the gamma priors on tau and
+                          sigma (default is (0.001, 0.001))
+           m0, p0 -> mean and variance of x_1 (see kalman_filter)
+    """
+
+    def __init__(self, y, random_walk=False, prior_sd=100.0,
+                 scale_prior=(0.001, 0.001), m0=None, p0=None):
+
+        self.y = np.asarray(y, dtype=float)
+        self.random_walk = random_walk
+        self.prior_sd = prior_sd
+        self.scale_prior = scale_prior
+        self.m0, self.p0 = _initial_mean(self.y, m0), p0
+
+        self.names = ['tau', 'sigma']
+        if not random_walk:
+            self.names = ['phi[1]', 'phi[2]'] + self.names
+        self.n_params = len(self.names)
+
+    def hyperparameters(self, draws):
+        """(c, phi, tau, sigma) from constrained draws (..., n_params)."""
+
+        draws = np.asarray(draws, dtype=float)
+        if self.random_walk:
+            zero = np.zeros(draws.shape[:-1])
+            return zero, zero + 1.0, draws[..., 0], draws[..., 1]
+        return draws[..., 0], draws[..., 1], draws[..., 2], draws[..., 3]
+
+    def log_density_grad(self, theta):
+        theta = np.asarray(theta, dtype=float)
+        flat = theta.reshape(-1, self.n_params)
+        log_scale = flat[:, -2:]
+        scale = np.exp(log_scale)
+
+        if self.random_walk:
+            c, phi = 0.0, 1.0
+        else:
+            c, phi = flat[:, 0], flat[:, 1]
+        kf = kalman_filter(self.y, c, phi, scale[:, 0], scale[:, 1],
+                           self.m0, self.p0, grad=True)
+
+        # gamma(shape, rate) on the scales, with the log-Jacobian
+        shape, rate = self.scale_prior
+        lp = kf['log_lik'] + (shape * log_scale - rate * scale).sum(axis=1)
+        grad = kf['grad'] + 0.0
+        grad[:, 2:] += shape - rate * scale
+        if self.random_walk:
+            grad = grad[:, 2:]
+        else:
+            prec = 1.0 / (self.prior_sd * self.prior_sd)
+            lp -= 0.5 * prec * (flat[:, :2] ** 2).sum(axis=1)
+            grad[:, :2] -= prec * flat[:, :2]
+
+        return lp.reshape(theta.shape[:-1]), grad.reshape(theta.shape)
+
+    def constrain(self, theta):
+        out = np.array(theta, dtype=float)
+        out[..., -2:] = np.exp(out[..., -2:])
+        return out
+
+    def initial_point(self):
+        scale = np.log(np.nanstd(np.diff(self.y)))
+        if self.random_walk:
+            return np.array([scale, scale])
+        return np.array([0.0, 0.5, scale, scale])
+
+    def sample_states(self, draws, seed=None):
+        """
+        Latent paths for constrained hyperparameter draws.
+
+        input: draws -> array (..., n_params), e.g. Posterior.draws columns
+               seed -> int, numpy.random.Generator or None
+
+        output: array (..., N) of latent paths, one per draw
+        """
+
+        draws = np.asarray(draws, dtype=float)
+        hyper = [np.ravel(v) for v in self.hyperparameters(draws)]
+        paths = ffbs(self.y, *hyper, m0=self.m0, p0=self.p0, seed=seed)
+        return paths.reshape(draws.shape[:-1] + (self.y.shape[0],))